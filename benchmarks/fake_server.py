@@ -0,0 +1,440 @@
+# Copyright 2013 Spanish National Research Council (CSIC)
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""
+Local, in-process, stand-in for an OCCI server.
+
+It serves the query interface (/-/), the compute collection (/compute/) and
+the compute resources (/compute/<id>) in the JSON, text/occi, text/plain and
+text/uri-list renderings, with a configurable amount of resources, latency
+and error injection. It can also require a Keystone token, announcing
+Keystone through the WWW-Authenticate header as the VOMS endpoints do.
+
+Usage: python benchmarks/fake_server.py [--port PORT] [--count N] ...
+"""
+
+import argparse
+import BaseHTTPServer
+import random
+import socket
+import SocketServer
+import sys
+import threading
+import time
+import urlparse
+
+try:
+    import json
+except ImportError:
+    import simplejson as json
+
+import occi_payloads
+
+RENDERINGS = ("application/occi+json", "text/occi", "text/plain",
+              "text/uri-list")
+
+CAPABILITIES = [
+    {
+        "scheme": occi_payloads.INFRA,
+        "term": "compute",
+        "class": "kind",
+        "title": "Compute Resource",
+        "location": "/compute/",
+        "related": ["http://schemas.ogf.org/occi/core#resource"],
+    },
+    {
+        "scheme": "http://schemas.ogf.org/occi/infrastructure/compute/"
+                  "action#",
+        "term": "start",
+        "class": "action",
+        "title": "Start the compute resource",
+    },
+    {
+        "scheme": "http://example.org/occi/resource_tpl#",
+        "term": "m1.small",
+        "class": "mixin",
+        "title": "Flavor: m1.small",
+        "location": "/m1.small/",
+        "related": [occi_payloads.INFRA + "resource_tpl"],
+    },
+] + [
+    {
+        "scheme": "http://example.org/occi/os_tpl#",
+        "term": "image-%d" % i,
+        "class": "mixin",
+        "title": "Image %d" % i,
+        "location": "/image-%d/" % i,
+        "related": [occi_payloads.INFRA + "os_tpl"],
+    } for i in range(10)
+]
+
+
+def negotiate(accept):
+    """Choose the rendering for an Accept header."""
+    best, best_q = RENDERINGS[0], 0.0
+    for item in (accept or "").split(","):
+        params = item.split(";")
+        media_type = params[0].strip()
+        q = 1.0
+        for param in params[1:]:
+            key, _sep, value = param.strip().partition("=")
+            if key == "q":
+                q = float(value)
+        if media_type in ("*/*", "application/json"):
+            media_type = RENDERINGS[0]
+        if media_type in RENDERINGS and q > best_q:
+            best, best_q = media_type, q
+    return best
+
+
+def _quote(value):
+    return '"%s"' % value
+
+
+def _category_fields(category, with_location=True):
+    rendered = "%s; scheme=%s; class=%s" % (
+        category["term"], _quote(category["scheme"]),
+        _quote(category.get("class", "mixin")))
+    if "title" in category:
+        rendered += "; title=%s" % _quote(category["title"])
+    if category.get("related"):
+        rendered += "; rel=%s" % _quote(" ".join(category["related"]))
+    if with_location and "location" in category:
+        rendered += "; location=%s" % _quote(category["location"])
+    return rendered
+
+
+def resource_fields(resource):
+    """Return the text rendering of a resource as (header, value) pairs."""
+    fields = [("Category", _category_fields(dict(resource["kind"],
+                                                 **{"class": "kind"})))]
+    for mixin in resource["mixins"]:
+        fields.append(("Category", _category_fields(mixin)))
+    for link in resource["links"]:
+        attrs = "; ".join("%s=%s" % (k, _quote(v))
+                          for k, v in sorted(link["attributes"].items()))
+        fields.append(("Link", "<%s>; rel=%s; category=%s; %s" % (
+            link["target"], _quote(occi_payloads.INFRA + "network"),
+            _quote(link["kind"]["scheme"] + link["kind"]["term"]), attrs)))
+    for key, value in sorted(resource["attributes"].items()):
+        if isinstance(value, basestring):
+            value = _quote(value)
+        fields.append(("X-OCCI-Attribute", "%s=%s" % (key, value)))
+    return fields
+
+
+def parse_filters(headers):
+    """Parse the OCCI collection filters of a request.
+
+    Returns the attributes (as strings) and category terms the resources
+    must have.
+    """
+    attributes = {}
+    for item in (headers.get("x-occi-attribute") or "").split(","):
+        key, sep, value = item.strip().partition("=")
+        if sep:
+            attributes[key] = value.strip('"')
+    terms = [item.split(";", 1)[0].strip()
+             for item in (headers.get("category") or "").split(",")
+             if item.strip()]
+    return attributes, terms
+
+
+def matches(resource, attributes, terms):
+    for key, value in attributes.items():
+        if "%s" % resource["attributes"].get(key) != value:
+            return False
+    resource_terms = [resource["kind"]["term"]]
+    resource_terms.extend(m["term"] for m in resource["mixins"])
+    return all(term in resource_terms for term in terms)
+
+
+class Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    @property
+    def config(self):
+        return self.server.config
+
+    def _send(self, status, body="", content_type="text/plain",
+              headers=()):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for header in headers:
+            self.send_header(*header)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_chunked(self, chunks, content_type):
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        for chunk in chunks:
+            if chunk:
+                self.wfile.write("%x\r\n%s\r\n" % (len(chunk), chunk))
+        self.wfile.write("0\r\n\r\n")
+
+    def _send_fields(self, fields, rendering):
+        if rendering == "text/occi":
+            self._send(200, "OK", "text/occi", fields)
+        else:
+            body = "".join("%s: %s\n" % field for field in fields)
+            self._send(200, body, "text/plain")
+
+    def _location(self, i):
+        return "%s/compute/%s" % (self.server.url, occi_payloads.compute_id(i))
+
+    def _check(self):
+        """Apply latency, errors and authentication. False if answered."""
+        self.server.count_request(self.command, self.path)
+        if self.config["latency"]:
+            time.sleep(self.config["latency"])
+
+        if random.random() < self.config["error_rate"]:
+            self._send(503, headers=[("Retry-After", "0")])
+            return False
+
+        if (self.config["auth"] and
+                self.headers.get("x-auth-token") != self.server.token):
+            self._send(401, headers=[(
+                "WWW-Authenticate",
+                "Keystone uri='%s/'" % self.server.url)])
+            return False
+        return True
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("content-length", 0)))
+        if self.path.rstrip("/") == "/v2.0/tokens":
+            self.server.count_request(self.command, self.path)
+            token = {
+                "id": self.server.token,
+                "expires": time.strftime(
+                    "%Y-%m-%dT%H:%M:%SZ", time.gmtime(time.time() + 3600)),
+            }
+            self._send(200, json.dumps({"access": {"token": token}}),
+                       "application/json")
+            return
+        if not self._check():
+            return
+
+        if self.path.rstrip("/") == "/compute":
+            location = self._location(self.config["count"])
+            self._send(201, "X-OCCI-Location: %s\n" % location, "text/plain",
+                       [("Location", location)])
+        elif "?action=" in self.path and body is not None:
+            self._send(200)
+        else:
+            self._send(404, "Not found")
+
+    def do_DELETE(self):
+        if self._check():
+            self._send(200)
+
+    def do_GET(self):
+        if not self._check():
+            return
+
+        rendering = negotiate(self.headers.get("accept"))
+        path = urlparse.urlparse(self.path).path
+        if path in ("", "/", "/-/", "/.well-known/org/ogf/occi/-/"):
+            self._get_capabilities(rendering)
+        elif path.rstrip("/") == "/compute":
+            self._get_collection(rendering)
+        elif path.startswith("/compute/"):
+            i = occi_payloads.compute_index(path.split("/")[2])
+            if i is None or i >= self.config["count"]:
+                self._send(404, json.dumps({"itemNotFound": {
+                    "message": "Instance not found"}}), "application/json")
+            else:
+                self._get_resource(i, rendering)
+        else:
+            self._send(404, "Not found")
+
+    def _get_capabilities(self, rendering):
+        if rendering == "application/occi+json":
+            self._send(200, json.dumps(CAPABILITIES), rendering)
+        else:
+            self._send_fields([("Category", _category_fields(c))
+                               for c in CAPABILITIES], rendering)
+
+    def _indexes(self):
+        count = self.config["count"]
+        attributes, terms = parse_filters(self.headers)
+        if not (self.config["server_filters"] and (attributes or terms)):
+            return xrange(count)
+        return (i for i in xrange(count)
+                if matches(self._compute(i), attributes, terms))
+
+    def _get_collection(self, rendering):
+        indexes = self._indexes()
+        if rendering == "text/uri-list":
+            self._send_chunked(("%s\n" % self._location(i)
+                                for i in indexes), rendering)
+        elif rendering == "text/plain":
+            self._send_chunked(("X-OCCI-Location: %s\n" % self._location(i)
+                                for i in indexes), rendering)
+        elif rendering == "text/occi":
+            self._send(200, "OK", rendering, [
+                ("X-OCCI-Location", self._location(i))
+                for i in indexes])
+        else:
+            if self.config["full_listing"]:
+                resource = self._compute
+            else:
+                def resource(i):
+                    return {"attributes": {
+                        "occi.core.id": occi_payloads.compute_id(i)}}
+
+            def chunks():
+                yield "["
+                for n, i in enumerate(indexes):
+                    yield (n and "," or "") + json.dumps(resource(i))
+                yield "]"
+            self._send_chunked(chunks(), rendering)
+
+    def _state_shift(self):
+        if self.config["state_period"]:
+            return int(time.time() / self.config["state_period"])
+        return 0
+
+    def _compute(self, i):
+        return occi_payloads.compute(i, self._state_shift())
+
+    def _get_resource(self, i, rendering):
+        resource = self._compute(i)
+        if rendering in ("application/occi+json", "text/uri-list"):
+            # The resource only changes with its state
+            etag = '"%d-%d"' % (i, self._state_shift() % 3)
+            if self.headers.get("if-none-match") == etag:
+                self._send(304, headers=[("ETag", etag)])
+            else:
+                self._send(200, json.dumps(resource),
+                           "application/occi+json", [("ETag", etag)])
+        else:
+            self._send_fields(resource_fields(resource), rendering)
+
+
+class FakeOCCIServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    """A fake OCCI endpoint, serving from a background thread.
+
+    count is the amount of compute resources, latency the seconds each
+    request takes, error_rate the fraction of requests failing with a 503
+    and auth whether a Keystone token is required. If full_listing is True
+    the JSON collection contains the whole resources, otherwise only their
+    IDs. If state_period is set, the state of the resources changes every
+    state_period seconds. If server_filters is True the collection is
+    filtered with the Category and X-OCCI-Attribute request headers.
+    """
+
+    daemon_threads = True
+    allow_reuse_address = True
+    # The default backlog (5) overflows with concurrent
+    # clients, and the retransmitted SYNs would add ~1s to the timings.
+    request_queue_size = 128
+
+    def __init__(self, count=10, latency=0, error_rate=0, auth=False,
+                 full_listing=False, state_period=None, server_filters=False,
+                 host="127.0.0.1", port=0):
+        BaseHTTPServer.HTTPServer.__init__(self, (host, port), Handler)
+        self.config = {
+            "count": count,
+            "latency": latency,
+            "error_rate": error_rate,
+            "auth": auth,
+            "full_listing": full_listing,
+            "state_period": state_period,
+            "server_filters": server_filters,
+        }
+        self.token = "fake-token"
+        self.url = "http://%s:%d" % self.server_address
+        self.requests = {}
+        self._lock = threading.Lock()
+        self._thread = None
+        self._connections = {}
+
+    def count_request(self, method, path):
+        with self._lock:
+            self.requests[method] = self.requests.get(method, 0) + 1
+
+    def reset_counters(self):
+        with self._lock:
+            self.requests = {}
+
+    def process_request_thread(self, request, client_address):
+        with self._lock:
+            self._connections[request] = threading.current_thread()
+        try:
+            SocketServer.ThreadingMixIn.process_request_thread(
+                self, request, client_address)
+        finally:
+            with self._lock:
+                self._connections.pop(request, None)
+
+    def handle_error(self, request, client_address):
+        if not isinstance(sys.exc_info()[1], socket.error):
+            BaseHTTPServer.HTTPServer.handle_error(self, request,
+                                                   client_address)
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+        # Close the kept-alive connections, otherwise their
+        # threads may still be running when the interpreter exits.
+        with self._lock:
+            connections = self._connections.items()
+        for connection, thread in connections:
+            try:
+                connection.shutdown(socket.SHUT_RDWR)
+            except socket.error:
+                pass
+            thread.join()
+        if self._thread is not None:
+            self._thread.join()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument("--port", type=int, default=8787)
+    parser.add_argument("--count", type=int, default=10)
+    parser.add_argument("--latency", type=float, default=0)
+    parser.add_argument("--error-rate", type=float, default=0)
+    parser.add_argument("--auth", action="store_true")
+    parser.add_argument("--full-listing", action="store_true")
+    parser.add_argument("--state-period", type=float, default=None)
+    parser.add_argument("--server-filters", action="store_true")
+    args = parser.parse_args()
+
+    server = FakeOCCIServer(count=args.count, latency=args.latency,
+                            error_rate=args.error_rate, auth=args.auth,
+                            full_listing=args.full_listing,
+                            state_period=args.state_period,
+                            server_filters=args.server_filters,
+                            port=args.port)
+    print("Serving on %s" % server.url)
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+# Copyright 2013 Spanish National Research Council (CSIC)
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""
+Compare the JSON decoders supported by pyocci on OCCI collections.
+
+Usage: python benchmarks/json_decoders.py [count ...]
+"""
+
+from __future__ import print_function
+import sys
+import timeit
+
+from requests.compat import chardet
+
+import occi_payloads
+from pyocci import exceptions
+from pyocci import parsers
+
+DEFAULT_COUNTS = (10, 1000, 10000)
+
+
+def decode_text(payload):
+    encoding = chardet.detect(payload)["encoding"]
+    return parsers.json.loads(payload.decode(encoding))
+
+
+def bench(decode, payload, repeat=5):
+    number = max(1, 100000 // len(payload))
+    timer = timeit.Timer(lambda: decode(payload))
+    return min(timer.repeat(repeat=repeat, number=number)) / number
+
+
+def main(argv):
+    counts = [int(i) for i in argv] or DEFAULT_COUNTS
+
+    decoders = []
+    for name in parsers.JSON_DECODERS:
+        try:
+            decoders.append((name, parsers.get_json_decoder(name)))
+        except exceptions.UnsupportedDecoder as e:
+            print("Skipping %s" % e, file=sys.stderr)
+
+    # Baseline: what resp.text did before decoding when the server did not
+    # send a charset, i.e. guessing the encoding of the whole body.
+    decoders.append(("json (resp.text)", decode_text))
+
+    print("%-18s %10s %12s %12s" %
+          ("decoder", "resources", "bytes", "ms/decode"))
+    for count in counts:
+        payload = occi_payloads.collection(count)
+        for name, decode in decoders:
+            elapsed = bench(decode, payload)
+            print("%-18s %10d %12d %12.3f" %
+                  (name, count, len(payload), elapsed * 1000))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,95 @@
+# Copyright 2013 Spanish National Research Council (CSIC)
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""
+Synthetic OCCI resources used by the benchmarks.
+"""
+
+try:
+    import json
+except ImportError:
+    import simplejson as json
+
+INFRA = "http://schemas.ogf.org/occi/infrastructure#"
+STATES = ("active", "inactive", "suspended")
+
+
+def compute_id(i):
+    return "%08d-0000-0000-0000-000000000000" % i
+
+
+def compute_index(compute_id):
+    """Return the index of a compute resource from its ID, or None."""
+    try:
+        return int(compute_id.split("-", 1)[0])
+    except ValueError:
+        return None
+
+
+def compute(i, state_shift=0):
+    """Return the JSON rendering of the i-th compute resource.
+
+    state_shift changes the state of the resource, to simulate transitions.
+    """
+    return {
+        "kind": {
+            "scheme": INFRA,
+            "term": "compute",
+            "related": ["http://schemas.ogf.org/occi/core#resource"],
+        },
+        "mixins": [
+            {
+                "scheme": "http://example.org/occi/os_tpl#",
+                "term": "image-%d" % (i % 10),
+                "title": "Image %d" % (i % 10),
+                "related": [INFRA + "os_tpl"],
+            },
+            {
+                "scheme": "http://example.org/occi/resource_tpl#",
+                "term": "m1.small",
+                "title": "Flavor: m1.small",
+                "related": [INFRA + "resource_tpl"],
+            },
+        ],
+        "attributes": {
+            "occi.core.id": compute_id(i),
+            "occi.core.title": "vm-%d" % i,
+            "occi.compute.hostname": "vm-%d.example.org" % i,
+            "occi.compute.state": STATES[(i + state_shift) % len(STATES)],
+            "occi.compute.cores": 1,
+            "occi.compute.memory": 2.0,
+            "occi.compute.architecture": "x86",
+        },
+        "links": [
+            {
+                "kind": {
+                    "scheme": INFRA,
+                    "term": "networkinterface",
+                    "related": ["http://schemas.ogf.org/occi/core#link"],
+                },
+                "attributes": {
+                    "occi.networkinterface.address": "10.0.%d.%d" % (
+                        (i // 250) % 250, i % 250),
+                    "occi.networkinterface.mac": "fa:16:3e:00:%02x:%02x" % (
+                        (i // 256) % 256, i % 256),
+                },
+                "target": "/network/default",
+            },
+        ],
+    }
+
+
+def collection(count):
+    """Return the JSON rendering (as bytes) of a /compute/ collection."""
+    return json.dumps([compute(i) for i in range(count)])
@@ -0,0 +1,156 @@
+# Copyright 2013 Spanish National Research Council (CSIC)
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+
+"""
+End to end benchmarks of the pyocci commands against a local fake server.
+
+Every command is run in-process through the shell, for each amount of
+instances, and the results are written as JSON so that they can be compared
+across runs.
+
+Usage: PYTHONPATH=. python benchmarks/run.py [--sizes 10,1000] [-o FILE]
+"""
+
+from __future__ import print_function
+
+import argparse
+import os
+import platform
+import sys
+import tempfile
+import time
+
+try:
+    import json
+except ImportError:
+    import simplejson as json
+
+import fake_server
+import occi_payloads
+import pyocci
+from pyocci import shell
+
+# Next to this script, and ignored by git
+DEFAULT_OUTPUT = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                              "results.json")
+
+SCENARIOS = {
+    "instance-list": ["instance-list"],
+    "instance-list-detailed": ["instance-list", "--detailed"],
+    "instance-list-filtered": ["instance-list", "--detailed", "--filter",
+                               "state=active", "--filter",
+                               "category=image-1"],
+    "instance-show": ["instance-show", occi_payloads.compute_id(0)],
+    "capabilities": ["capabilities"],
+}
+
+
+def run_command(server, argv, proxy):
+    """Run a shell command, returning its wall time in seconds."""
+    argv = ["--endpoint-url", server.url, "--x509-user-proxy", proxy,
+            "--no-token-cache"] + argv
+    stdout = sys.stdout
+    sys.stdout = open(os.devnull, "w")
+    try:
+        start = time.time()
+        shell.OcciShell().main(argv)
+        return time.time() - start
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
+
+
+def run(sizes, scenarios, repeat, server_args, extra_args):
+    proxy = tempfile.NamedTemporaryFile(prefix="pyocci-bench-proxy-")
+    results = []
+    for size in sizes:
+        server = fake_server.FakeOCCIServer(count=size, **server_args)
+        server.start()
+        try:
+            for name in scenarios:
+                timings = []
+                requests = {}
+                for _i in range(repeat):
+                    server.reset_counters()
+                    timings.append(run_command(server,
+                                               extra_args + SCENARIOS[name],
+                                               proxy.name))
+                    requests = dict(server.requests)
+                result = {
+                    "scenario": name,
+                    "instances": size,
+                    "timings": timings,
+                    "best": min(timings),
+                    "mean": sum(timings) / len(timings),
+                    "requests": requests,
+                }
+                results.append(result)
+                print("%-24s %8d instances: %8.3fs (best of %d)" % (
+                      name, size, result["best"], repeat), file=sys.stderr)
+        finally:
+            server.stop()
+    proxy.close()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument("--sizes", default="10,1000,100000",
+                        help="Comma separated amounts of instances")
+    parser.add_argument("--scenarios", default=",".join(sorted(SCENARIOS)),
+                        help="Comma separated scenarios to run")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--latency", type=float, default=0,
+                        help="Seconds that each request takes")
+    parser.add_argument("--error-rate", type=float, default=0,
+                        help="Fraction of requests failing with a 503")
+    parser.add_argument("--auth", action="store_true",
+                        help="Require a Keystone token")
+    parser.add_argument("--full-listing", action="store_true",
+                        help="Return whole resources in the JSON listings")
+    parser.add_argument("--server-filters", action="store_true",
+                        help="Filter the collections on the server")
+    parser.add_argument("-o", "--output", default=DEFAULT_OUTPUT,
+                        help="File to write the results to (default: "
+                             "benchmarks/results.json)")
+    parser.add_argument("shell_args", nargs=argparse.REMAINDER,
+                        help="Extra global options for pyocci, after '--'")
+    args = parser.parse_args()
+
+    extra_args = [a for a in args.shell_args if a != "--"]
+    server_args = {
+        "latency": args.latency,
+        "error_rate": args.error_rate,
+        "auth": args.auth,
+        "full_listing": args.full_listing,
+        "server_filters": args.server_filters,
+    }
+    results = run([int(i) for i in args.sizes.split(",")],
+                  args.scenarios.split(","), args.repeat, server_args,
+                  extra_args)
+
+    with open(args.output, "w") as f:
+        json.dump({
+            "timestamp": time.time(),
+            "python": platform.python_version(),
+            "pyocci": pyocci.__version__,
+            "config": dict(server_args, shell_args=extra_args,
+                           repeat=args.repeat),
+            "results": results,
+        }, f, indent=4, sort_keys=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+# Copyright 2013 Spanish National Research Council (CSIC)
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+
+"""
+Startup time of the pyocci command line.
+
+Every command line is run several times in a new interpreter, failing if
+the best time is over the budget (in milliseconds).
+
+Usage: python benchmarks/startup.py [--budget MS] [--repeat N]
+"""
+
+from __future__ import print_function
+
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+COMMAND_LINES = (
+    ["--version"],
+    ["--help"],
+    ["help", "instance-list"],
+)
+
+# Modules that must not be imported unless a command is run
+HEAVY_MODULES = ("requests", "prettytable", "pyocci.client")
+
+CHECK_IMPORTS = """
+import sys
+from pyocci import shell
+try:
+    shell.OcciShell().main(sys.argv[1:])
+except SystemExit:
+    pass
+print(file=sys.stderr)
+print("imported:" + ",".join(m for m in %r if m in sys.modules),
+      file=sys.stderr)
+""" % (HEAVY_MODULES,)
+
+
+def run(argv, code):
+    with open(os.devnull, "w") as devnull:
+        start = time.time()
+        proc = subprocess.Popen([sys.executable, "-c", code] + argv,
+                                stdout=devnull, stderr=subprocess.PIPE)
+        _out, err = proc.communicate()
+        elapsed = time.time() - start
+    imported = err.rpartition("imported:")[2].strip()
+    return elapsed, imported
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument("--budget", type=float, default=100,
+                        help="Maximum startup time, in milliseconds")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    code = ("from __future__ import print_function\n" + CHECK_IMPORTS)
+    baseline = min(run([], "pass")[0] for _i in range(args.repeat))
+    print("%-30s %8.1f ms" % ("(python)", baseline * 1000))
+
+    failed = False
+    for argv in COMMAND_LINES:
+        timings = []
+        for _i in range(args.repeat):
+            elapsed, imported = run(argv, code)
+            timings.append(elapsed)
+        best = min(timings) * 1000
+        status = "OK"
+        if best > args.budget:
+            status = "OVER BUDGET"
+            failed = True
+        if imported:
+            status += " (imported %s)" % imported
+            failed = True
+        print("%-30s %8.1f ms %s" % (" ".join(argv), best, status))
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
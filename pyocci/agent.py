@@ -0,0 +1,326 @@
+# Copyright 2013 Spanish National Research Council (CSIC)
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+
+"""
+Agent keeping warm OCCI clients for the command line.
+
+The agent listens on a Unix socket and runs the commands forwarded by
+pyocci, reusing the authenticated clients (and their connections) and the
+capabilities of the endpoints between invocations. Commands are run one at
+a time, with the environment, working directory and output of the calling
+process.
+
+The protocol is made of JSON documents, one per line. The client sends
+{"argv": [...], "env": {...}, "cwd": "..."} and the agent answers with any
+number of {"stdout": "..."} and {"stderr": "..."} messages, followed by
+{"status": <exit status>}, or by {"fallback": true} if the command cannot be
+run by the agent (e.g. it needs to read the standard input).
+"""
+
+from __future__ import print_function
+
+import collections
+import os
+import socket
+import sys
+import time
+
+try:
+    import json
+except ImportError:
+    import simplejson as json
+
+DEFAULT_SOCKET = "~/.pyocci/agent.sock"
+DEFAULT_CAPABILITIES_TTL = 300
+DEFAULT_MAX_CLIENTS = 16
+
+# Options that must be run without the agent
+_DIRECT_OPTIONS = ("agent", "interactive", "--no-agent", "--debug")
+
+
+def socket_path(path=None):
+    return os.path.expanduser(path or os.environ.get("OCCI_AGENT_SOCKET") or
+                              DEFAULT_SOCKET)
+
+
+def forward(argv, path=None):
+    """Run a command through the agent, if it is running.
+
+    The output of the command is written to stdout and stderr, and its exit
+    status is returned. None is returned if the command was not run, so
+    that it is run directly instead.
+    """
+    if not argv or any(i in _DIRECT_OPTIONS for i in argv):
+        return None
+
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(socket_path(path))
+    except socket.error:
+        sock.close()
+        return None
+
+    request = {"argv": argv, "env": dict(os.environ), "cwd": os.getcwd()}
+    try:
+        sock.sendall(json.dumps(request) + "\n")
+        for line in sock.makefile("rb"):
+            msg = json.loads(line)
+            if "stdout" in msg:
+                sys.stdout.write(msg["stdout"].encode("utf-8"))
+            elif "stderr" in msg:
+                sys.stderr.write(msg["stderr"].encode("utf-8"))
+            elif "status" in msg:
+                sys.stdout.flush()
+                return msg["status"]
+            elif msg.get("fallback"):
+                return None
+    finally:
+        sock.close()
+
+    # The agent went away, we cannot know if the command was
+    # run so do not try again.
+    print("ERROR: the pyocci agent closed the connection", file=sys.stderr)
+    return 1
+
+
+class NeedsDirectMode(Exception):
+    """The command cannot be run by the agent.
+
+    It must be raised before the command writes anything, otherwise the
+    output would be repeated when the command is run directly.
+    """
+    pass
+
+
+class _StdinUnavailable(object):
+    def __getattr__(self, name):
+        raise NeedsDirectMode()
+
+    def __iter__(self):
+        raise NeedsDirectMode()
+
+
+class _ForwardedStream(object):
+    """File-like object sending what is written to the client."""
+
+    def __init__(self, wfile, name):
+        self.wfile = wfile
+        self.name = name
+        self.written = False
+
+    def write(self, data):
+        if data:
+            self.written = True
+            if isinstance(data, str):
+                data = data.decode("utf-8", "replace")
+            self.wfile.write(json.dumps({self.name: data}) + "\n")
+
+    def writelines(self, lines):
+        for line in lines:
+            self.write(line)
+
+    def flush(self):
+        self.wfile.flush()
+
+    def isatty(self):
+        return False
+
+
+class CachedCapabilities(object):
+    """Keep the capabilities of an endpoint for ttl seconds."""
+
+    def __init__(self, manager, ttl=DEFAULT_CAPABILITIES_TTL):
+        self.manager = manager
+        self.ttl = ttl
+        self._capabilities = None
+        self._registry = None
+        self._expires = 0
+
+    def __getattr__(self, name):
+        return getattr(self.manager, name)
+
+    def list(self):
+        if self._capabilities is None or self._expires <= time.time():
+            self._capabilities = self.manager.list()
+            self._registry = None
+            self._expires = time.time() + self.ttl
+        return list(self._capabilities)
+
+    def registry(self):
+        capabilities = self.list()
+        if self._registry is None:
+            self._registry = self.manager.registry(capabilities)
+        return self._registry
+
+
+def _site_clients(cs):
+    """Return the clients of every endpoint of a Client or MultiClient."""
+    return getattr(cs, "clients", {None: cs}).values()
+
+
+class ClientCache(collections.OrderedDict):
+    """The clients of the agent, wrapping their capabilities on creation.
+
+    Up to max_clients clients are kept. When there are more, the least
+    recently used ones are removed and their connections closed.
+    """
+
+    def __init__(self, capabilities_ttl=DEFAULT_CAPABILITIES_TTL,
+                 max_clients=DEFAULT_MAX_CLIENTS):
+        super(ClientCache, self).__init__()
+        self.capabilities_ttl = capabilities_ttl
+        self.max_clients = max_clients
+
+    def get(self, key, default=None):
+        cs = self.pop(key, None)
+        if cs is None:
+            return default
+        # Move it to the most recently used position
+        super(ClientCache, self).__setitem__(key, cs)
+        return cs
+
+    def __setitem__(self, key, cs):
+        if self.capabilities_ttl:
+            for site_cs in _site_clients(cs):
+                site_cs.capabilities = CachedCapabilities(
+                    site_cs.capabilities, self.capabilities_ttl)
+        self.pop(key, None)
+        super(ClientCache, self).__setitem__(key, cs)
+        while len(self) > max(self.max_clients, 1):
+            _key, old = self.popitem(last=False)
+            for site_cs in _site_clients(old):
+                site_cs.client.close()
+
+
+class Agent(object):
+    """Serve the commands forwarded through the Unix socket at path.
+
+    If idle_timeout is set, the agent exits after that amount of seconds
+    without receiving a command.
+    """
+
+    def __init__(self, path=None, capabilities_ttl=DEFAULT_CAPABILITIES_TTL,
+                 idle_timeout=None, max_clients=DEFAULT_MAX_CLIENTS):
+        self.path = socket_path(path)
+        self.idle_timeout = idle_timeout
+        self.clients = ClientCache(capabilities_ttl, max_clients)
+
+    def _bind(self):
+        dirname = os.path.dirname(self.path)
+        if dirname and not os.path.isdir(dirname):
+            os.makedirs(dirname, 0o700)
+
+        if os.path.exists(self.path):
+            probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                probe.connect(self.path)
+            except socket.error:
+                # Stale socket of an agent that is gone
+                os.unlink(self.path)
+            else:
+                raise RuntimeError("An agent is already running on %s" %
+                                   self.path)
+            finally:
+                probe.close()
+
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        old_umask = os.umask(0o177)
+        try:
+            sock.bind(self.path)
+        finally:
+            os.umask(old_umask)
+        sock.listen(16)
+        sock.settimeout(self.idle_timeout)
+        return sock
+
+    def serve_forever(self):
+        sock = self._bind()
+        try:
+            while True:
+                try:
+                    conn, _addr = sock.accept()
+                except socket.timeout:
+                    break
+                conn.settimeout(None)
+                try:
+                    self.handle(conn)
+                except socket.error:
+                    # The client went away
+                    pass
+                finally:
+                    conn.close()
+        finally:
+            sock.close()
+            os.unlink(self.path)
+
+    def handle(self, conn):
+        rfile = conn.makefile("rb")
+        wfile = conn.makefile("wb", 0)
+        try:
+            request = json.loads(rfile.readline())
+            argv = [i.encode("utf-8") for i in request["argv"]]
+            env = dict((k.encode("utf-8"), v.encode("utf-8"))
+                       for k, v in request.get("env", {}).items())
+        except (ValueError, KeyError, TypeError, AttributeError) as e:
+            wfile.write(json.dumps({"stderr": "ERROR: invalid request to "
+                                              "the pyocci agent: %s\n" % e}) +
+                        "\n")
+            wfile.write(json.dumps({"status": 1}) + "\n")
+            return
+
+        try:
+            status = self.run(argv, env, request.get("cwd"), wfile)
+        except NeedsDirectMode:
+            wfile.write(json.dumps({"fallback": True}) + "\n")
+        else:
+            wfile.write(json.dumps({"status": status}) + "\n")
+
+    def run(self, argv, env, cwd, wfile):
+        """Run a command with the given environment and output."""
+        # Imported here, as the client only needs forward()
+        from pyocci import shell
+
+        saved = (dict(os.environ), os.getcwd(),
+                 sys.stdin, sys.stdout, sys.stderr)
+        os.environ.clear()
+        os.environ.update(env)
+        sys.stdin = _StdinUnavailable()
+        sys.stdout = stdout = _ForwardedStream(wfile, "stdout")
+        sys.stderr = stderr = _ForwardedStream(wfile, "stderr")
+        try:
+            if cwd:
+                os.chdir(cwd)
+            shell.OcciShell(client_cache=self.clients).main(argv)
+            return 0
+        except SystemExit as e:
+            if e.code is None or isinstance(e.code, int):
+                return e.code or 0
+            print(e.code, file=sys.stderr)
+            return 1
+        except NeedsDirectMode:
+            if not (stdout.written or stderr.written):
+                raise
+            # Running it again directly would repeat its output
+            print("ERROR: the command needs the standard input, run it "
+                  "with --no-agent", file=sys.stderr)
+            return 1
+        except Exception as e:
+            print("ERROR: %s" % unicode(e), file=sys.stderr)
+            return 1
+        finally:
+            os.environ.clear()
+            os.environ.update(saved[0])
+            os.chdir(saved[1])
+            sys.stdin, sys.stdout, sys.stderr = saved[2:]
@@ -0,0 +1,309 @@
+# Copyright 2013 Spanish National Research Council (CSIC)
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""
+Caches used by the OCCI client.
+"""
+
+import calendar
+import collections
+import hashlib
+import os
+import threading
+import time
+
+try:
+    import json
+except ImportError:
+    import simplejson as json
+
+DEFAULT_TOKEN_CACHE = "~/.pyocci/tokens.json"
+DEFAULT_HTTP_CACHE_DIR = "~/.pyocci/http-cache"
+
+# Tokens expiring in less than this amount of seconds are not used.
+EXPIRY_MARGIN = 60
+
+# Serializes the updates of the token caches by the threads of a process
+_token_cache_lock = threading.Lock()
+
+
+def identity_key(endpoint_url, group=None, username=None,
+                 x509_user_proxy=None):
+    """Return a key identifying some credentials against an endpoint.
+
+    For proxy certificates the contents of the proxy file are used, so a
+    renewed proxy gets a new key.
+    """
+    key = hashlib.sha1()
+    key.update("%s\0%s\0%s\0" % (endpoint_url, group or "", username or ""))
+    if x509_user_proxy:
+        try:
+            with open(x509_user_proxy, "rb") as f:
+                key.update(f.read())
+        except IOError:
+            key.update(x509_user_proxy)
+    return key.hexdigest()
+
+
+def parse_expiry(value):
+    """Convert a Keystone ISO 8601 (UTC) date into a timestamp."""
+    try:
+        return calendar.timegm(time.strptime(value[:19],
+                                             "%Y-%m-%dT%H:%M:%S"))
+    except (TypeError, ValueError):
+        return None
+
+
+class TokenCache(object):
+    """On-disk cache of Keystone tokens.
+
+    For each identity key it stores the token, its expiry date and the
+    Keystone URL discovered for the endpoint in a JSON file that is only
+    readable by its owner.
+    """
+
+    def __init__(self, path=None):
+        self.path = os.path.expanduser(path or DEFAULT_TOKEN_CACHE)
+
+    def _load(self):
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except (IOError, ValueError):
+            return {}
+
+    def _save(self, data):
+        dirname = os.path.dirname(self.path)
+        if dirname and not os.path.isdir(dirname):
+            os.makedirs(dirname, 0o700)
+
+        # Write to a temporary file and rename it, so that concurrent
+        # invocations never read a partially written cache.
+        tmp = "%s.%d.%d" % (self.path, os.getpid(),
+                            threading.current_thread().ident)
+        fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "w") as f:
+            json.dump(data, f)
+        os.rename(tmp, self.path)
+
+    def get(self, key):
+        """Get the cached entry for key, without the token if expired."""
+        entry = self._load().get(key)
+        if entry is None:
+            return {}
+
+        expires = entry.get("expires")
+        if expires is not None and expires - EXPIRY_MARGIN <= time.time():
+            entry.pop("token", None)
+        return entry
+
+    def set(self, key, token, expires=None, auth_url=None):
+        with _token_cache_lock:
+            data = self._load()
+            data[key] = {
+                "token": token,
+                "expires": expires,
+                "auth_url": auth_url,
+            }
+            self._save(data)
+
+    def invalidate(self, key):
+        """Drop the token for key, keeping the discovered Keystone URL."""
+        with _token_cache_lock:
+            data = self._load()
+            entry = data.get(key)
+            if entry and entry.pop("token", None) is not None:
+                self._save(data)
+
+
+class ResponseCache(object):
+    """Cache of HTTP responses validated with conditional requests.
+
+    Responses with an ETag or Last-Modified validator are revalidated with
+    If-None-Match/If-Modified-Since, and their body is served from the cache
+    when the server answers 304 Not Modified. If ttl is set, responses are
+    served without contacting the server for ttl seconds, which also allows
+    caching responses without validators.
+
+    Up to max_size bytes of responses are kept in memory, evicting the least
+    recently used ones. If path is set, responses are also stored on disk
+    (bounded to max_size too), so that they can be reused across processes.
+    """
+
+    _HEADERS = ("content-type", "etag", "last-modified")
+
+    # The disk is only scanned when the size of the files
+    # written since the last scan may exceed max_size, or every
+    # PRUNE_INTERVAL stores, to notice the files written by other processes.
+    PRUNE_INTERVAL = 100
+
+    def __init__(self, ttl=None, max_size=16 * 1024 * 1024, path=None):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.path = path and os.path.expanduser(path)
+
+        self._entries = collections.OrderedDict()
+        self._size = 0
+        self._disk_size = None
+        self._stores = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(prefix, url, headers):
+        """Return the cache key for a GET on url with the given headers."""
+        # Collections may be filtered with OCCI headers
+        varies = [headers.get(h, "")
+                  for h in ("Accept", "Category", "X-OCCI-Attribute")]
+        return hashlib.sha1("\0".join([prefix, url] + varies)).hexdigest()
+
+    def _disk_path(self, key):
+        return os.path.join(self.path, key)
+
+    def _load(self, key):
+        try:
+            with open(self._disk_path(key), "rb") as f:
+                meta = json.loads(f.readline())
+                meta["content"] = f.read()
+        except (IOError, ValueError):
+            return None
+        return meta
+
+    def _store(self, key, entry):
+        if not os.path.isdir(self.path):
+            os.makedirs(self.path, 0o700)
+        meta = dict((k, v) for k, v in entry.items() if k != "content")
+
+        path = self._disk_path(key)
+        tmp = "%s.%d.%d" % (path, os.getpid(),
+                            threading.current_thread().ident)
+        fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "wb") as f:
+            f.write(json.dumps(meta) + "\n")
+            f.write(entry["content"])
+            size = f.tell()
+        try:
+            size -= os.stat(path).st_size
+        except OSError:
+            pass
+        os.rename(tmp, path)
+
+        with self._lock:
+            self._stores += 1
+            prune = (self._disk_size is None or
+                     self._stores >= self.PRUNE_INTERVAL)
+            if not prune:
+                self._disk_size += size
+                prune = self._disk_size > self.max_size
+            if prune:
+                self._stores = 0
+        if prune:
+            total = self._prune_disk()
+            with self._lock:
+                self._disk_size = total
+
+    def _prune_disk(self):
+        """Remove the oldest files over max_size, returning the size left."""
+        files = []
+        total = 0
+        for name in os.listdir(self.path):
+            if "." in name:
+                # Being written
+                continue
+            try:
+                st = os.stat(self._disk_path(name))
+            except OSError:
+                continue
+            files.append((st.st_mtime, st.st_size, name))
+            total += st.st_size
+
+        for _mtime, size, name in sorted(files):
+            if total <= self.max_size:
+                break
+            try:
+                os.unlink(self._disk_path(name))
+            except OSError:
+                pass
+            total -= size
+        return total
+
+    def _add(self, key, entry):
+        # Must be called with the lock held
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self._size -= len(old["content"])
+        self._entries[key] = entry
+        self._size += len(entry["content"])
+        while self._size > self.max_size and self._entries:
+            _key, old = self._entries.popitem(last=False)
+            self._size -= len(old["content"])
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                # Move it to the most recently used position
+                self._entries[key] = entry
+                return entry
+
+        if self.path:
+            entry = self._load(key)
+            if entry is not None:
+                with self._lock:
+                    self._add(key, entry)
+        return entry
+
+    def set(self, key, resp):
+        """Store resp, if it can be revalidated or there is a TTL."""
+        headers = dict((h, resp.headers[h]) for h in self._HEADERS
+                       if h in resp.headers)
+        if not (self.ttl or "etag" in headers or "last-modified" in headers):
+            return
+
+        entry = {
+            "content": resp.content,
+            "headers": headers,
+            "stored": time.time(),
+        }
+        with self._lock:
+            self._add(key, entry)
+        if self.path:
+            self._store(key, entry)
+
+    def touch(self, key, entry):
+        """Mark entry as just validated by the server."""
+        entry["stored"] = time.time()
+        if self.path:
+            self._store(key, entry)
+
+    def is_fresh(self, entry):
+        return bool(self.ttl) and time.time() - entry["stored"] < self.ttl
+
+    def conditional_headers(self, entry):
+        headers = {}
+        if "etag" in entry["headers"]:
+            headers["If-None-Match"] = entry["headers"]["etag"]
+        if "last-modified" in entry["headers"]:
+            headers["If-Modified-Since"] = entry["headers"]["last-modified"]
+        return headers
+
+    def response(self, entry, url):
+        """Build a 200 response with the cached body."""
+        import requests
+
+        resp = requests.Response()
+        resp.status_code = 200
+        resp.url = url
+        resp.headers.update(entry["headers"])
+        resp._content = entry["content"]
+        return resp
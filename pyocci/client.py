@@ -16,7 +16,12 @@
 OCCI Client interface. Handles the REST calls and responses.
 """
 
+import collections
 import logging
+from multiprocessing import pool
+import threading
+import time
+import types
 
 import requests
 
@@ -25,7 +30,11 @@ try:
 except ImportError:
     import simplejson as json
 
+from pyocci import cache
 from pyocci import exceptions
+from pyocci import parsers
+from pyocci import retry
+from pyocci import transport
 from pyocci import utils
 
 
@@ -35,21 +44,101 @@ class Manager(object):
     def __init__(self, api):
         self.api = api
 
-    def _list(self, url, obj_class=None, body=None):
+    def _list(self, url, obj_class=None, body=None, stream=False,
+              accept=None, headers=None):
+        """Get a collection.
+
+        If stream is True an iterator is returned instead of a list, and the
+        resources are decoded one at a time as they are read from the
+        network. accept overrides the renderings requested to the server,
+        and headers are added to the request (e.g. filters).
+        """
+        headers = dict(headers or {})
+        if accept:
+            headers['Accept'] = accept
         if body:
-            _resp, body = self.api.client.post(url, body=body)
+            _resp, body = self.api.client.post(url, body=body, stream=stream,
+                                               headers=headers)
         else:
-            _resp, body = self.api.client.get(url)
+            _resp, body = self.api.client.get(url, stream=stream,
+                                              headers=headers)
         return body
 
     def _get(self, url):
         _resp, body = self.api.client.get(url)
         return body
 
+    def _create(self, url, headers):
+        """Create a resource, returning its location."""
+        resp, body = self.api.client.post(url, headers=headers)
+        location = resp.headers.get('location', None)
+        if location is None and body:
+            # Text renderings return the new location(s)
+            location = body[0] if isinstance(body, list) else body
+        if not location:
+            raise exceptions.InvalidResponse(
+                "The server did not return the location of the resource "
+                "created at %s" % url)
+        return location
+
+    def _delete(self, url):
+        self.api.client.delete(url)
+
+    def _action(self, url, headers):
+        _resp, body = self.api.client.post(url, headers=headers)
+        return body
+
+
+# All the asynchronous managers share the same pool of worker threads, so
+# that talking to many endpoints does not need one thread per endpoint.
+ASYNC_POOL_SIZE = 20
+_async_pool = None
+_async_pool_lock = threading.Lock()
+
+
+def get_async_pool():
+    global _async_pool
+    with _async_pool_lock:
+        if _async_pool is None:
+            _async_pool = pool.ThreadPool(ASYNC_POOL_SIZE)
+    return _async_pool
+
+
+class AsyncManager(object):
+    """Perform the calls of a manager in the background.
+
+    The public methods of the wrapped manager return an AsyncResult (see
+    multiprocessing.pool) instead of blocking. Use its get() method to wait
+    for the result, or ready() to check if it is already available.
+    """
+
+    def __init__(self, manager, async_pool=None):
+        self.manager = manager
+        self.async_pool = async_pool or get_async_pool()
+
+    def __getattr__(self, name):
+        attr = getattr(self.manager, name)
+        if name.startswith("_") or not callable(attr):
+            return attr
+
+        def _async_call(*args, **kwargs):
+            return self.async_pool.apply_async(attr, args, kwargs)
+        return _async_call
+
 
 class HTTPClient(object):
+    """Client for an OCCI endpoint.
+
+    A client can be shared by several threads. If its token expires, only
+    one of them authenticates again while the rest wait for the new token.
+    Up to concurrency connections to the endpoint are kept open for reuse,
+    so it should be the amount of threads expected to share the client, and
+    keepalive (see transport.OCCIAdapter) keeps idle connections alive.
+    """
 
     USER_AGENT = 'pyocci'
+    STREAM_CHUNK_SIZE = 64 * 1024
+    HOOK_EVENTS = ("pre_request", "post_response", "auth", "decode")
 
     def __init__(self,
                  endpoint_url,
@@ -61,7 +150,15 @@ class HTTPClient(object):
                  timeout=None,
                  http_log_debug=False,
                  insecure=False,
-                 cacert=None):
+                 cacert=None,
+                 token_cache=None,
+                 json_decoder="json",
+                 response_cache=None,
+                 retry_policy=None,
+                 circuit_breakers=None,
+                 rate_limiter=None,
+                 concurrency=transport.DEFAULT_POOL_SIZE,
+                 keepalive=None):
 
         # Connection options
         self.endpoint_url = endpoint_url
@@ -79,6 +176,26 @@ class HTTPClient(object):
 
         # FIXME(aloga): we should let the users pass this
         self.auth_token = None
+        self.auth_url = None
+        # Reentrant, as authenticate() may be called with it
+        # held when re-authenticating.
+        self._auth_lock = threading.RLock()
+
+        # Tokens (and the Keystone URL) and responses may be reused across
+        # clients using the same credentials. The caches can also be set
+        # after the client is created.
+        self.token_cache = token_cache
+        self.response_cache = response_cache
+        self._identity_key = cache.identity_key(
+            endpoint_url,
+            group=group,
+            username=username,
+            x509_user_proxy=self.cert)
+
+        if self.token_cache is not None:
+            entry = self.token_cache.get(self._identity_key)
+            self.auth_token = entry.get("token")
+            self.auth_url = entry.get("auth_url")
 
         if insecure:
             self.verify_cert = False
@@ -88,6 +205,23 @@ class HTTPClient(object):
             else:
                 self.verify_cert = True
 
+        # The responses are decoded from the raw bytes, as
+        # resp.text may need to guess the charset of the whole body first.
+        self.json_decode = parsers.get_json_decoder(json_decoder)
+
+        # Transient failures are retried according to retry_policy, and
+        # failing endpoints are detected by the circuit_breakers (both are
+        # disabled if None).
+        self.retry_policy = retry_policy
+        self.circuit_breakers = circuit_breakers
+
+        # Requests to each endpoint are throttled by the rate_limiter (if
+        # any), shared by all the threads using this client.
+        self.rate_limiter = rate_limiter
+
+        # Functions called on each event, see add_hook()
+        self.hooks = dict((event, []) for event in self.HOOK_EVENTS)
+
         self.http_log_debug = http_log_debug
         if timeout is not None:
             self.timeout = float(timeout)
@@ -107,7 +241,42 @@ class HTTPClient(object):
                 # otherwise we will get all the requests logging messanges
                 rql.setLevel(logging.WARNING)
         # requests within the same session can reuse TCP connections from pool
+        self.concurrency = concurrency
         self.http = requests.Session()
+        # The proxy and the CAs are loaded once in the adapter
+        # SSL context, instead of for every connection.
+        adapter = transport.OCCIAdapter(cert=self.cert,
+                                        verify=self.verify_cert,
+                                        pool_size=concurrency,
+                                        keepalive=keepalive)
+        self.http.mount("http://", adapter)
+        self.http.mount("https://", adapter)
+
+    def close(self):
+        """Close the connections kept open to the endpoint."""
+        self.http.close()
+
+    def add_hook(self, event, func):
+        """Call func(**info) every time event happens.
+
+        The events, and the keyword arguments func is called with, are:
+
+        pre_request: before sending each request (retries included), with
+            method, url, attempt (0 for the first try) and kwargs (the
+            arguments for requests).
+        post_response: after each request, with method, url, attempt,
+            elapsed (seconds), stream, response and error (the response is
+            None if the request raised the error).
+        auth: after authenticating, with auth_type, elapsed and error.
+        decode: after decoding a response, with media_type, elapsed, size
+            (bytes) and stream. For streamed responses it happens once the
+            stream ends, and size is the amount of bytes read from it.
+        """
+        self.hooks[event].append(func)
+
+    def _run_hooks(self, event, **info):
+        for func in self.hooks[event]:
+            func(**info)
 
     def http_log_req(self, method, url, kwargs):
         if not self.http_log_debug:
@@ -129,21 +298,154 @@ class HTTPClient(object):
             string_parts.append(" -d '%s'" % (kwargs['data']))
         self._logger.debug("\nREQ: %s\n" % "".join(string_parts))
 
-    def http_log_resp(self, resp):
+    def http_log_resp(self, resp, stream=False):
         if not self.http_log_debug:
             return
         self._logger.debug(
             "RESP: [%s] %s\nRESP BODY: %s\n",
             resp.status_code,
             resp.headers,
-            resp.text)
+            "<streamed>" if stream else resp.text)
+
+    def _iter_stream(self, resp):
+        media_type = parsers.media_type(resp.headers.get('content-type'))
+        # The time spent waiting for the network is not
+        # decoding time, so it is measured apart.
+        stats = {"size": 0, "reading": 0.0, "elapsed": 0.0}
+
+        def chunks():
+            content = resp.iter_content(self.STREAM_CHUNK_SIZE)
+            while True:
+                start = time.time()
+                try:
+                    chunk = next(content)
+                except StopIteration:
+                    return
+                finally:
+                    stats["reading"] += time.time() - start
+                stats["size"] += len(chunk)
+                yield chunk
+
+        try:
+            if media_type == parsers.URI_LIST:
+                items = parsers.iter_uri_list(parsers.iter_lines(chunks()))
+            elif media_type == parsers.TEXT_PLAIN:
+                items = parsers.iter_text_plain(parsers.iter_lines(chunks()))
+            elif media_type == parsers.TEXT_OCCI:
+                items = parsers.parse_text_occi(resp.headers) or []
+                if not isinstance(items, list):
+                    items = [items]
+            else:
+                items = parsers.iter_json_array(chunks(),
+                                                loads=self.json_decode)
+            items = iter(items)
+            while True:
+                start = time.time()
+                try:
+                    item = next(items)
+                except StopIteration:
+                    break
+                finally:
+                    stats["elapsed"] += time.time() - start
+                yield item
+        finally:
+            resp.close()
+            self._run_hooks("decode", media_type=media_type,
+                            elapsed=max(0.0, stats["elapsed"] -
+                                        stats["reading"]),
+                            size=stats["size"], stream=True)
+
+    def _decode(self, resp):
+        media_type = parsers.media_type(resp.headers.get('content-type'))
+        if media_type == parsers.URI_LIST:
+            return parsers.parse_uri_list(resp.content)
+        elif media_type == parsers.TEXT_OCCI:
+            return parsers.parse_text_occi(resp.headers)
+        elif media_type == parsers.TEXT_PLAIN:
+            return parsers.parse_text_plain(resp.content)
+        try:
+            return self.json_decode(resp.content)
+        except ValueError:
+            return None
+
+    def _send(self, method, url, stream, kwargs):
+        """Send the request, retrying it if needed."""
+        breaker = bucket = None
+        if self.circuit_breakers is not None:
+            breaker = self.circuit_breakers.get(url)
+        if self.rate_limiter is not None:
+            bucket = self.rate_limiter.get(url)
 
-    def request(self, url, method, exit_on_failure=True, **kwargs):
+        attempt = 0
+        while True:
+            if breaker is not None:
+                breaker.before_call(url)
+
+            start = time.time()
+            try:
+                if bucket is not None:
+                    bucket.acquire()
+                self._run_hooks("pre_request", method=method, url=url,
+                                attempt=attempt, kwargs=kwargs)
+                start = time.time()
+                resp = self.http.request(
+                    method,
+                    url,
+                    stream=stream,
+                    **kwargs)
+            except (requests.exceptions.ConnectionError,
+                    requests.exceptions.Timeout) as e:
+                if breaker is not None:
+                    breaker.record_failure()
+                self._run_hooks("post_response", method=method, url=url,
+                                attempt=attempt, elapsed=time.time() - start,
+                                stream=stream, response=None, error=e)
+                delay = None
+                # Certificate and proxy errors will not go away by retrying
+                if (self.retry_policy is not None and
+                        not isinstance(e, requests.exceptions.SSLError)):
+                    delay = self.retry_policy.get_delay(method, attempt)
+                if delay is None:
+                    raise
+            except Exception:
+                # The outcome must always be recorded, otherwise
+                # a trial call would leave the circuit open forever.
+                if breaker is not None:
+                    breaker.record_failure()
+                raise
+            else:
+                if breaker is not None:
+                    if resp.status_code in retry.FAILURE_STATUSES:
+                        breaker.record_failure()
+                    else:
+                        breaker.record_success()
+                self._run_hooks("post_response", method=method, url=url,
+                                attempt=attempt, elapsed=time.time() - start,
+                                stream=stream, response=resp, error=None)
+                if bucket is not None:
+                    bucket.update(resp.status_code)
+                delay = None
+                if self.retry_policy is not None:
+                    delay = self.retry_policy.get_delay(
+                        method, attempt, resp.status_code,
+                        resp.headers.get('retry-after'))
+                if delay is None:
+                    return resp
+                resp.close()
+
+            self._logger.debug("Retrying %s %s in %.2f seconds",
+                               method, url, delay)
+            time.sleep(delay)
+            attempt += 1
+
+    def request(self, url, method, exit_on_failure=True, stream=False,
+                **kwargs):
         kwargs.setdefault('headers', kwargs.get('headers', {}))
         kwargs['headers']['User-Agent'] = self.USER_AGENT
 
-        # FIXME(aloga): we need to fix this
-        kwargs['headers']['Accept'] = 'application/occi+json'
+        # We prefer JSON, but the server may choose any of the
+        # renderings we support, and the response is parsed accordingly.
+        kwargs['headers'].setdefault('Accept', parsers.DEFAULT_ACCEPT)
 #        kwargs['headers']['Accept'] = 'application/json'
         if 'body' in kwargs:
             kwargs['headers']['Content-Type'] = 'application/json'
@@ -159,28 +461,60 @@ class HTTPClient(object):
             kwargs.setdefault('timeout', self.timeout)
         kwargs['verify'] = self.verify_cert
 
-        self.http_log_req(method, url, kwargs)
-        resp = self.http.request(
-            method,
-            url,
-            cert=self.cert,
-            **kwargs)
+        cache_key = cached = None
+        if (self.response_cache is not None and method == 'GET' and
+                not stream):
+            cache_key = self.response_cache.key(self._identity_key, url,
+                                                kwargs['headers'])
+            cached = self.response_cache.get(cache_key)
+
+        if cached is not None and self.response_cache.is_fresh(cached):
+            resp = self.response_cache.response(cached, url)
+        else:
+            if cached is not None:
+                kwargs['headers'].update(
+                    self.response_cache.conditional_headers(cached))
+
+            self.http_log_req(method, url, kwargs)
+            resp = self._send(method, url, stream, kwargs)
+
+            if cached is not None and resp.status_code == 304:
+                self.http_log_resp(resp)
+                self.response_cache.touch(cache_key, cached)
+                resp = self.response_cache.response(cached, url)
+            elif cache_key is not None and resp.status_code == 200:
+                self.response_cache.set(cache_key, resp)
+
+        # Errors are not streamed, as we need the whole body
+        if stream and resp.status_code < 400:
+            self.http_log_resp(resp, stream=True)
+            return resp, self._iter_stream(resp)
+
         self.http_log_resp(resp)
 
-        if resp.text:
+        if resp.content:
             # NOTE(alaski): Because force_exceptions_to_status_code=True
             # httplib2 returns a connection refused event as a 400 response.
             # To determine if it is a bad request or refused connection we need
             # to check the body.  httplib2 tests check for 'Connection refused'
             # or 'actively refused' in the body, so that's what we'll do.
             if resp.status_code == 400:
-                if ('Connection refused' in resp.text or
-                        'actively refused' in resp.text):
-                    raise exceptions.ConnectionRefused(resp.text)
-            try:
-                body = json.loads(resp.text)
-            except ValueError:
-                body = None
+                if ('Connection refused' in resp.content or
+                        'actively refused' in resp.content):
+                    raise exceptions.ConnectionRefused(resp.content)
+            start = time.time()
+            body = self._decode(resp)
+            self._run_hooks(
+                "decode",
+                media_type=parsers.media_type(
+                    resp.headers.get('content-type')),
+                elapsed=time.time() - start,
+                size=len(resp.content),
+                stream=False)
+        elif (parsers.media_type(resp.headers.get('content-type')) ==
+                parsers.TEXT_OCCI):
+            # The text/occi rendering is in the headers
+            body = parsers.parse_text_occi(resp.headers)
         else:
             body = None
 
@@ -193,10 +527,12 @@ class HTTPClient(object):
         # Perform the request once. If we get a 401 back then it
         # might be because the auth token expired, so try to
         # re-authenticate and try again. If it still fails, bail.
+        # Other threads may change the token meanwhile, so the
+        # one sent is kept to know if it is the one that failed.
+        token = self.auth_token
         try:
-            if self.auth_token:
-                kwargs.setdefault('headers',
-                                  {})['X-Auth-Token'] = self.auth_token
+            if token:
+                kwargs.setdefault('headers', {})['X-Auth-Token'] = token
 #            if self.projectid:
 #                kwargs['headers']['X-Auth-Project-Id'] = self.projectid
 
@@ -205,15 +541,31 @@ class HTTPClient(object):
             return resp, body
         except exceptions.Unauthorized, ex:
             try:
-                self.authenticate()
-                kwargs.setdefault('headers',
-                                  {})['X-Auth-Token'] = self.auth_token
+                token = self._reauthenticate(token)
+                kwargs.setdefault('headers', {})['X-Auth-Token'] = token
                 resp, body = self.request(self.endpoint_url + url,
                                           method, **kwargs)
                 return resp, body
             except exceptions.Unauthorized:
                 raise ex
 
+    def _reauthenticate(self, failed_token):
+        """Get a new token to replace failed_token, returning it.
+
+        If another thread already replaced it, its token is used instead of
+        authenticating again.
+        """
+        with self._auth_lock:
+            if self.auth_token is None or self.auth_token == failed_token:
+                self._invalidate_token()
+                self.authenticate()
+            return self.auth_token
+
+    def _invalidate_token(self):
+        self.auth_token = None
+        if self.token_cache is not None:
+            self.token_cache.invalidate(self._identity_key)
+
     def _authenticate_with_keystone(self, url, **kwargs):
         version = "v2.0"
         if not url.endswith("/"):
@@ -255,7 +607,14 @@ class HTTPClient(object):
             **kwargs)
 
         if resp.status_code == 200:
-            self.auth_token = respbody['access']['token']['id']
+            token = respbody['access']['token']
+            self.auth_token = token['id']
+            if self.token_cache is not None:
+                self.token_cache.set(
+                    self._identity_key,
+                    self.auth_token,
+                    expires=cache.parse_expiry(token.get('expires')),
+                    auth_url=self.auth_url)
 
         return None
 
@@ -277,6 +636,17 @@ class HTTPClient(object):
 #            raise exceptions.from_response(resp, body, url, "POST")
 
     def _authenticate_voms(self):
+        if self.auth_url:
+            # We already know (e.g. from the token cache) where
+            # Keystone is, so try it before asking the endpoint again.
+            # If it is gone or unreachable, it may have moved.
+            try:
+                return self._authenticate_with_keystone(self.auth_url)
+            except (exceptions.ClientException, exceptions.CircuitOpen,
+                    requests.exceptions.ConnectionError,
+                    requests.exceptions.Timeout):
+                self.auth_url = None
+
         resp, body = self.request(self.endpoint_url, 'GET',
                                   exit_on_failure=False)
         if resp.status_code == 401 and 'www-authenticate' in resp.headers:
@@ -286,6 +656,7 @@ class HTTPClient(object):
                 auth_method, auth_url = auth_url.split()
                 auth_url = auth_url.split("=")[-1][1:-1]
                 if auth_method == "Keystone":
+                    self.auth_url = auth_url
                     return self._authenticate_with_keystone(auth_url)
         elif resp.status_code >= 400:
             raise exceptions.from_response(resp, body,
@@ -297,7 +668,17 @@ class HTTPClient(object):
     }
 
     def authenticate(self):
-        return self.auth_methods[self.auth_type](self)
+        start = time.time()
+        try:
+            with self._auth_lock:
+                ret = self.auth_methods[self.auth_type](self)
+        except Exception as e:
+            self._run_hooks("auth", auth_type=self.auth_type,
+                            elapsed=time.time() - start, error=e)
+            raise
+        self._run_hooks("auth", auth_type=self.auth_type,
+                        elapsed=time.time() - start, error=None)
+        return ret
 
     def get(self, url, **kwargs):
         return self._cs_request(url, 'GET', **kwargs)
@@ -328,3 +709,79 @@ def get_client_class(version):
 def Client(version, *args, **kwargs):
     client_class = get_client_class(version)
     return client_class(*args, **kwargs)
+
+
+def _tag_site(item, site):
+    if isinstance(item, dict):
+        return dict(item, site=site)
+    elif hasattr(item, "site"):
+        item.site = site
+        return item
+    return (site, item)
+
+
+class _MultiManager(object):
+    """Call a manager on all the endpoints of a MultiClient."""
+
+    def __init__(self, multi_client, name):
+        self.multi_client = multi_client
+        self.name = name
+
+    def __getattr__(self, method):
+        def _call(*args, **kwargs):
+            def _call_site(cs):
+                result = getattr(getattr(cs, self.name), method)(*args,
+                                                                 **kwargs)
+                if isinstance(result, types.GeneratorType):
+                    result = list(result)
+                return result
+
+            items = []
+            for result in self.multi_client.map(_call_site):
+                if result.error is not None:
+                    continue
+                elif isinstance(result.result, list):
+                    items.extend(_tag_site(i, result.item)
+                                 for i in result.result)
+                elif result.result is not None:
+                    items.append(_tag_site(result.result, result.item))
+            return items
+        return _call
+
+
+class MultiClient(object):
+    """Talk to several OCCI endpoints at once.
+
+    A client is created for every endpoint URL, with the same arguments,
+    and the calls to the capabilities and instances managers are performed
+    concurrently on all of them (max_workers at a time). Their results are
+    merged, tagging each resource with the endpoint (site) it comes from:
+    resources get their site attribute set, dicts get a "site" key and any
+    other value is returned as a (site, value) tuple.
+
+    Failing endpoints do not abort the call. The exceptions of the last call
+    are stored in errors, keyed by endpoint URL.
+    """
+
+    def __init__(self, version, endpoint_urls, *args, **kwargs):
+        self.max_workers = kwargs.pop("max_workers", 10)
+        self.clients = collections.OrderedDict(
+            (url, Client(version, url, *args, **kwargs))
+            for url in endpoint_urls)
+        self.errors = {}
+
+        self.capabilities = _MultiManager(self, "capabilities")
+        self.instances = _MultiManager(self, "instances")
+
+    def map(self, func):
+        """Call func(client) concurrently for every endpoint.
+
+        Returns a list of utils.BulkResult(site, result, error), in the
+        same order as the endpoints, and updates errors.
+        """
+        results = utils.run_bulk(lambda site: func(self.clients[site]),
+                                 self.clients.keys(),
+                                 max_workers=self.max_workers)
+        self.errors = dict((r.item, r.error) for r in results
+                           if r.error is not None)
+        return results
@@ -23,21 +23,59 @@ class UnsupportedVersion(Exception):
     pass
 
 
+class UnsupportedDecoder(Exception):
+    """Indicates that the requested JSON decoder is not supported or
+    cannot be imported."""
+    pass
+
+
 class CommandError(Exception):
     """Indicates an error on the command that the user provided."""
     pass
 
 
+class ConnectionRefused(Exception):
+    """
+    Connection refused: the server refused the connection.
+    """
+    def __init__(self, response=None):
+        self.response = response
+
+    def __str__(self):
+        return "ConnectionRefused: %s" % repr(self.response)
+
+
+class CircuitOpen(Exception):
+    """Indicates that an endpoint kept failing, so requests to it are
+    failing fast without being sent."""
+    pass
+
+
+class WaitTimeout(Exception):
+    """Indicates that the instances did not reach the expected state in
+    time."""
+    pass
+
+
+class InvalidResponse(Exception):
+    """Indicates that a response of the server lacks something expected,
+    like the location of a new resource."""
+    pass
+
+
 class ClientException(Exception):
     """
     The base exception class for all exceptions this library raises.
     """
     def __init__(self, code, message=None, details=None, request_id=None,
-                 url=None, method=None):
+                 url=None, method=None, retry_after=None):
         self.code = code
         self.message = message or self.__class__.message
         self.details = details
         self.request_id = request_id
+        self.url = url
+        self.method = method
+        self.retry_after = retry_after
 
     def __str__(self):
         formatted_string = "%s (HTTP %s)" % (self.message, self.code)
@@ -88,6 +126,14 @@ class OverLimit(ClientException):
     message = "Over limit"
 
 
+class TooManyRequests(ClientException):
+    """
+    HTTP 429 - Too many requests: you're over the API rate limit.
+    """
+    http_status = 429
+    message = "Too many requests"
+
+
 # NotImplemented is a python keyword.
 class HTTPNotImplemented(ClientException):
     """
@@ -96,6 +142,31 @@ class HTTPNotImplemented(ClientException):
     http_status = 501
     message = "Not Implemented"
 
+
+class BadGateway(ClientException):
+    """
+    HTTP 502 - Bad gateway: the server got an invalid upstream response.
+    """
+    http_status = 502
+    message = "Bad gateway"
+
+
+class ServiceUnavailable(ClientException):
+    """
+    HTTP 503 - Service unavailable: the server is temporarily unavailable.
+    """
+    http_status = 503
+    message = "Service unavailable"
+
+
+class GatewayTimeout(ClientException):
+    """
+    HTTP 504 - Gateway timeout: the server did not get a timely upstream
+    response.
+    """
+    http_status = 504
+    message = "Gateway timeout"
+
 # In Python 2.4 Exception is old-style and thus doesn't have a __subclasses__()
 # so we can do this:
 #     _code_map = dict((c.http_status, c)
@@ -103,7 +174,8 @@ class HTTPNotImplemented(ClientException):
 #
 # Instead, we have to hardcode it:
 _error_classes = [BadRequest, Unauthorized, Forbidden, NotFound,
-                  OverLimit, HTTPNotImplemented]
+                  OverLimit, TooManyRequests, HTTPNotImplemented, BadGateway,
+                  ServiceUnavailable, GatewayTimeout]
 _code_map = dict((c.http_status, c) for c in _error_classes)
 
 
@@ -0,0 +1,225 @@
+# Copyright 2013 Spanish National Research Council (CSIC)
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+
+"""
+Output formatters for the command line.
+
+Every formatter writes the rows as soon as they are given, so that long
+listings are printed while they are being retrieved, without keeping them
+in memory.
+"""
+
+import csv
+import sys
+
+try:
+    import json
+except ImportError:
+    import simplejson as json
+
+FORMATS = ("table", "json", "jsonl", "csv", "value")
+DEFAULT_FORMAT = "table"
+
+
+def _text(value):
+    if value is None:
+        return u""
+    elif isinstance(value, (list, tuple)):
+        return u", ".join(_text(v) for v in value)
+    elif isinstance(value, str):
+        return value.decode("utf-8", "replace")
+    return unicode(value)
+
+
+class Formatter(object):
+    """Write rows with the values of fields to stream."""
+
+    def __init__(self, fields, stream=None):
+        self.fields = list(fields)
+        self.stream = stream or sys.stdout
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _write(self, text):
+        self.stream.write(text.encode("utf-8"))
+
+    def write(self, row):
+        """Write a row, a list with the values of the fields."""
+        raise NotImplementedError()
+
+    def write_all(self, rows):
+        for row in rows:
+            self.write(row)
+
+    def close(self):
+        self.stream.flush()
+
+
+class TableFormatter(Formatter):
+    """Write a table with bounded column widths.
+
+    Unless the widths of the columns are given, they are those of the
+    longest values of the first buffer_rows rows (so short tables are like
+    the ones from PrettyTable, without truncating anything), up to
+    max_width characters if set. Only the values of the rows that come
+    afterwards are truncated to fit in them.
+    """
+
+    def __init__(self, fields, stream=None, widths=None, buffer_rows=100,
+                 max_width=None):
+        super(TableFormatter, self).__init__(fields, stream)
+        self.buffer_rows = buffer_rows
+        self.max_width = max_width
+        self.widths = None
+        self._rows = []
+        if widths is not None:
+            self.widths = list(widths)
+            self._start()
+
+    def _border(self):
+        dashes = [u"-" * (width + 2) for width in self.widths]
+        self._write(u"+%s+\n" % u"+".join(dashes))
+
+    def _write_row(self, values):
+        cells = []
+        for value, width in zip(values, self.widths):
+            if len(value) > width:
+                if width > 3:
+                    value = value[:width - 3] + u"..."
+                else:
+                    value = value[:width]
+            cells.append(u" %s " % value.ljust(width))
+        self._write(u"|%s|\n" % u"|".join(cells))
+
+    def _start(self):
+        if self.widths is None:
+            rows = [self.fields] + self._rows
+            self.widths = [max(len(row[i]) for row in rows)
+                           for i in range(len(self.fields))]
+            if self.max_width:
+                self.widths = [min(width, self.max_width)
+                               for width in self.widths]
+        self._border()
+        self._write_row(self.fields)
+        self._border()
+        for row in self._rows:
+            self._write_row(row)
+        self._rows = None
+
+    def write(self, row):
+        row = [_text(value) for value in row]
+        if self.widths is None:
+            self._rows.append(row)
+            if len(self._rows) >= self.buffer_rows:
+                self._start()
+        else:
+            self._write_row(row)
+
+    def close(self):
+        if self.widths is None:
+            self._start()
+        self._border()
+        super(TableFormatter, self).close()
+
+
+class JSONFormatter(Formatter):
+    """Write a JSON array with an object for every row."""
+
+    def __init__(self, fields, stream=None):
+        super(JSONFormatter, self).__init__(fields, stream)
+        self._count = 0
+
+    def write(self, row):
+        self._write(u"[\n" if self._count == 0 else u",\n")
+        self._write(json.dumps(dict(zip(self.fields, row)), sort_keys=True,
+                               default=_text))
+        self._count += 1
+
+    def close(self):
+        self._write(u"\n]\n" if self._count else u"[]\n")
+        super(JSONFormatter, self).close()
+
+
+class JSONLinesFormatter(Formatter):
+    """Write a JSON object for every row, one per line."""
+
+    def write(self, row):
+        self._write(json.dumps(dict(zip(self.fields, row)), sort_keys=True,
+                               default=_text) + u"\n")
+
+
+class CSVFormatter(Formatter):
+    """Write the rows as CSV, with the fields as header."""
+
+    def __init__(self, fields, stream=None):
+        super(CSVFormatter, self).__init__(fields, stream)
+        self._writer = csv.writer(self.stream)
+        self._writer.writerow([_text(f).encode("utf-8") for f in self.fields])
+
+    def write(self, row):
+        self._writer.writerow([_text(v).encode("utf-8") for v in row])
+
+
+class ValueFormatter(Formatter):
+    """Write the values of every row, separated by spaces."""
+
+    def write(self, row):
+        self._write(u" ".join(_text(v) for v in row) + u"\n")
+
+
+_FORMATTERS = {
+    "table": TableFormatter,
+    "json": JSONFormatter,
+    "jsonl": JSONLinesFormatter,
+    "csv": CSVFormatter,
+    "value": ValueFormatter,
+}
+
+
+def get_formatter(name, fields, stream=None, widths=None):
+    """Return a formatter for the fields, in the named format.
+
+    widths are the widths of the columns of tables, computed from the first
+    rows if not given.
+    """
+    if name == "table":
+        return TableFormatter(fields, stream, widths=widths)
+    return _FORMATTERS[name](fields, stream)
+
+
+def write_rows(name, fields, rows, stream=None):
+    with get_formatter(name, fields, stream) as formatter:
+        formatter.write_all(rows)
+
+
+def write_dict(name, d, fields=("Property", "Value"), stream=None):
+    """Write a dictionary in the named (machine) format.
+
+    JSON formats write it as a single object, the others write a row for
+    every item.
+    """
+    stream = stream or sys.stdout
+    if name in ("json", "jsonl"):
+        indent = 4 if name == "json" else None
+        stream.write(json.dumps(d, sort_keys=True, indent=indent,
+                                separators=(",", ": "),
+                                default=_text) + "\n")
+        stream.flush()
+    else:
+        write_rows(name, fields, sorted(d.items()), stream)
@@ -0,0 +1,203 @@
+# Copyright 2013 Spanish National Research Council (CSIC)
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+
+"""
+Local inventory of the instances of the endpoints.
+"""
+
+import os
+import threading
+import time
+
+try:
+    import json
+except ImportError:
+    import simplejson as json
+
+DEFAULT_INVENTORY = "~/.pyocci/inventory.sqlite"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS instances (
+    endpoint TEXT NOT NULL,
+    id TEXT NOT NULL,
+    name TEXT,
+    hostname TEXT,
+    state TEXT,
+    image TEXT,
+    flavor TEXT,
+    addresses TEXT,
+    etag TEXT,
+    resource TEXT,
+    updated REAL,
+    state_since REAL,
+    PRIMARY KEY (endpoint, id)
+);
+CREATE INDEX IF NOT EXISTS instances_state ON instances (endpoint, state);
+CREATE INDEX IF NOT EXISTS instances_hostname
+    ON instances (endpoint, hostname);
+CREATE INDEX IF NOT EXISTS instances_image ON instances (endpoint, image);
+CREATE INDEX IF NOT EXISTS instances_flavor ON instances (endpoint, flavor);
+CREATE TABLE IF NOT EXISTS refreshes (
+    endpoint TEXT PRIMARY KEY,
+    refreshed REAL
+);
+"""
+
+# Columns that can be used to query the inventory (all of them indexed)
+QUERY_COLUMNS = ("id", "state", "hostname", "image", "flavor")
+
+
+class Inventory(object):
+    """Snapshot of the instances of several endpoints in a SQLite file.
+
+    Instances are keyed by endpoint and OCCI ID, and their state, hostname,
+    image and flavor are indexed. For every instance the time since it is in
+    its current state is kept, and for every endpoint the time of its last
+    refresh (see InstancesManager.refresh_inventory).
+    """
+
+    def __init__(self, path=None):
+        # Imported here so that the shell does not import it
+        # unless the inventory is used.
+        import sqlite3
+
+        self.path = os.path.expanduser(path or DEFAULT_INVENTORY)
+        dirname = os.path.dirname(self.path)
+        if dirname and not os.path.isdir(dirname):
+            os.makedirs(dirname, 0o700)
+
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(self.path, check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        os.chmod(self.path, 0o600)
+        with self._lock:
+            self._db.executescript(_SCHEMA)
+
+    def close(self):
+        self._db.close()
+
+    def refreshed(self, endpoint):
+        """Return when the endpoint was last refreshed, or None."""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT refreshed FROM refreshes WHERE endpoint = ?",
+                (endpoint,)).fetchone()
+        return row and row["refreshed"]
+
+    def etags(self, endpoint):
+        """Return the {id: etag} of the instances of the endpoint."""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT id, etag FROM instances WHERE endpoint = ?",
+                (endpoint,)).fetchall()
+        return dict((row["id"], row["etag"]) for row in rows)
+
+    def states(self, endpoint):
+        """Return the {id: state} of the instances of the endpoint."""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT id, state FROM instances WHERE endpoint = ?",
+                (endpoint,)).fetchall()
+        return dict((row["id"], row["state"]) for row in rows)
+
+    def update(self, endpoint, instances, ids):
+        """Store a refresh of the endpoint.
+
+        instances is a list of (Compute, etag) with the instances that may
+        have changed, and ids the OCCI IDs of all the instances of the
+        endpoint (the ones not included are removed). Returns the IDs of the
+        instances that are new or whose resource or etag changed.
+        """
+        now = time.time()
+        changed = set()
+        with self._lock:
+            with self._db:
+                stored = dict(
+                    (row["id"], (row["resource"], row["etag"]))
+                    for row in self._db.execute(
+                        "SELECT id, resource, etag FROM instances "
+                        "WHERE endpoint = ?", (endpoint,)))
+                for instance, etag in instances:
+                    # The keys are sorted so that the same
+                    # resource is always stored as the same string.
+                    resource = json.dumps(instance.raw, sort_keys=True)
+                    if stored.get(instance.id) == (resource, etag):
+                        continue
+                    changed.add(instance.id)
+                    image = instance.image
+                    flavor = instance.flavor
+                    self._db.execute(
+                        "INSERT OR REPLACE INTO instances VALUES "
+                        "(?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, "
+                        " COALESCE((SELECT state_since FROM instances "
+                        "           WHERE endpoint = ? AND id = ? AND "
+                        "           state IS ?), ?))",
+                        (endpoint, instance.id, instance.name,
+                         instance.hostname, instance.state,
+                         image and image.term, flavor and flavor.term,
+                         json.dumps(instance.addresses), etag,
+                         resource, now,
+                         endpoint, instance.id, instance.state, now))
+
+                ids = set(ids)
+                self._db.executemany(
+                    "DELETE FROM instances WHERE endpoint = ? AND id = ?",
+                    [(endpoint, i) for i in set(stored) - ids])
+                self._db.executemany(
+                    "UPDATE instances SET updated = ? "
+                    "WHERE endpoint = ? AND id = ?",
+                    [(now, endpoint, i) for i in ids - changed])
+                self._db.execute(
+                    "INSERT OR REPLACE INTO refreshes VALUES (?, ?)",
+                    (endpoint, now))
+        return changed
+
+    def query(self, endpoints=None, state_for=None, **filters):
+        """Get the instances of the endpoints (all if None) as dicts.
+
+        filters are column=value pairs of QUERY_COLUMNS, and state_for a
+        minimum amount of seconds in the current state. Instances are sorted
+        by endpoint and ID.
+        """
+        where = []
+        params = []
+        if endpoints is not None:
+            where.append("endpoint IN (%s)" % ", ".join("?" * len(endpoints)))
+            params.extend(endpoints)
+        for column, value in sorted(filters.items()):
+            if column not in QUERY_COLUMNS:
+                raise ValueError("Cannot query the inventory by '%s'" %
+                                 column)
+            where.append("%s = ?" % column)
+            params.append(value)
+        if state_for is not None:
+            where.append("state_since <= ?")
+            params.append(time.time() - state_for)
+
+        sql = "SELECT * FROM instances"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY endpoint, id"
+
+        with self._lock:
+            rows = self._db.execute(sql, params).fetchall()
+
+        instances = []
+        for row in rows:
+            instance = dict(zip(row.keys(), row))
+            instance["addresses"] = json.loads(instance["addresses"] or "[]")
+            instance["resource"] = json.loads(instance["resource"] or "{}")
+            instances.append(instance)
+        return instances
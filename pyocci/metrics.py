@@ -0,0 +1,203 @@
+# Copyright 2013 Spanish National Research Council (CSIC)
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""
+Collection of metrics about the requests performed by the clients.
+"""
+
+import os
+import threading
+import urlparse
+
+# Upper bounds (in seconds) of the latency histogram buckets
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+def url_template(url):
+    """Return the path of url with the resource IDs replaced by {id}.
+
+    Path segments with digits (but not version numbers like v2.0) are
+    considered IDs. The query string is dropped, except for the action.
+    """
+    parsed = urlparse.urlparse(url)
+    segments = []
+    for segment in parsed.path.split("/"):
+        if (any(c.isdigit() for c in segment) and
+                not (segment[:1] == "v" and segment[1:2].isdigit())):
+            segment = "{id}"
+        segments.append(segment)
+
+    template = "/".join(segments) or "/"
+    action = urlparse.parse_qs(parsed.query).get("action")
+    if action:
+        template += "?action=%s" % action[0]
+    return template
+
+
+class Histogram(object):
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        for idx, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[idx] += 1
+                break
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def cumulative(self):
+        """Return the (bound, count) pairs, Prometheus style."""
+        total = 0
+        pairs = []
+        for bound, count in zip(self.buckets, self.counts):
+            total += count
+            pairs.append((bound, total))
+        return pairs
+
+
+class MetricsCollector(object):
+    """Collect metrics from the hooks of one or more HTTPClients.
+
+    It records the latency of the requests per method and URL template,
+    the bytes sent and received, the retries, the (re)authentications and
+    the time spent decoding the responses.
+    """
+
+    def __init__(self):
+        self.latency = {}
+        self.bytes_out = 0
+        self.bytes_in = 0
+        self.requests = 0
+        self.errors = 0
+        self.retries = 0
+        self.auths = 0
+        self.auth_time = 0.0
+        self.decode_count = 0
+        self.decode_time = 0.0
+        self._lock = threading.Lock()
+
+    def install(self, http_client):
+        http_client.add_hook("pre_request", self._pre_request)
+        http_client.add_hook("post_response", self._post_response)
+        http_client.add_hook("auth", self._auth)
+        http_client.add_hook("decode", self._decode)
+
+    def _pre_request(self, method, url, attempt, kwargs):
+        data = kwargs.get("data") or ""
+        with self._lock:
+            self.bytes_out += len(data)
+            if attempt:
+                self.retries += 1
+
+    def _post_response(self, method, url, attempt, elapsed, stream,
+                       response, error):
+        # The size of the streamed responses is only known
+        # once they are read, see _decode().
+        size = 0
+        if response is not None and not stream:
+            size = len(response.content)
+
+        key = (method, url_template(url))
+        with self._lock:
+            self.requests += 1
+            if response is None or response.status_code >= 400:
+                self.errors += 1
+            self.bytes_in += size
+            self.latency.setdefault(key, Histogram()).observe(elapsed)
+
+    def _auth(self, auth_type, elapsed, error):
+        with self._lock:
+            self.auths += 1
+            self.auth_time += elapsed
+
+    def _decode(self, media_type, elapsed, size, stream):
+        with self._lock:
+            self.decode_count += 1
+            self.decode_time += elapsed
+            if stream:
+                self.bytes_in += size
+
+    def summary(self):
+        """Return a human readable summary of the metrics."""
+        lines = ["%-7s %-32s %6s %9s %9s %9s" %
+                 ("Method", "URL", "Count", "Avg (ms)", "Max (ms)",
+                  "Total (s)")]
+        for (method, template), hist in sorted(self.latency.items()):
+            lines.append("%-7s %-32s %6d %9.1f %9.1f %9.3f" %
+                         (method, template, hist.count,
+                          hist.sum / hist.count * 1000, hist.max * 1000,
+                          hist.sum))
+        lines.append("")
+        lines.append("Requests: %d (%d errors, %d retries)" %
+                     (self.requests, self.errors, self.retries))
+        lines.append("Bytes sent: %d, received: %d" %
+                     (self.bytes_out, self.bytes_in))
+        lines.append("Authentications: %d (%.3f s)" %
+                     (self.auths, self.auth_time))
+        lines.append("Decoded responses: %d (%.3f s)" %
+                     (self.decode_count, self.decode_time))
+        return "\n".join(lines)
+
+    def prometheus(self):
+        """Return the metrics in the Prometheus text exposition format."""
+        lines = [
+            "# HELP pyocci_request_duration_seconds Latency of the "
+            "HTTP requests.",
+            "# TYPE pyocci_request_duration_seconds histogram",
+        ]
+        for (method, template), hist in sorted(self.latency.items()):
+            labels = 'method="%s",url="%s"' % (method, template)
+            for bound, count in hist.cumulative():
+                lines.append('pyocci_request_duration_seconds_bucket'
+                             '{%s,le="%s"} %d' % (labels, bound, count))
+            lines.append('pyocci_request_duration_seconds_bucket'
+                         '{%s,le="+Inf"} %d' % (labels, hist.count))
+            lines.append("pyocci_request_duration_seconds_sum{%s} %f" %
+                         (labels, hist.sum))
+            lines.append("pyocci_request_duration_seconds_count{%s} %d" %
+                         (labels, hist.count))
+
+        counters = (
+            ("requests_total", "HTTP requests sent.", self.requests),
+            ("request_errors_total", "HTTP requests failed.", self.errors),
+            ("retries_total", "HTTP requests retried.", self.retries),
+            ("sent_bytes_total", "Bytes sent in request bodies.",
+             self.bytes_out),
+            ("received_bytes_total", "Bytes received in response bodies.",
+             self.bytes_in),
+            ("auth_total", "Authentications performed.", self.auths),
+            ("auth_seconds_total", "Time spent authenticating.",
+             self.auth_time),
+            ("decode_total", "Responses decoded.", self.decode_count),
+            ("decode_seconds_total", "Time spent decoding responses.",
+             self.decode_time),
+        )
+        for name, description, value in counters:
+            lines.append("# HELP pyocci_%s %s" % (name, description))
+            lines.append("# TYPE pyocci_%s counter" % name)
+            lines.append("pyocci_%s %s" % (name, value))
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path):
+        """Write the metrics atomically, e.g. for the node exporter."""
+        tmp = "%s.%d" % (path, os.getpid())
+        with open(tmp, "w") as f:
+            f.write(self.prometheus())
+        os.rename(tmp, path)
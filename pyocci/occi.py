@@ -12,8 +12,35 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 
+COMPUTE_KIND = ("http://schemas.ogf.org/occi/infrastructure#", "compute")
+COMPUTE_ACTION_SCHEME = \
+    "http://schemas.ogf.org/occi/infrastructure/compute/action#"
+COMPUTE_ACTIONS = ("start", "stop", "restart", "suspend")
+
 CATEGORIES = {
     "flavor": "http://schemas.ogf.org/occi/infrastructure#resource_tpl",
     "image": "http://schemas.ogf.org/occi/infrastructure#os_tpl",
     "network": "http://schemas.ogf.org/occi/core#link",
 }
+
+
+def quote(value):
+    """Render a value as an OCCI quoted string."""
+    return '"%s"' % unicode(value).replace("\\", "\\\\").replace('"', '\\"')
+
+
+def render_category(scheme, term, cls):
+    """Render a category for a text/occi Category header."""
+    return "%s; scheme=%s; class=%s" % (term, quote(scheme), quote(cls))
+
+
+def render_attributes(attributes):
+    """Render a dict of attributes for a text/occi X-OCCI-Attribute."""
+    rendered = []
+    for key, value in sorted(attributes.items()):
+        if isinstance(value, basestring):
+            value = quote(value)
+        elif isinstance(value, bool):
+            value = str(value).lower()
+        rendered.append("%s=%s" % (key, value))
+    return ", ".join(rendered)
@@ -0,0 +1,479 @@
+# Copyright 2013 Spanish National Research Council (CSIC)
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""
+Parsers for the OCCI renderings.
+"""
+
+import re
+import sys
+
+try:
+    import json
+except ImportError:
+    import simplejson as json
+
+from pyocci import exceptions
+
+# Media types of the renderings
+OCCI_JSON = "application/occi+json"
+TEXT_OCCI = "text/occi"
+TEXT_PLAIN = "text/plain"
+URI_LIST = "text/uri-list"
+
+# Renderings we can parse, by order of preference
+DEFAULT_ACCEPT = "%s,%s;q=0.5,%s;q=0.3" % (OCCI_JSON, TEXT_OCCI, TEXT_PLAIN)
+
+LINK = "http://schemas.ogf.org/occi/core#link"
+
+# Modules that can be used to decode JSON documents. All of them provide a
+# loads() function that accepts the raw bytes of the document.
+JSON_DECODERS = ("json", "simplejson", "ujson", "orjson")
+
+_WHITESPACE = " \t\n\r"
+_raw_decode = json.JSONDecoder().raw_decode
+
+# Characters that may end a number, true, false or null
+_SCALAR_END = re.compile(r'[\s,\]}]')
+# Anything up to the next bracket that is not inside a string
+_NEXT_BRACKET = re.compile(r'(?:[^"{}\[\]]|"(?:[^"\\]|\\.)*")*([{}\[\]])')
+
+
+def media_type(content_type):
+    """Return the media type of a Content-Type, without its parameters."""
+    return (content_type or "").split(";", 1)[0].strip().lower()
+
+
+def iter_lines(chunks):
+    """Split an iterable of strings (e.g. a response body) into lines."""
+    pending = ""
+    for chunk in chunks:
+        pending += chunk
+        lines = pending.splitlines()
+        if lines and pending[-1] not in "\r\n":
+            pending = lines.pop()
+        else:
+            pending = ""
+        for line in lines:
+            yield line
+    if pending:
+        yield pending
+
+
+def iter_uri_list(lines):
+    """Parse a text/uri-list (RFC 2483), yielding the URIs it contains."""
+    for line in lines:
+        line = line.strip()
+        if line and not line.startswith("#"):
+            yield line
+
+
+def parse_uri_list(content):
+    return list(iter_uri_list(content.splitlines()))
+
+
+def get_json_decoder(name="json"):
+    """Return the loads() function of the named JSON module."""
+    if name not in JSON_DECODERS:
+        msg = "Invalid JSON decoder '%s'. must be one of: %s" % (
+              (name, ', '.join(JSON_DECODERS)))
+        raise exceptions.UnsupportedDecoder(msg)
+    try:
+        module = __import__(name)
+    except ImportError:
+        raise exceptions.UnsupportedDecoder("JSON decoder '%s' is not "
+                                            "installed" % name)
+    return module.loads
+
+
+def _string_end(buf, pos):
+    """Return the end of the JSON string starting at pos, or None."""
+    while True:
+        pos = buf.find('"', pos + 1)
+        if pos == -1:
+            return None
+        escapes = 0
+        while buf[pos - 1 - escapes] == "\\":
+            escapes += 1
+        if escapes % 2 == 0:
+            return pos + 1
+
+
+def _value_end(buf, pos):
+    """Return the end of the JSON value starting at pos, or None.
+
+    The value is not decoded nor validated, only its delimiters are found.
+    None is returned if the value is not complete in buf.
+    """
+    char = buf[pos]
+    if char == '"':
+        return _string_end(buf, pos)
+    elif char not in "{[":
+        match = _SCALAR_END.search(buf, pos)
+        return match and match.start()
+
+    depth = 0
+    while True:
+        match = _NEXT_BRACKET.match(buf, pos)
+        if match is None:
+            return None
+        pos = match.end()
+        if match.group(1) in "{[":
+            depth += 1
+        else:
+            depth -= 1
+            if depth == 0:
+                return pos
+
+
+def _balanced_end(buf, pos):
+    """Return the end of the brackets opened at pos, ignoring strings."""
+    opener = buf[pos]
+    closer = opener == "{" and "}" or "]"
+    opened = closed = 0
+    start = pos
+    while True:
+        end = buf.find(closer, start)
+        if end == -1:
+            return None
+        end += 1
+        opened += buf.count(opener, start, end)
+        closed += 1
+        start = end
+        if opened == closed:
+            return end
+
+
+def _raw_decoder(loads):
+    """Return a raw_decode(buf, pos) function that decodes with loads."""
+    if loads is None or loads is json.loads:
+        return _raw_decode
+    # Modules like simplejson have their own raw_decode, that
+    # finds the end of the value while decoding it.
+    module = sys.modules.get(getattr(loads, "__module__", None))
+    decoder = getattr(module, "JSONDecoder", None)
+    if hasattr(decoder, "raw_decode"):
+        return decoder().raw_decode
+
+    def raw_decode(buf, pos):
+        # Counting the brackets is much faster than scanning
+        # the value, but it is wrong if there are brackets in its strings
+        # (then it does not decode, and it is scanned).
+        if buf[pos] in "{[":
+            end = _balanced_end(buf, pos)
+            if end is not None:
+                try:
+                    return loads(buf[pos:end]), end
+                except ValueError:
+                    pass
+        end = _value_end(buf, pos)
+        if end is None:
+            raise ValueError("Incomplete JSON value at position %d" % pos)
+        return loads(buf[pos:end]), end
+    return raw_decode
+
+
+def iter_json_array(chunks, loads=None):
+    """Incrementally decode a JSON array, yielding one element at a time.
+
+    chunks is an iterable of strings, like Response.iter_content(). Only the
+    element being decoded and the current chunk are kept in memory, so the
+    memory used does not depend on the length of the array. If the document
+    is not an array it is decoded as a whole and yielded (or, if it is a
+    list, its items are).
+
+    loads is the function used to decode the elements (see
+    get_json_decoder), json.loads if None.
+    """
+    raw_decode = _raw_decoder(loads)
+    loads = loads or json.loads
+    chunks = iter(chunks)
+    buf = ""
+    pos = 0
+    eof = False
+    # What we expect to find next: "[" (start of the array), "value" (an
+    # element or, if it is the first one, the end of the array) or ","
+    # (a separator or the end of the array).
+    expect = "["
+    first = True
+
+    while True:
+        while pos < len(buf) and buf[pos] in _WHITESPACE:
+            pos += 1
+
+        if pos < len(buf):
+            char = buf[pos]
+            if expect == "[":
+                if char != "[":
+                    break
+                pos += 1
+                expect = "value"
+                continue
+            elif expect == ",":
+                if char == "]":
+                    return
+                elif char != ",":
+                    raise ValueError("Expecting , delimiter at position %d" %
+                                     pos)
+                pos += 1
+                expect = "value"
+                continue
+            elif first and char == "]":
+                return
+
+            try:
+                value, end = raw_decode(buf, pos)
+            except ValueError:
+                end = None
+            else:
+                # A value is only complete if it is followed by
+                # a delimiter, otherwise it may be a truncated number.
+                while end < len(buf) and buf[end] in _WHITESPACE:
+                    end += 1
+                if not eof and (end == len(buf) or buf[end] not in ",]"):
+                    end = None
+            if end is not None:
+                yield value
+                pos = end
+                expect = ","
+                first = False
+                continue
+        elif eof and expect == "[":
+            # Empty document
+            return
+
+        if eof:
+            raise ValueError("Truncated or invalid JSON array")
+
+        try:
+            chunk = next(chunks)
+        except StopIteration:
+            eof = True
+        else:
+            buf = buf[pos:] + chunk
+            pos = 0
+
+    body = loads(buf[pos:] + "".join(chunks))
+    if isinstance(body, list):
+        for item in body:
+            yield item
+    else:
+        yield body
+
+
+def _typed(value):
+    """Convert an unquoted attribute value into a number or boolean."""
+    if any(char.isdigit() for char in value):
+        for convert in (int, float):
+            try:
+                return convert(value)
+            except ValueError:
+                pass
+    return {"true": True, "false": False}.get(value, value)
+
+
+def tokenize(value):
+    """Split the value of an OCCI header in a single pass.
+
+    The value is made of comma separated elements, each one made of
+    semicolon separated parameters like 'term', '<target>', 'key=value' or
+    'key="quoted value"'. Returns a list with the parameters of every
+    element, as (key, value) tuples. key is None for bare parameters, and
+    unquoted values are converted into numbers and booleans if possible.
+    Delimiters inside quoted strings or <...> are ignored, and whitespace
+    outside them is skipped.
+    """
+    elements = []
+    params = []
+    key = None
+    buf = []
+    quoted = False
+    in_quotes = in_angle = escaped = False
+
+    for char in value + ",":
+        if in_quotes:
+            if escaped:
+                buf.append(char)
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_quotes = False
+            else:
+                buf.append(char)
+        elif in_angle:
+            buf.append(char)
+            if char == ">":
+                in_angle = False
+        elif char == '"':
+            in_quotes = quoted = True
+        elif char == "<":
+            in_angle = True
+            buf.append(char)
+        elif char == "=" and key is None:
+            key = "".join(buf)
+            buf = []
+        elif char == ";" or char == ",":
+            token = "".join(buf)
+            if key is not None:
+                params.append((key, token if quoted else _typed(token)))
+            elif token:
+                params.append((None, token))
+            key = None
+            buf = []
+            quoted = False
+            if char == "," and params:
+                elements.append(params)
+                params = []
+        elif char not in _WHITESPACE:
+            buf.append(char)
+
+    return elements
+
+
+def _split_locations(value):
+    # Locations are URLs, not OCCI parameters, so they may
+    # contain "=" or ";" and must not be tokenized.
+    return [i.strip() for i in value.split(",") if i.strip()]
+
+
+def _split_type(type_id):
+    """Split a category identifier into its scheme and term."""
+    scheme, sep, term = type_id.rpartition("#")
+    return scheme + sep, term
+
+
+def _parse_category(params):
+    category = {"term": params[0][1]}
+    for key, value in params[1:]:
+        if key == "rel":
+            category["related"] = value.split()
+        elif key in ("attributes", "actions"):
+            category[key] = value.split()
+        else:
+            category[key] = value
+    return category
+
+
+def _parse_link(params):
+    target = params[0][1].strip("<>")
+    link = {"target": target, "attributes": {}}
+    for key, value in params[1:]:
+        if key == "category":
+            categories = value.split()
+            scheme, term = _split_type(categories[0])
+            link["kind"] = {"scheme": scheme, "term": term,
+                            "related": [LINK]}
+            link["mixins"] = [dict(zip(("scheme", "term"), _split_type(c)))
+                              for c in categories[1:]]
+        elif key in ("rel", "self"):
+            link[key] = value
+        else:
+            link["attributes"][key] = value
+    return link
+
+
+def parse_fields(fields):
+    """Build the resources from the OCCI fields of a text rendering.
+
+    fields maps the (lowercase) header names to their values. Returns the
+    same structures as the JSON rendering: a resource if there are
+    attributes, a list of categories for the query interface or a list of
+    locations for a collection. None is returned if there is nothing.
+    """
+    categories = [_parse_category(p)
+                  for v in fields.get("category", [])
+                  for p in tokenize(v)]
+    attributes = dict(param
+                      for v in fields.get("x-occi-attribute", [])
+                      for p in tokenize(v)
+                      for param in p)
+    links = [_parse_link(p)
+             for v in fields.get("link", [])
+             for p in tokenize(v)]
+    locations = [location
+                 for v in fields.get("x-occi-location", [])
+                 for location in _split_locations(v)]
+
+    if attributes:
+        resource = {
+            "kind": {},
+            "mixins": [],
+            "attributes": attributes,
+            "links": [],
+            "actions": [],
+        }
+        for category in categories:
+            if category.get("class") == "kind":
+                resource["kind"] = category
+            else:
+                resource["mixins"].append(category)
+        for link in links:
+            if "?action=" in link["target"]:
+                resource["actions"].append(link)
+            else:
+                resource["links"].append(link)
+        return resource
+    elif categories:
+        return categories
+    elif locations:
+        return locations
+    return None
+
+
+_HEADERS = ("category", "link", "x-occi-attribute", "x-occi-location")
+
+
+def parse_text_occi(headers):
+    """Parse the text/occi rendering from the response headers."""
+    fields = dict((h, [headers[h]]) for h in _HEADERS if h in headers)
+    return parse_fields(fields)
+
+
+def _iter_fields(lines):
+    for line in lines:
+        name, sep, value = line.partition(":")
+        name = name.strip().lower()
+        if sep and name in _HEADERS:
+            yield name, value
+
+
+def parse_text_plain(content):
+    """Parse the text/plain rendering from the response body."""
+    fields = {}
+    for name, value in _iter_fields(content.splitlines()):
+        fields.setdefault(name, []).append(value)
+    return parse_fields(fields)
+
+
+def iter_text_plain(lines):
+    """Incrementally parse the text/plain rendering.
+
+    The locations of a collection are yielded as soon as they are read.
+    Any other rendering is parsed once all the lines are read.
+    """
+    fields = {}
+    for name, value in _iter_fields(lines):
+        if name == "x-occi-location":
+            for location in _split_locations(value):
+                yield location
+        else:
+            fields.setdefault(name, []).append(value)
+
+    body = parse_fields(fields)
+    if isinstance(body, list):
+        for item in body:
+            yield item
+    elif body is not None:
+        yield body
@@ -0,0 +1,129 @@
+# Copyright 2013 Spanish National Research Council (CSIC)
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""
+Client side rate limiting of the HTTP requests.
+"""
+
+import threading
+import time
+import urlparse
+
+# Responses meaning that the server is throttling us
+THROTTLE_STATUSES = (413, 429, 503)
+
+
+class TokenBucket(object):
+    """Allow up to rate requests per second, with bursts of burst requests.
+
+    It is safe to share a bucket between threads.
+    """
+
+    def __init__(self, rate, burst=None):
+        self.rate = float(rate)
+        self.burst = burst or max(1.0, self.rate)
+        self.tokens = self.burst
+        self.updated = time.time()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        # Must be called with the lock held
+        self.tokens = min(self.burst,
+                          self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self):
+        """Wait until a request can be sent."""
+        while True:
+            with self._lock:
+                self._refill(time.time())
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def update(self, status):
+        """Take into account the status of a response."""
+        pass
+
+
+class AdaptiveTokenBucket(TokenBucket):
+    """A TokenBucket adapting its rate to the server (AIMD).
+
+    When the server throttles us (413, 429 or 503) the rate is multiplied
+    by decrease (but not more than once per cooldown seconds, as the
+    requests already sent are likely throttled too). Each successful
+    response increases the rate by increase / rate, so the rate grows by
+    about increase requests per second every second, up to max_rate.
+    """
+
+    def __init__(self, rate, burst=None, min_rate=0.5, max_rate=None,
+                 increase=1.0, decrease=0.5, cooldown=1.0):
+        super(AdaptiveTokenBucket, self).__init__(rate, burst=burst)
+        self.min_rate = min_rate
+        self.max_rate = max_rate or self.rate * 10
+        self.increase = increase
+        self.decrease = decrease
+        self.cooldown = cooldown
+        self.decreased = 0
+
+    def update(self, status):
+        with self._lock:
+            now = time.time()
+            self._refill(now)
+            if status in THROTTLE_STATUSES:
+                if now - self.decreased >= self.cooldown:
+                    self.rate = max(self.min_rate, self.rate * self.decrease)
+                    self.tokens = min(self.tokens, 0)
+                    self.decreased = now
+            elif status < 400:
+                self.rate = min(self.max_rate,
+                                self.rate + self.increase / self.rate)
+
+
+class RateLimiter(object):
+    """One TokenBucket per endpoint (scheme, host and port).
+
+    Every endpoint is limited to rate requests per second, unless a
+    different rate is given for its host[:port] in rates (if rate is None,
+    only the endpoints in rates are limited). If adaptive is True, the rate
+    of each endpoint adapts to the throttling responses (see
+    AdaptiveTokenBucket). It can be shared by several clients.
+    """
+
+    def __init__(self, rate, burst=None, adaptive=False, rates=None):
+        self.rate = rate
+        self.burst = burst
+        self.adaptive = adaptive
+        self.rates = rates or {}
+
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def get(self, url):
+        """Return the bucket of the endpoint of url, or None if unlimited."""
+        parsed = urlparse.urlparse(url)
+        key = (parsed.scheme, parsed.netloc)
+        with self._lock:
+            if key not in self._buckets:
+                rate = self.rates.get(parsed.netloc, self.rate)
+                if not rate:
+                    bucket = None
+                elif self.adaptive:
+                    bucket = AdaptiveTokenBucket(rate, burst=self.burst)
+                else:
+                    bucket = TokenBucket(rate, burst=self.burst)
+                self._buckets[key] = bucket
+            return self._buckets[key]
@@ -0,0 +1,156 @@
+# Copyright 2013 Spanish National Research Council (CSIC)
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""
+Retry policy and circuit breaker for the HTTP requests.
+"""
+
+import calendar
+import email.utils
+import random
+import threading
+import time
+import urlparse
+
+from pyocci import exceptions
+
+# Methods that can be safely repeated
+IDEMPOTENT_METHODS = ("GET", "HEAD", "PUT", "DELETE", "OPTIONS")
+
+# Responses worth retrying, as the server may answer differently later
+RETRY_STATUSES = (413, 429, 502, 503, 504)
+
+# Responses counted as failures of the endpoint by the circuit breakers
+FAILURE_STATUSES = (502, 503, 504)
+
+
+def parse_retry_after(value):
+    """Return the seconds to wait from a Retry-After header, or None."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        date = email.utils.parsedate(value)
+        if date is None:
+            return None
+        return max(0.0, calendar.timegm(date) - time.time())
+
+
+class RetryPolicy(object):
+    """When and how long to wait before repeating a failed request.
+
+    Only idempotent methods are retried, up to retries times, when the
+    connection fails (except for SSL errors, see HTTPClient._send) or times
+    out or when the response status is one of statuses. The delay before
+    the n-th retry is chosen at random between 0 and backoff * 2 ** n
+    seconds (capped to max_backoff), unless the server asks for a given
+    delay with a Retry-After header. Requests are not retried if the server
+    asks to wait more than max_backoff.
+    """
+
+    def __init__(self, retries=3, backoff=0.5, max_backoff=30,
+                 statuses=RETRY_STATUSES, methods=IDEMPOTENT_METHODS):
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.statuses = statuses
+        self.methods = methods
+
+    def get_delay(self, method, attempt, status=None, retry_after=None):
+        """Return the seconds to wait before retrying, or None to give up.
+
+        attempt is the number of retries already performed. status is the
+        status of the response, or None if the request did not get one.
+        """
+        if method.upper() not in self.methods or attempt >= self.retries:
+            return None
+        if status is not None and status not in self.statuses:
+            return None
+
+        retry_after = parse_retry_after(retry_after)
+        if retry_after is not None:
+            if retry_after > self.max_backoff:
+                return None
+            return retry_after
+
+        return random.uniform(0, min(self.max_backoff,
+                                     self.backoff * 2 ** attempt))
+
+
+class CircuitBreaker(object):
+    """Fail fast when an endpoint keeps failing.
+
+    After failure_threshold consecutive failures the circuit opens: calls
+    fail with exceptions.CircuitOpen, without being sent, for reset_timeout
+    seconds. Then a single trial call is let through. If it succeeds the
+    circuit is closed again, otherwise it is open for another reset_timeout.
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+
+        self.failures = 0
+        self.opened_at = None
+        self._trial = False
+        self._lock = threading.Lock()
+
+    def before_call(self, url):
+        with self._lock:
+            if self.opened_at is None:
+                return
+            elapsed = time.time() - self.opened_at
+            if elapsed >= self.reset_timeout and not self._trial:
+                self._trial = True
+                return
+        raise exceptions.CircuitOpen(
+            "Endpoint for %s is failing, not sending requests for %d more "
+            "seconds" % (url, max(1, self.reset_timeout - elapsed)))
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._trial or self.failures >= self.failure_threshold:
+                self.opened_at = time.time()
+            self._trial = False
+
+
+class CircuitBreakers(object):
+    """One CircuitBreaker per endpoint (scheme, host and port).
+
+    It can be shared by several clients talking to the same endpoints.
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+
+        self._breakers = {}
+        self._lock = threading.Lock()
+
+    def get(self, url):
+        parsed = urlparse.urlparse(url)
+        key = (parsed.scheme, parsed.netloc)
+        with self._lock:
+            if key not in self._breakers:
+                self._breakers[key] = CircuitBreaker(self.failure_threshold,
+                                                     self.reset_timeout)
+            return self._breakers[key]
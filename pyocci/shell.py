@@ -18,17 +18,36 @@ OCCI Command Line Client
 
 from __future__ import print_function
 import argparse
+import importlib
 import logging
+import shlex
+import signal
+import StringIO
 import sys
 
+try:
+    import json
+except ImportError:
+    import simplejson as json
+
 import pyocci
-from pyocci import client
+from pyocci import agent
+from pyocci import cache
 from pyocci import exceptions
+from pyocci import formatters
+from pyocci import inventory
+from pyocci import parsers
 from pyocci import utils
-from pyocci.v1_1 import shell as shell_v1_1
 
 DEFAULT_OCCI_API_VERSION = 1.1
 
+# The shell modules are imported when a command is run, so that
+# --help, --version and the shell completion do not need to import them (and
+# everything they use).
+ACTIONS_MODULES = {
+    '1.1': 'pyocci.v1_1.shell',
+}
+
 logger = logging.getLogger(__name__)
 
 
@@ -37,7 +56,50 @@ class OcciArgumentParser(argparse.ArgumentParser):
         super(OcciArgumentParser, self).__init__(*args, **kwargs)
 
 
+class _Token(str):
+    """A command line argument, that is found by identity (not by value)."""
+    pass
+
+
+class TaggedStream(object):
+    """Prefix every line written to stream with a tag."""
+
+    def __init__(self, stream, tag):
+        self.stream = stream
+        self.tag = tag
+        self._partial = ""
+
+    def write(self, data):
+        lines = (self._partial + data).split("\n")
+        self._partial = lines.pop()
+        for line in lines:
+            self.stream.write("%s\t%s\n" % (self.tag, line))
+
+    def writelines(self, lines):
+        for line in lines:
+            self.write(line)
+
+    def flush(self):
+        if self._partial:
+            self.stream.write("%s\t%s\n" % (self.tag, self._partial))
+            self._partial = ""
+        self.stream.flush()
+
+    def isatty(self):
+        return False
+
+
 class OcciShell(object):
+    # Commands that cannot be run from batch or interactive mode
+    SESSION_COMMANDS = ('agent', 'batch', 'interactive')
+
+    def __init__(self, client_cache=None):
+        # If client_cache (a dict) is given, clients are stored
+        # in it and reused by the commands using the same options, as the
+        # agent does.
+        self.client_cache = client_cache
+        self.global_argv = []
+
     def get_parser(self):
         parser = OcciArgumentParser(
             prog="pyocci",
@@ -77,10 +139,31 @@ class OcciShell(object):
         )
 
         # Connection arguments
+        # The default is set later, otherwise the URLs given
+        # would be appended to it.
         parser.add_argument(
             '--endpoint-url',
-            default=utils.env('OCCI_ENDPOINT_URL'),
-            help='Defaults to env[OCCI_ENDPOINT_URL].'
+            action='append',
+            default=None,
+            help='Can be repeated to use several endpoints at once. '
+                 'Defaults to env[OCCI_ENDPOINT_URL].'
+        )
+
+        parser.add_argument(
+            '--endpoint-file',
+            metavar='<file>',
+            default=utils.env('OCCI_ENDPOINT_FILE', default=None),
+            help='Read the endpoint URLs from this file, one per line. '
+                 'Defaults to env[OCCI_ENDPOINT_FILE].'
+        )
+
+        parser.add_argument(
+            '--timeout',
+            metavar='<seconds>',
+            type=float,
+            default=utils.env('OCCI_TIMEOUT', default=None),
+            help='Timeout for the HTTP requests. '
+                 'Defaults to env[OCCI_TIMEOUT].'
         )
 
         parser.add_argument(
@@ -104,8 +187,7 @@ class OcciShell(object):
         parser.add_argument(
             "--auth-type",
             default="voms",
-            help=("One of %s. Defaults to 'voms'" %
-                  client.HTTPClient.auth_methods.keys())
+            help="Authentication method. Defaults to 'voms'"
         )
 
         parser.add_argument(
@@ -132,37 +214,212 @@ class OcciShell(object):
             help="Defaults to env[X509_USER_PROXY]"
         )
 
+        parser.add_argument(
+            "--json-decoder",
+            metavar="<decoder>",
+            choices=parsers.JSON_DECODERS,
+            default=utils.env("OCCI_JSON_DECODER", default="json"),
+            help="Module used to decode the JSON responses, one of %s. "
+                 "Defaults to env[OCCI_JSON_DECODER] or 'json'" %
+                 ", ".join(parsers.JSON_DECODERS)
+        )
+
+        parser.add_argument(
+            "--occi-token-cache",
+            metavar="<file>",
+            default=utils.env("OCCI_TOKEN_CACHE",
+                              default=cache.DEFAULT_TOKEN_CACHE),
+            help="File where the authentication tokens are cached. "
+                 "Defaults to env[OCCI_TOKEN_CACHE] or %s" %
+                 cache.DEFAULT_TOKEN_CACHE
+        )
+
+        parser.add_argument(
+            "--no-token-cache",
+            default=False,
+            action="store_true",
+            help="Do not read nor store the authentication token in the "
+                 "token cache"
+        )
+
+        parser.add_argument(
+            "--http-cache-dir",
+            metavar="<dir>",
+            default=utils.env("OCCI_HTTP_CACHE_DIR", default=None),
+            help="Cache the responses in this directory, revalidating them "
+                 "with conditional requests. Defaults to "
+                 "env[OCCI_HTTP_CACHE_DIR] (disabled if not set)"
+        )
+
+        parser.add_argument(
+            "--http-cache-ttl",
+            metavar="<seconds>",
+            type=float,
+            default=utils.env("OCCI_HTTP_CACHE_TTL", default=None),
+            help="Serve cached responses without contacting the server "
+                 "for this amount of seconds. Defaults to "
+                 "env[OCCI_HTTP_CACHE_TTL]"
+        )
+
+        parser.add_argument(
+            "--retries",
+            metavar="<N>",
+            type=int,
+            default=utils.env("OCCI_RETRIES", default=3),
+            help="Retry idempotent requests failing with transient errors "
+                 "up to this amount of times. Defaults to env[OCCI_RETRIES] "
+                 "or 3"
+        )
+
+        parser.add_argument(
+            "--circuit-breaker-threshold",
+            metavar="<N>",
+            type=int,
+            default=utils.env("OCCI_CIRCUIT_BREAKER_THRESHOLD", default=5),
+            help="Stop sending requests to an endpoint after this amount of "
+                 "consecutive failures (0 to disable). Defaults to "
+                 "env[OCCI_CIRCUIT_BREAKER_THRESHOLD] or 5"
+        )
+
+        parser.add_argument(
+            "--rate-limit",
+            metavar="<requests/s>",
+            type=float,
+            default=utils.env("OCCI_RATE_LIMIT", default=None),
+            help="Do not send more than this amount of requests per second "
+                 "to each endpoint. Defaults to env[OCCI_RATE_LIMIT] "
+                 "(unlimited if not set)"
+        )
+
+        parser.add_argument(
+            "--adaptive-rate-limit",
+            default=False,
+            action="store_true",
+            help="Lower the --rate-limit when the server throttles the "
+                 "requests, raising it slowly again afterwards"
+        )
+
+        parser.add_argument(
+            "--host-rate-limit",
+            metavar="<host[:port]=requests/s>",
+            dest="host_rate_limits",
+            action="append",
+            default=[],
+            help="Limit the requests to this host (and port) to a different "
+                 "rate than --rate-limit (can be repeated)"
+        )
+
+        parser.add_argument(
+            "--max-connections",
+            metavar="<N>",
+            type=int,
+            default=utils.env("OCCI_MAX_CONNECTIONS", default=10),
+            help="Connections to keep open to each endpoint, raised to the "
+                 "--concurrency of the command if it is higher. Defaults to "
+                 "env[OCCI_MAX_CONNECTIONS] or 10"
+        )
+
+        parser.add_argument(
+            "--tcp-keepalive",
+            metavar="<seconds>",
+            type=float,
+            default=utils.env("OCCI_TCP_KEEPALIVE", default=None),
+            help="Send TCP keep-alive probes on connections idle for this "
+                 "amount of seconds. Defaults to env[OCCI_TCP_KEEPALIVE] "
+                 "(disabled if not set)"
+        )
+
+        parser.add_argument(
+            "--timings",
+            default=False,
+            action="store_true",
+            help="Print a summary of the time spent in the requests"
+        )
+
+        parser.add_argument(
+            "--metrics-file",
+            metavar="<file>",
+            default=utils.env("OCCI_METRICS_FILE", default=None),
+            help="Write the metrics of the requests to this file, in the "
+                 "Prometheus text format. Defaults to env[OCCI_METRICS_FILE]"
+        )
+
+        parser.add_argument(
+            "--inventory-file",
+            metavar="<file>",
+            default=utils.env("OCCI_INVENTORY_FILE",
+                              default=inventory.DEFAULT_INVENTORY),
+            help="SQLite file with the local inventory of the instances, "
+                 "used by 'instance-list --cached'. Defaults to "
+                 "env[OCCI_INVENTORY_FILE] or %s" % inventory.DEFAULT_INVENTORY
+        )
+
+        parser.add_argument(
+            "--format",
+            metavar="<format>",
+            dest="output_format",
+            choices=formatters.FORMATS,
+            default=utils.env("OCCI_FORMAT",
+                              default=formatters.DEFAULT_FORMAT),
+            help="Output format, one of %s. Defaults to env[OCCI_FORMAT] "
+                 "or '%s'" % (", ".join(formatters.FORMATS),
+                              formatters.DEFAULT_FORMAT)
+        )
+
+        parser.add_argument(
+            "--no-agent",
+            default=False,
+            action="store_true",
+            help="Run the command directly, even if a pyocci agent is "
+                 "running"
+        )
+
         return parser
 
-    def get_subcommand_parser(self, version):
-        parser = self.get_parser()
+    def get_subcommand_parser(self, version, parser=None, command=None):
+        """Add the subcommands to parser (or to a new global parser).
+
+        If command is given, only its subparser is built, unless it is not
+        a valid command or it is 'help', which need all of them.
+        """
+        if parser is None:
+            parser = self.get_parser()
 
         self.subcommands = {}
         subparsers = parser.add_subparsers(metavar='<subcommand>')
 
-        try:
-            actions_module = {
-                '1.1': shell_v1_1,
-            }[version]
-        except KeyError:
-            actions_module = shell_v1_1
+        module_name = ACTIONS_MODULES.get(version,
+                                          ACTIONS_MODULES['1.1'])
+        actions_module = importlib.import_module(module_name)
+
+        commands = [self._command_name(attr)
+                    for module in (actions_module, self)
+                    for attr in dir(module) if attr.startswith('do_')]
+        if command not in commands or command == 'help':
+            command = None
 
-        self._find_actions(subparsers, actions_module)
-        self._find_actions(subparsers, self)
+        self._find_actions(subparsers, actions_module, command)
+        self._find_actions(subparsers, self, command)
 
         return parser
 
-    def _find_actions(self, subparsers, actions_module):
+    @staticmethod
+    def _command_name(attr):
+        # I prefer to be hypen-separated instead of underscores.
+        return attr[3:].replace('_', '-')
+
+    def _find_actions(self, subparsers, actions_module, command=None):
         for attr in (a for a in dir(actions_module) if a.startswith('do_')):
-            # I prefer to be hypen-separated instead of underscores.
-            command = attr[3:].replace('_', '-')
+            name = self._command_name(attr)
+            if command is not None and name != command:
+                continue
             callback = getattr(actions_module, attr)
             desc = callback.__doc__ or ''
             action_help = desc.strip().split('\n')[0]
             arguments = getattr(callback, 'arguments', [])
 
             subparser = subparsers.add_parser(
-                command,
+                name,
                 help=action_help,
                 description=desc,
                 add_help=False,
@@ -170,7 +427,7 @@ class OcciShell(object):
             subparser.add_argument('-h', '--help',
                                    action='help',
                                    help=argparse.SUPPRESS)
-            self.subcommands[command] = subparser
+            self.subcommands[name] = subparser
             for (args, kwargs) in arguments:
                 subparser.add_argument(*args, **kwargs)
             subparser.set_defaults(func=callback)
@@ -191,6 +448,162 @@ class OcciShell(object):
         else:
             self.parser.print_help()
 
+    @utils.arg('--socket',
+               metavar='<path>',
+               default=None,
+               help='Unix socket to listen on. Defaults to '
+                    'env[OCCI_AGENT_SOCKET] or %s' % agent.DEFAULT_SOCKET)
+    @utils.arg('--capabilities-ttl',
+               metavar='<seconds>',
+               type=float,
+               default=agent.DEFAULT_CAPABILITIES_TTL,
+               help='Reuse the capabilities of an endpoint for this amount '
+                    'of seconds (0 to disable). Defaults to %s' %
+                    agent.DEFAULT_CAPABILITIES_TTL)
+    @utils.arg('--idle-timeout',
+               metavar='<seconds>',
+               type=float,
+               default=None,
+               help='Exit after this amount of seconds without commands')
+    @utils.arg('--max-clients',
+               metavar='<N>',
+               type=int,
+               default=agent.DEFAULT_MAX_CLIENTS,
+               help='Clients (sets of endpoints and credentials) to keep, '
+                    'closing the least recently used ones. Defaults to %s' %
+                    agent.DEFAULT_MAX_CLIENTS)
+    def do_agent(self, args):
+        """
+        Run an agent keeping the clients warm for the next commands.
+
+        While the agent is running, pyocci forwards the commands to it (unless
+        --no-agent is used), reusing the authenticated sessions and the
+        capabilities of the endpoints. The agent runs in the foreground.
+        """
+        occi_agent = agent.Agent(args.socket,
+                                 capabilities_ttl=args.capabilities_ttl,
+                                 idle_timeout=args.idle_timeout,
+                                 max_clients=args.max_clients)
+        print("pyocci agent listening on %s" % occi_agent.path,
+              file=sys.stderr)
+        # Remove the socket when terminated
+        signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+        try:
+            occi_agent.serve_forever()
+        except KeyboardInterrupt:
+            pass
+
+    def _run_command(self, line, clients):
+        """Run a command line of a session, returning its exit status.
+
+        The global options given to the session are used, and the clients
+        are reused from (and stored in) clients.
+        """
+        argv = shlex.split(line, comments=True)
+        if not argv:
+            return None
+
+        try:
+            _options, index = self._find_command(self.get_parser(), argv)
+            command = index is not None and argv[index]
+            if command in self.SESSION_COMMANDS:
+                raise exceptions.CommandError(
+                    "'%s' cannot be used in a session" % command)
+            OcciShell(client_cache=clients).main(self.global_argv + argv)
+        except SystemExit as e:
+            if e.code is None or isinstance(e.code, int):
+                return e.code or 0
+            print(e.code, file=sys.stderr)
+            return 1
+        except Exception as e:
+            logger.debug(e, exc_info=1)
+            print("ERROR: %s" % unicode(e), file=sys.stderr)
+            return 1
+        return 0
+
+    @utils.arg('file',
+               metavar='<file>',
+               nargs='?',
+               default='-',
+               help='File with the commands, one per line. Defaults to the '
+                    'standard input')
+    @utils.arg('--stop-on-error',
+               default=False,
+               action='store_true',
+               help='Do not run more commands once one fails')
+    def do_batch(self, args):
+        """
+        Run a list of commands, sharing the clients between them.
+
+        Every line is a subcommand with its arguments (lines starting with '#'
+        are ignored), run with the global options given to pyocci. Every line
+        of their output is prefixed with the number of the command and a tab,
+        and after each command a line with its exit status ('<N>\t# exit
+        <status>') is printed.
+        """
+        clients = self.client_cache if self.client_cache is not None else {}
+        if args.file == '-':
+            lines = sys.stdin.readlines()
+        else:
+            with open(args.file) as f:
+                lines = f.readlines()
+
+        stdin, stdout, stderr = sys.stdin, sys.stdout, sys.stderr
+        failed = ran = 0
+        for number, line in enumerate(lines, 1):
+            sys.stdin = StringIO.StringIO()
+            sys.stdout = TaggedStream(stdout, number)
+            sys.stderr = TaggedStream(stderr, number)
+            try:
+                status = self._run_command(line, clients)
+                if status is not None:
+                    print("# exit %d" % status)
+            finally:
+                sys.stdout.flush()
+                sys.stderr.flush()
+                sys.stdin, sys.stdout, sys.stderr = stdin, stdout, stderr
+
+            if status is None:
+                continue
+            ran += 1
+            if status:
+                failed += 1
+                if args.stop_on_error:
+                    break
+
+        if failed:
+            raise exceptions.CommandError("%d of %d commands failed" %
+                                          (failed, ran))
+
+    def do_interactive(self, args):
+        """
+        Read commands interactively, sharing the clients between them.
+
+        The commands are run with the global options given to pyocci. Use
+        'help' to list them and 'exit' or Ctrl-D to quit.
+        """
+        try:
+            import readline  # noqa
+        except ImportError:
+            pass
+
+        clients = self.client_cache if self.client_cache is not None else {}
+        while True:
+            try:
+                line = raw_input("pyocci> ")
+            except EOFError:
+                print()
+                break
+            except KeyboardInterrupt:
+                print()
+                continue
+            if line.strip() in ("exit", "quit"):
+                break
+            try:
+                self._run_command(line, clients)
+            except KeyboardInterrupt:
+                print()
+
     def setup_debugging(self, debug):
         if not debug:
             return
@@ -201,13 +614,57 @@ class OcciShell(object):
         logger.setLevel(logging.DEBUG)
         logger.addHandler(streamhandler)
 
+    def _get_endpoint_urls(self, args):
+        urls = list(args.endpoint_url or [])
+        if args.endpoint_file:
+            with open(args.endpoint_file) as f:
+                urls.extend(line.strip() for line in f
+                            if line.strip() and not line.startswith("#"))
+        if not urls and utils.env('OCCI_ENDPOINT_URL'):
+            urls.append(utils.env('OCCI_ENDPOINT_URL'))
+        return urls
+
+    def _client_key(self, options, endpoint_urls, pool_size):
+        """Return the key identifying the clients built with options."""
+        if not isinstance(endpoint_urls, list):
+            endpoint_urls = [endpoint_urls]
+        identity = cache.identity_key(" ".join(endpoint_urls),
+                                      options.occi_group,
+                                      options.occi_username,
+                                      options.x509_user_proxy)
+        return "%s:%d:%s" % (identity, pool_size,
+                             json.dumps(vars(options), sort_keys=True))
+
+    def _find_command(self, parser, argv):
+        """Parse the global options in argv.
+
+        Returns the options and the position of the command in argv, or
+        None if there is no command (or help was asked for).
+        """
+        # The command is the first argument left by the global parser, but
+        # an option value (e.g. "--occi-group batch batch") may be equal to
+        # it, so it is located by identity.
+        tokens = [_Token(arg) for arg in argv]
+        (options, args) = parser.parse_known_args(tokens)
+        command = next((i for i in args if not i.startswith("-")), None)
+        if command is None or options.help:
+            return options, None
+        return options, next(i for i, token in enumerate(tokens)
+                             if token is command)
+
     def main(self, argv):
         parser = self.get_parser()
-        (options, args) = parser.parse_known_args(argv)
+        options, index = self._find_command(parser, argv)
         self.setup_debugging(options.debug)
 
+        command = None
+        if index is not None:
+            self.global_argv = argv[:index]
+            command = argv[index]
+
+        # The global parser is reused, so it is only built once
         subcommand_parser = self.get_subcommand_parser(
-            options.occi_api_version)
+            options.occi_api_version, parser=parser, command=command)
         self.parser = subcommand_parser
 
         if options.help or not argv:
@@ -216,12 +673,18 @@ class OcciShell(object):
 
         args = subcommand_parser.parse_args(argv)
 
-        if args.func == self.do_help:
-            self.do_help(args)
+        if args.func in (self.do_help, self.do_agent, self.do_batch,
+                         self.do_interactive):
+            args.func(args)
             return 0
 
+        from pyocci import client
+        from pyocci import metrics
+        from pyocci import ratelimit
+        from pyocci import retry
+
         (
-            endpoint_url,
+            endpoint_urls,
             auth_type,
             username,
             password,
@@ -229,7 +692,7 @@ class OcciShell(object):
             x509_user_proxy,
             insecure,
         ) = (
-            args.endpoint_url,
+            self._get_endpoint_urls(args),
             args.auth_type,
             args.occi_username,
             args.occi_password,
@@ -238,7 +701,7 @@ class OcciShell(object):
             args.insecure,
         )
 
-        if not endpoint_url:
+        if not endpoint_urls:
             raise exceptions.CommandError("You must provide and endpoint url "
                                           "via either --endpoint_url or "
                                           "env[OCCI_ENDPOINT_URL]")
@@ -257,22 +720,123 @@ class OcciShell(object):
                 "env[X509_USER_PROXY]"
             )
 
-        self.cs = client.Client(
-            options.occi_api_version,
-            endpoint_url,
-            auth_type,
-            username=username,
-            password=password,
-            group=group,
-            x509_user_proxy=x509_user_proxy,
-            http_log_debug=options.debug,
-            insecure=insecure,
-        )
+        if args.no_token_cache:
+            token_cache = None
+        else:
+            token_cache = cache.TokenCache(args.occi_token_cache)
+
+        response_cache = None
+        if args.http_cache_dir or args.http_cache_ttl:
+            response_cache = cache.ResponseCache(ttl=args.http_cache_ttl,
+                                                 path=args.http_cache_dir)
+
+        retry_policy = None
+        if args.retries > 0:
+            retry_policy = retry.RetryPolicy(retries=args.retries)
+
+        circuit_breakers = None
+        if args.circuit_breaker_threshold > 0:
+            circuit_breakers = retry.CircuitBreakers(
+                failure_threshold=args.circuit_breaker_threshold)
+
+        rates = {}
+        for value in args.host_rate_limits:
+            host, sep, rate = value.rpartition("=")
+            try:
+                rates[host] = float(rate)
+            except ValueError:
+                sep = None
+            if not (sep and host):
+                raise exceptions.CommandError(
+                    "Invalid --host-rate-limit '%s', must be "
+                    "host[:port]=requests/s" % value)
+
+        rate_limiter = None
+        if args.rate_limit or rates:
+            rate_limiter = ratelimit.RateLimiter(
+                args.rate_limit,
+                adaptive=args.adaptive_rate_limit,
+                rates=rates)
+        elif args.adaptive_rate_limit:
+            raise exceptions.CommandError(
+                "--adaptive-rate-limit needs an initial rate, set with "
+                "--rate-limit or --host-rate-limit")
+
+        if len(endpoint_urls) == 1:
+            client_class = client.Client
+            endpoint_urls = endpoint_urls[0]
+        elif getattr(args.func, 'multi_endpoint', False):
+            client_class = client.MultiClient
+        else:
+            raise exceptions.CommandError(
+                "This command cannot be used with several endpoints")
+
+        # There must be a connection for every request that
+        # the command performs in parallel, plus the one of a listing that
+        # is still being read, or the extra ones are discarded (and opened
+        # again) once they are done.
+        pool_size = args.max_connections
+        if getattr(args, "concurrency", None):
+            pool_size = max(pool_size, args.concurrency + 1)
+
+        # Clients with a metrics collector are not reused, as
+        # it would stay installed in them.
+        client_key = None
+        if (self.client_cache is not None and
+                not (args.timings or args.metrics_file)):
+            client_key = self._client_key(options, endpoint_urls, pool_size)
+            self.cs = self.client_cache.get(client_key)
+        else:
+            self.cs = None
+
+        if self.cs is None:
+            self.cs = client_class(
+                options.occi_api_version,
+                endpoint_urls,
+                auth_type,
+                username=username,
+                password=password,
+                group=group,
+                x509_user_proxy=x509_user_proxy,
+                timeout=args.timeout,
+                http_log_debug=options.debug,
+                insecure=insecure,
+                token_cache=token_cache,
+                json_decoder=args.json_decoder,
+                response_cache=response_cache,
+                retry_policy=retry_policy,
+                circuit_breakers=circuit_breakers,
+                rate_limiter=rate_limiter,
+                cacert=args.occi_cacert,
+                concurrency=pool_size,
+                keepalive=args.tcp_keepalive,
+            )
+            if client_key is not None:
+                self.client_cache[client_key] = self.cs
+
+        collector = None
+        if args.timings or args.metrics_file:
+            collector = metrics.MetricsCollector()
+            if isinstance(self.cs, client.MultiClient):
+                for cs in self.cs.clients.values():
+                    collector.install(cs.client)
+            else:
+                collector.install(self.cs.client)
 
-        args.func(self.cs, args)
+        try:
+            args.func(self.cs, args)
+        finally:
+            if args.timings:
+                print(collector.summary(), file=sys.stderr)
+            if args.metrics_file:
+                collector.write_prometheus(args.metrics_file)
 
 
 def main():
+    status = agent.forward(sys.argv[1:])
+    if status is not None:
+        sys.exit(status)
+
     try:
         OcciShell().main(sys.argv[1:])
     except Exception, e:
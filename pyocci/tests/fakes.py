@@ -0,0 +1,48 @@
+# Copyright 2013 Spanish National Research Council (CSIC)
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""
+Fake OCCI resources for the tests.
+"""
+
+from pyocci import occi
+
+INFRA = "http://schemas.ogf.org/occi/infrastructure#"
+
+
+def compute(instance_id, state="active", image="image-1", flavor="small",
+            address="10.0.0.1"):
+    """Return the JSON rendering of a compute resource."""
+    return {
+        "kind": {"scheme": INFRA, "term": "compute"},
+        "mixins": [
+            {"scheme": "http://example.org/os_tpl#", "term": image,
+             "related": [occi.CATEGORIES["image"]]},
+            {"scheme": "http://example.org/resource_tpl#", "term": flavor,
+             "related": [occi.CATEGORIES["flavor"]]},
+        ],
+        "attributes": {
+            "occi.core.id": instance_id,
+            "occi.core.title": "vm-%s" % instance_id,
+            "occi.compute.hostname": "vm-%s.example.org" % instance_id,
+            "occi.compute.state": state,
+            "occi.compute.cores": 2,
+        },
+        "links": [
+            {"kind": {"scheme": INFRA, "term": "networkinterface",
+                      "related": [occi.CATEGORIES["network"]]},
+             "target": "/network/public",
+             "attributes": {"occi.networkinterface.address": address}},
+        ],
+    }
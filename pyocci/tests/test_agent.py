@@ -0,0 +1,95 @@
+# Copyright 2013 Spanish National Research Council (CSIC)
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+from __future__ import print_function
+
+import json
+import socket
+import sys
+import unittest
+
+from pyocci import agent
+from pyocci import shell
+
+
+class FakeHTTPClient(object):
+    closed = False
+
+    def close(self):
+        self.closed = True
+
+
+class FakeClient(object):
+    def __init__(self):
+        self.client = FakeHTTPClient()
+        self.capabilities = None
+
+
+class TestClientCache(unittest.TestCase):
+    def test_least_recently_used_are_closed(self):
+        clients = agent.ClientCache(capabilities_ttl=0, max_clients=2)
+        a, b, c = FakeClient(), FakeClient(), FakeClient()
+        clients["a"] = a
+        clients["b"] = b
+        self.assertTrue(clients.get("a") is a)
+        clients["c"] = c
+        self.assertEqual(["a", "c"], list(clients))
+        self.assertTrue(b.client.closed)
+        self.assertFalse(a.client.closed or c.client.closed)
+        self.assertEqual(None, clients.get("b"))
+
+
+class TestAgent(unittest.TestCase):
+    def _handle(self, request):
+        server, client = socket.socketpair()
+        self.addCleanup(client.close)
+        client.sendall(request + "\n")
+        try:
+            agent.Agent("/nonexistent/agent.sock").handle(server)
+        finally:
+            server.close()
+        return [json.loads(line) for line in client.makefile("rb")]
+
+    def test_invalid_request(self):
+        for request in ("not json", "{}", '{"argv": 1}'):
+            messages = self._handle(request)
+            self.assertEqual({"status": 1}, messages[-1])
+            self.assertTrue("invalid request" in messages[0]["stderr"])
+
+    def test_missing_cwd(self):
+        messages = self._handle(json.dumps({"argv": ["help"],
+                                            "cwd": "/nonexistent"}))
+        self.assertEqual({"status": 1}, messages[-1])
+        self.assertTrue("/nonexistent" in messages[0]["stderr"])
+
+    def _patch_main(self, main):
+        self.addCleanup(setattr, shell.OcciShell, "main",
+                        shell.OcciShell.__dict__["main"])
+        shell.OcciShell.main = main
+
+    def test_fallback(self):
+        self._patch_main(lambda self, argv: sys.stdin.read())
+        self.assertEqual([{"fallback": True}],
+                         self._handle(json.dumps({"argv": ["batch"]})))
+
+    def test_no_fallback_after_output(self):
+        def main(self, argv):
+            print("partial output")
+            sys.stdin.read()
+        self._patch_main(main)
+
+        messages = self._handle(json.dumps({"argv": ["batch"]}))
+        self.assertEqual({"stdout": "partial output"}, messages[0])
+        self.assertEqual({"status": 1}, messages[-1])
+        self.assertFalse(any("fallback" in m for m in messages))
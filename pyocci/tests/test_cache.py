@@ -0,0 +1,165 @@
+# Copyright 2013 Spanish National Research Council (CSIC)
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import requests
+
+from pyocci import cache
+
+
+def _response(content, **headers):
+    resp = requests.Response()
+    resp.status_code = 200
+    resp.headers.update(headers)
+    resp._content = content
+    return resp
+
+
+class TestTokenCache(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+        self.cache = cache.TokenCache(os.path.join(self.dir, "a", "t.json"))
+
+    def test_set_and_get(self):
+        self.assertEqual({}, self.cache.get("key"))
+        self.cache.set("key", "token", auth_url="http://keystone")
+        self.assertEqual({"token": "token", "expires": None,
+                          "auth_url": "http://keystone"},
+                         self.cache.get("key"))
+        self.assertEqual(0o600, os.stat(self.cache.path).st_mode & 0o777)
+
+    def test_expired(self):
+        self.cache.set("key", "token", expires=1, auth_url="http://k")
+        entry = self.cache.get("key")
+        self.assertFalse("token" in entry)
+        self.assertEqual("http://k", entry["auth_url"])
+
+    def test_invalidate_keeps_auth_url(self):
+        self.cache.set("key", "token", auth_url="http://k")
+        self.cache.set("other", "token2")
+        self.cache.invalidate("key")
+        self.assertEqual({"expires": None, "auth_url": "http://k"},
+                         self.cache.get("key"))
+        self.assertEqual("token2", self.cache.get("other")["token"])
+
+    def test_corrupted(self):
+        os.makedirs(os.path.dirname(self.cache.path))
+        with open(self.cache.path, "w") as f:
+            f.write("{")
+        self.assertEqual({}, self.cache.get("key"))
+
+    def test_identity_key(self):
+        proxy = os.path.join(self.dir, "proxy")
+        with open(proxy, "w") as f:
+            f.write("one")
+        key = cache.identity_key("http://x", x509_user_proxy=proxy)
+        self.assertNotEqual(key, cache.identity_key("http://y",
+                                                    x509_user_proxy=proxy))
+        with open(proxy, "w") as f:
+            f.write("renewed")
+        self.assertNotEqual(key, cache.identity_key("http://x",
+                                                    x509_user_proxy=proxy))
+
+    def test_parse_expiry(self):
+        self.assertEqual(0, cache.parse_expiry("1970-01-01T00:00:00Z"))
+        self.assertEqual(None, cache.parse_expiry("never"))
+        self.assertEqual(None, cache.parse_expiry(None))
+
+
+class TestResponseCache(unittest.TestCase):
+    def test_key_varies(self):
+        key = cache.ResponseCache.key
+        base = key("id", "http://x/compute/", {"Accept": "text/plain"})
+        self.assertEqual(base, key("id", "http://x/compute/",
+                                   {"Accept": "text/plain", "Other": "1"}))
+        self.assertNotEqual(base, key("id2", "http://x/compute/",
+                                      {"Accept": "text/plain"}))
+        self.assertNotEqual(base, key("id", "http://x/compute/",
+                                      {"Accept": "text/occi"}))
+        self.assertNotEqual(base, key("id", "http://x/compute/",
+                                      {"Accept": "text/plain",
+                                       "X-OCCI-Attribute": 'a="b"'}))
+
+    def test_only_validated_responses(self):
+        rc = cache.ResponseCache()
+        rc.set("a", _response("body"))
+        self.assertEqual(None, rc.get("a"))
+        rc.set("b", _response("body", ETag='"1"'))
+        entry = rc.get("b")
+        self.assertEqual("body", entry["content"])
+        self.assertEqual({"If-None-Match": '"1"'},
+                         rc.conditional_headers(entry))
+        self.assertFalse(rc.is_fresh(entry))
+        resp = rc.response(entry, "http://x")
+        self.assertEqual((200, "body"), (resp.status_code, resp.content))
+
+    def test_ttl(self):
+        rc = cache.ResponseCache(ttl=60)
+        rc.set("a", _response("body"))
+        self.assertTrue(rc.is_fresh(rc.get("a")))
+
+    def test_lru_eviction(self):
+        rc = cache.ResponseCache(max_size=10)
+        rc.set("a", _response("1234", ETag="a"))
+        rc.set("b", _response("1234", ETag="b"))
+        rc.get("a")
+        rc.set("c", _response("1234", ETag="c"))
+        self.assertNotEqual(None, rc.get("a"))
+        self.assertEqual(None, rc.get("b"))
+        self.assertNotEqual(None, rc.get("c"))
+
+    def test_disk(self):
+        path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, path)
+        cache.ResponseCache(path=path).set(
+            "a", _response("body", **{"Last-Modified": "yesterday",
+                                      "Content-Type": "text/plain"}))
+        entry = cache.ResponseCache(path=path).get("a")
+        self.assertEqual("body", entry["content"])
+        self.assertEqual({"If-Modified-Since": "yesterday"},
+                         cache.ResponseCache().conditional_headers(entry))
+        self.assertEqual("text/plain", entry["headers"]["content-type"])
+
+    def test_disk_size_is_bounded(self):
+        path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, path)
+        rc = cache.ResponseCache(path=path, max_size=1000)
+        for i in range(20):
+            rc.set(str(i), _response("x" * 200, ETag=str(i)))
+        total = sum(os.path.getsize(os.path.join(path, name))
+                    for name in os.listdir(path))
+        self.assertTrue(total <= 1000)
+
+    def test_disk_is_not_scanned_on_every_store(self):
+        path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, path)
+        rc = cache.ResponseCache(path=path, max_size=100000)
+        scans = []
+        prune_disk = rc._prune_disk
+
+        def _prune_disk():
+            scans.append(True)
+            return prune_disk()
+        rc._prune_disk = _prune_disk
+
+        for i in range(rc.PRUNE_INTERVAL + 1):
+            rc.set(str(i % 10), _response("x" * 200, ETag=str(i)))
+        # Once to know the size, and again PRUNE_INTERVAL stores later
+        self.assertEqual(2, len(scans))
+        self.assertEqual(10, len(os.listdir(path)))
@@ -0,0 +1,41 @@
+# Copyright 2013 Spanish National Research Council (CSIC)
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import StringIO
+import unittest
+
+from pyocci import formatters
+
+
+class TestTableFormatter(unittest.TestCase):
+    def _table(self, rows, **kwargs):
+        stream = StringIO.StringIO()
+        with formatters.TableFormatter(["ID", "Location"], stream,
+                                       **kwargs) as table:
+            table.write_all(rows)
+        return stream.getvalue().splitlines()
+
+    def test_buffered_rows_are_not_truncated(self):
+        location = "http://example.org:8787/compute/" + "x" * 80
+        lines = self._table([["1", location], ["2", None]])
+        self.assertEqual("| 1  | %s |" % location, lines[3])
+        self.assertEqual("| 2  | %s |" % (" " * len(location)), lines[4])
+        self.assertEqual(lines[0], lines[-1])
+
+    def test_later_rows_are_truncated(self):
+        lines = self._table([["1", "abc"], ["2", "abcdefghijk"]],
+                            buffer_rows=1)
+        self.assertEqual("| 2  | abcde... |", lines[4])
+        lines = self._table([["1", "abcdefgh"]], max_width=6)
+        self.assertEqual("| 1  | abc... |", lines[3])
@@ -0,0 +1,181 @@
+# Copyright 2013 Spanish National Research Council (CSIC)
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from pyocci import exceptions
+from pyocci import inventory
+from pyocci.tests import fakes
+from pyocci.v1_1 import instances
+from pyocci.v1_1 import resources
+
+
+def _compute(*args, **kwargs):
+    return resources.Compute(fakes.compute(*args, **kwargs))
+
+
+class FakeAPI(object):
+    """Answer the POST requests with the given headers and body."""
+
+    def __init__(self, headers, body):
+        self.client = self
+        self.headers = headers
+        self.body = body
+
+    def post(self, url, headers=None):
+        return self, self.body
+
+
+class TestCompileFilters(unittest.TestCase):
+    def test_aliases(self):
+        match = instances.compile_filters({"state": "active",
+                                           "hostname": "vm-1.example.org"})
+        self.assertTrue(match(_compute("1")))
+        self.assertFalse(match(_compute("1", state="inactive")))
+        self.assertFalse(match(_compute("2")))
+
+    def test_full_names_and_typed_values(self):
+        match = instances.compile_filters([("occi.compute.cores", "2"),
+                                           ("occi.core.title", "vm-1")])
+        self.assertTrue(match(_compute("1")))
+        self.assertFalse(instances.compile_filters(
+            {"occi.compute.cores": 4})(_compute("1")))
+
+    def test_categories(self):
+        for value in ("image-1", "http://example.org/os_tpl#image-1",
+                      "compute", "small"):
+            self.assertTrue(instances.compile_filters(
+                {"category": value})(_compute("1")))
+        self.assertFalse(instances.compile_filters(
+            {"mixin": "image-2"})(_compute("1")))
+
+    def test_image_and_flavor(self):
+        for filters in ({"image": "image-1"}, {"flavor": "small"},
+                        {"image": "http://example.org/os_tpl#image-1"}):
+            self.assertTrue(instances.compile_filters(filters)(_compute("1")))
+        # The image is not the flavor
+        self.assertFalse(instances.compile_filters(
+            {"image": "small"})(_compute("1")))
+
+    def test_missing_attribute(self):
+        self.assertFalse(instances.compile_filters(
+            {"occi.compute.memory": "1"})(_compute("1")))
+
+    def test_partial_resources_are_undecided(self):
+        partial = instances._as_resource("http://x/compute/1")
+        self.assertEqual("1", partial.id)
+        self.assertEqual(None, instances.compile_filters(
+            {"state": "active"})(partial))
+        self.assertEqual(None, instances.compile_filters(
+            {"category": "image-1"})(partial))
+        # The ID is in the location, so it can be checked
+        self.assertFalse(instances.compile_filters({"id": "2"})(partial))
+
+    def test_no_filters(self):
+        self.assertTrue(instances.compile_filters({})(_compute("1")))
+
+    def test_filter_headers(self):
+        headers = instances._filter_headers([
+            ("state", "active"),
+            ("category", "http://example.org/os_tpl#image-1"),
+            ("category", "small")])
+        self.assertEqual('occi.compute.state="active"',
+                         headers["X-OCCI-Attribute"])
+        # Bare terms cannot be sent to the server
+        self.assertEqual('image-1; scheme="http://example.org/os_tpl#"; '
+                         'class="mixin"', headers["Category"])
+        self.assertEqual({}, instances._filter_headers({}))
+
+
+class TestCreate(unittest.TestCase):
+    def _create(self, headers, body):
+        manager = instances.InstancesManager(FakeAPI(headers, body))
+        return manager.create(name="vm-1", image="http://x#image-1")
+
+    def test_location(self):
+        instance = self._create({"location": "http://a/compute/1"}, None)
+        self.assertEqual("1", instance.id)
+
+    def test_location_in_body(self):
+        self.assertEqual("2", self._create({}, ["http://a/compute/2"]).id)
+        self.assertEqual("3", self._create({}, fakes.compute("3")).id)
+
+    def test_no_location(self):
+        self.assertRaises(exceptions.InvalidResponse, self._create, {}, None)
+        self.assertRaises(exceptions.InvalidResponse, self._create, {}, [])
+
+
+class FakeInstancesManager(instances.InstancesManager):
+    """Partial listings, and details with the given ETags."""
+
+    def __init__(self, listing, etags):
+        self.api = self
+        self.client = self
+        self.endpoint_url = "https://a.example.org:8787"
+        self.listing = listing
+        self.etags = etags
+        self.requested = []
+
+    def list(self, stream=False):
+        return iter(self.listing)
+
+    def detail_if_modified(self, instance, etag=None):
+        self.requested.append(instance)
+        if etag is not None and etag == self.etags.get(instance):
+            return None, etag
+        return _compute(instance), self.etags.get(instance)
+
+
+class TestRefreshInventory(unittest.TestCase):
+    def setUp(self):
+        path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, path)
+        self.inv = inventory.Inventory(os.path.join(path, "inv.sqlite"))
+        self.addCleanup(self.inv.close)
+
+    def _refresh(self, listing, etags):
+        manager = FakeInstancesManager(listing, etags)
+        counts = manager.refresh_inventory(self.inv)
+        return counts, sorted(manager.requested)
+
+    def test_only_new_or_changed_are_requested(self):
+        listing = [instances._as_resource("/compute/%s" % i) for i in "123"]
+        etags = {"1": '"e1"'}
+        counts, requested = self._refresh(listing, etags)
+        self.assertEqual(["1", "2", "3"], requested)
+        self.assertEqual(3, counts["new"])
+
+        # 1 is revalidated with its ETag, and the rest are kept as stored
+        counts, requested = self._refresh(listing, etags)
+        self.assertEqual(["1"], requested)
+        self.assertEqual({"new": 0, "updated": 0, "unchanged": 3,
+                          "deleted": 0}, counts)
+
+        # Unless the listing shows that their state changed
+        listing[1] = resources.Compute({"attributes": {
+            "occi.core.id": "2", "occi.compute.state": "inactive"}})
+        listing[2] = resources.Compute({"attributes": {
+            "occi.core.id": "3", "occi.compute.state": "active"}})
+        counts, requested = self._refresh(listing[1:], etags)
+        self.assertEqual(["2"], requested)
+        self.assertEqual(1, counts["deleted"])
+
+
+class TestWaitFor(unittest.TestCase):
+    def test_no_instances(self):
+        manager = FakeInstancesManager([], {})
+        self.assertEqual({}, manager.wait_for([], "active"))
@@ -0,0 +1,105 @@
+# Copyright 2013 Spanish National Research Council (CSIC)
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from pyocci import inventory
+from pyocci.tests import fakes
+from pyocci.v1_1 import resources
+
+ENDPOINT = "https://a.example.org:8787"
+
+
+def _compute(*args, **kwargs):
+    return resources.Compute(fakes.compute(*args, **kwargs))
+
+
+class TestInventory(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+        self.inv = inventory.Inventory(os.path.join(self.dir, "inv.sqlite"))
+        self.addCleanup(self.inv.close)
+
+    def _ids(self, **kwargs):
+        return [i["id"] for i in self.inv.query(**kwargs)]
+
+    def test_update_and_query(self):
+        self.assertEqual(None, self.inv.refreshed(ENDPOINT))
+        self.inv.update(ENDPOINT, [(_compute("1"), '"e1"'),
+                                   (_compute("2", state="inactive",
+                                             image="image-2"), None)],
+                        ["1", "2"])
+        self.inv.update("https://b", [(_compute("3"), None)], ["3"])
+
+        self.assertNotEqual(None, self.inv.refreshed(ENDPOINT))
+        self.assertEqual({"1": '"e1"', "2": None}, self.inv.etags(ENDPOINT))
+        self.assertEqual(["1", "2", "3"], self._ids())
+        self.assertEqual(["1", "2"], self._ids(endpoints=[ENDPOINT]))
+        self.assertEqual(["1", "3"], self._ids(state="active"))
+        self.assertEqual(["2"], self._ids(endpoints=[ENDPOINT],
+                                          image="image-2"))
+        self.assertEqual(["1"], self._ids(hostname="vm-1.example.org"))
+
+        instance = self.inv.query(id="1")[0]
+        self.assertEqual("vm-1", instance["name"])
+        self.assertEqual("small", instance["flavor"])
+        self.assertEqual(["10.0.0.1"], instance["addresses"])
+        self.assertEqual("1", resources.Compute(instance["resource"]).id)
+
+    def test_invalid_column(self):
+        self.assertRaises(ValueError, self.inv.query, name="vm-1")
+
+    def test_removed_instances(self):
+        self.inv.update(ENDPOINT, [(_compute("1"), None),
+                                   (_compute("2"), None)], ["1", "2"])
+        self.inv.update(ENDPOINT, [], ["2"])
+        self.assertEqual(["2"], self._ids())
+
+    def test_update_returns_changed(self):
+        self.assertEqual(set(["1", "2"]),
+                         self.inv.update(ENDPOINT, [(_compute("1"), None),
+                                                    (_compute("2"), '"e2"')],
+                                         ["1", "2"]))
+        changed = self.inv.update(ENDPOINT,
+                                  [(_compute("1"), None),
+                                   (_compute("2"), '"e3"'),
+                                   (_compute("3", state="inactive"), None)],
+                                  ["1", "2", "3"])
+        self.assertEqual(set(["2", "3"]), changed)
+        self.assertEqual({"1": None, "2": '"e3"', "3": None},
+                         self.inv.etags(ENDPOINT))
+
+    def test_state_since(self):
+        self.inv.update(ENDPOINT, [(_compute("1"), None),
+                                   (_compute("2"), None)], ["1", "2"])
+        since = self.inv.query(id="1")[0]["state_since"]
+        time.sleep(0.01)
+        self.inv.update(ENDPOINT, [(_compute("1"), None),
+                                   (_compute("2", state="inactive"), None)],
+                        ["1", "2"])
+        first, second = self.inv.query()
+        # Unchanged states keep the time since they are in it
+        self.assertEqual(since, first["state_since"])
+        self.assertTrue(second["state_since"] > since)
+
+        self.assertEqual(["1"], self._ids(state_for=0.005))
+        self.assertEqual([], self._ids(state_for=60))
+
+    def test_file_is_private(self):
+        self.assertEqual(0o600, os.stat(self.inv.path).st_mode & 0o777)
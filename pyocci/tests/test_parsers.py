@@ -0,0 +1,147 @@
+# Copyright 2013 Spanish National Research Council (CSIC)
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import json
+import unittest
+
+from pyocci import parsers
+
+
+class TestIterJSONArray(unittest.TestCase):
+    loads = None
+
+    def _decode(self, document, chunk_size):
+        chunks = [document[i:i + chunk_size]
+                  for i in range(0, len(document), chunk_size)]
+        return list(parsers.iter_json_array(chunks, loads=self.loads))
+
+    def test_any_chunk_size(self):
+        document = ' [ {"a": [1, 2], "b": "x,]y"} , 12345 , "s", null ] '
+        expected = [{"a": [1, 2], "b": "x,]y"}, 12345, "s", None]
+        for chunk_size in range(1, len(document) + 1):
+            self.assertEqual(expected, self._decode(document, chunk_size))
+
+    def test_numbers_split_across_chunks(self):
+        self.assertEqual([12, 345], list(parsers.iter_json_array(
+            ["[1", "2,3", "45]"], loads=self.loads)))
+
+    def test_escaped_quotes(self):
+        document = r'["a\"]", "b\\", {"c\\\"}": ["]"]}, {"d": "{"}, 1]'
+        expected = ['a"]', "b\\", {'c\\"}': ["]"]}, {"d": "{"}, 1]
+        for chunk_size in range(1, len(document) + 1):
+            self.assertEqual(expected, self._decode(document, chunk_size))
+
+    def test_empty(self):
+        self.assertEqual([], self._decode("[]", 1))
+        self.assertEqual([], self._decode(" [ ] ", 2))
+        self.assertEqual([], self._decode("", 1))
+
+    def test_not_an_array(self):
+        self.assertEqual([{"a": 1}], self._decode('{"a": 1}', 3))
+
+    def test_truncated(self):
+        self.assertRaises(ValueError, self._decode, '[{"a": 1}, {"b"', 4)
+
+    def test_missing_delimiter(self):
+        self.assertRaises(ValueError, self._decode, '[1 2]', 1)
+
+
+class TestIterJSONArrayLoads(TestIterJSONArray):
+    """The same, decoding with a loads() without raw_decode (e.g. ujson)."""
+
+    @staticmethod
+    def loads(document):
+        return json.loads(document)
+
+
+class TestIterLines(unittest.TestCase):
+    def test_lines_split_across_chunks(self):
+        self.assertEqual(["a", "bc", "", "d"], list(parsers.iter_lines(
+            ["a\nb", "c\n", "\nd"])))
+
+    def test_trailing_newline(self):
+        self.assertEqual(["a", "b"], list(parsers.iter_lines(
+            ["a\r\n", "b\r\n"])))
+        self.assertEqual([], list(parsers.iter_lines([])))
+
+
+class TestTokenize(unittest.TestCase):
+    def test_elements_and_params(self):
+        value = ('compute; scheme="http://x#"; class="kind", '
+                 'small; scheme="http://y#"')
+        self.assertEqual([[(None, "compute"), ("scheme", "http://x#"),
+                           ("class", "kind")],
+                          [(None, "small"), ("scheme", "http://y#")]],
+                         parsers.tokenize(value))
+
+    def test_typed_values(self):
+        self.assertEqual([[("a", 1), ("b", 2.5), ("c", True),
+                           ("d", "1"), ("e", "1.0.0")]],
+                         parsers.tokenize('a=1; b=2.5; c=true; d="1"; '
+                                          'e=1.0.0'))
+
+    def test_delimiters_in_quotes_and_angles(self):
+        value = ('<http://x/a;b,c>; title="a, \\"b\\"; c", '
+                 'next')
+        self.assertEqual([[(None, "<http://x/a;b,c>"),
+                           ("title", 'a, "b"; c')],
+                          [(None, "next")]],
+                         parsers.tokenize(value))
+
+
+class TestParseTextPlain(unittest.TestCase):
+    def test_resource(self):
+        content = "\n".join([
+            'Category: compute; '
+            'scheme="http://schemas.ogf.org/occi/infrastructure#"; '
+            'class="kind"',
+            'Category: small; scheme="http://example.org/tpl#"; '
+            'class="mixin"; rel="http://example.org/tpl#base"',
+            'Link: </network/1>; rel="http://x#network"; '
+            'category="http://x#networkinterface"; address="10.0.0.1"',
+            'Link: </compute/1?action=stop>; rel="http://x#stop"',
+            'X-OCCI-Attribute: occi.core.id="1"',
+            'X-OCCI-Attribute: occi.compute.cores=2',
+        ])
+        resource = parsers.parse_text_plain(content)
+        self.assertEqual("compute", resource["kind"]["term"])
+        self.assertEqual(["small"], [m["term"] for m in resource["mixins"]])
+        self.assertEqual(["http://example.org/tpl#base"],
+                         resource["mixins"][0]["related"])
+        self.assertEqual({"occi.core.id": "1", "occi.compute.cores": 2},
+                         resource["attributes"])
+        self.assertEqual(["/network/1"],
+                         [link["target"] for link in resource["links"]])
+        self.assertEqual({"address": "10.0.0.1"},
+                         resource["links"][0]["attributes"])
+        self.assertEqual(["/compute/1?action=stop"],
+                         [a["target"] for a in resource["actions"]])
+
+    def test_locations(self):
+        content = ("X-OCCI-Location: http://x/compute/1, "
+                   "http://x/compute/2?a=b;c\n"
+                   "x-occi-location: http://x/compute/3\n")
+        self.assertEqual(["http://x/compute/1", "http://x/compute/2?a=b;c",
+                          "http://x/compute/3"],
+                         parsers.parse_text_plain(content))
+
+    def test_categories(self):
+        content = 'Category: start; scheme="http://x/action#"; ' \
+                  'class="action"'
+        self.assertEqual([{"term": "start", "scheme": "http://x/action#",
+                           "class": "action"}],
+                         parsers.parse_text_plain(content))
+
+    def test_empty(self):
+        self.assertEqual(None, parsers.parse_text_plain("Other: x\n"))
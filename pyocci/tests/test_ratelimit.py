@@ -0,0 +1,109 @@
+# Copyright 2013 Spanish National Research Council (CSIC)
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import unittest
+
+from pyocci import ratelimit
+
+
+class FakeTime(object):
+    """Replace time.time and time.sleep in ratelimit with a fake clock."""
+
+    def __init__(self, test, now=1000.0):
+        self.now = now
+        self.slept = 0
+        originals = (ratelimit.time.time, ratelimit.time.sleep)
+        ratelimit.time.time = lambda: self.now
+        ratelimit.time.sleep = self.sleep
+        test.addCleanup(self.restore, originals)
+
+    def sleep(self, seconds):
+        self.slept += seconds
+        self.now += seconds
+
+    def restore(self, originals):
+        ratelimit.time.time, ratelimit.time.sleep = originals
+
+
+class TestTokenBucket(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeTime(self)
+
+    def test_burst_does_not_wait(self):
+        bucket = ratelimit.TokenBucket(5, burst=3)
+        for _i in range(3):
+            bucket.acquire()
+        self.assertEqual(0, self.clock.slept)
+
+    def test_rate(self):
+        # Rates that are powers of two keep the fake clock exact
+        bucket = ratelimit.TokenBucket(4, burst=1)
+        for _i in range(11):
+            bucket.acquire()
+        self.assertEqual(2.5, self.clock.slept)
+
+    def test_refill_is_capped_to_burst(self):
+        bucket = ratelimit.TokenBucket(8, burst=2)
+        bucket.acquire()
+        self.clock.now += 100
+        for _i in range(2):
+            bucket.acquire()
+        self.assertEqual(0, self.clock.slept)
+        bucket.acquire()
+        self.assertEqual(0.125, self.clock.slept)
+
+    def test_default_burst(self):
+        self.assertEqual(1.0, ratelimit.TokenBucket(0.5).burst)
+        self.assertEqual(20.0, ratelimit.TokenBucket(20).burst)
+
+
+class TestAdaptiveTokenBucket(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeTime(self)
+
+    def test_decrease_once_per_cooldown(self):
+        bucket = ratelimit.AdaptiveTokenBucket(8, cooldown=1)
+        bucket.update(429)
+        bucket.update(503)
+        self.assertEqual(4, bucket.rate)
+        self.clock.now += 1
+        bucket.update(413)
+        self.assertEqual(2, bucket.rate)
+
+    def test_bounds(self):
+        bucket = ratelimit.AdaptiveTokenBucket(1, min_rate=0.5, max_rate=2)
+        for _i in range(5):
+            self.clock.now += 1
+            bucket.update(429)
+        self.assertEqual(0.5, bucket.rate)
+        for _i in range(100):
+            bucket.update(200)
+        self.assertEqual(2, bucket.rate)
+
+
+class TestRateLimiter(unittest.TestCase):
+    def test_buckets_per_endpoint(self):
+        limiter = ratelimit.RateLimiter(5, rates={"b:8787": 1})
+        self.assertTrue(limiter.get("http://a:8787/x") is
+                        limiter.get("http://a:8787/y"))
+        self.assertEqual(5, limiter.get("http://a:8787/").rate)
+        self.assertEqual(1, limiter.get("http://b:8787/").rate)
+        self.assertTrue(isinstance(
+            ratelimit.RateLimiter(5, adaptive=True).get("http://a/"),
+            ratelimit.AdaptiveTokenBucket))
+
+    def test_only_some_hosts(self):
+        limiter = ratelimit.RateLimiter(None, rates={"b:8787": 1})
+        self.assertEqual(None, limiter.get("http://a:8787/"))
+        self.assertEqual(1, limiter.get("http://b:8787/").rate)
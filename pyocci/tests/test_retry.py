@@ -0,0 +1,125 @@
+# Copyright 2013 Spanish National Research Council (CSIC)
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import time
+import unittest
+
+from pyocci import exceptions
+from pyocci import retry
+
+
+class FakeClock(object):
+    """Replace time.time in a module with a clock that we move."""
+
+    def __init__(self, test, module, now=1000.0):
+        self.now = now
+        original = module.time.time
+        module.time.time = lambda: self.now
+        test.addCleanup(setattr, module.time, "time", original)
+
+
+class TestRetryPolicy(unittest.TestCase):
+    def setUp(self):
+        self.policy = retry.RetryPolicy(retries=3, backoff=1, max_backoff=10)
+
+    def test_only_idempotent_methods(self):
+        self.assertEqual(None, self.policy.get_delay("POST", 0))
+        self.assertNotEqual(None, self.policy.get_delay("get", 0))
+
+    def test_retries_exhausted(self):
+        self.assertNotEqual(None, self.policy.get_delay("GET", 2))
+        self.assertEqual(None, self.policy.get_delay("GET", 3))
+
+    def test_statuses(self):
+        self.assertNotEqual(None, self.policy.get_delay("GET", 0, 503))
+        self.assertEqual(None, self.policy.get_delay("GET", 0, 404))
+        self.assertEqual(None, self.policy.get_delay("GET", 0, 500))
+
+    def test_backoff_bounds(self):
+        for attempt in range(3):
+            for _i in range(20):
+                delay = self.policy.get_delay("GET", attempt)
+                self.assertTrue(0 <= delay <= min(10, 2 ** attempt))
+
+    def test_retry_after(self):
+        self.assertEqual(2.0, self.policy.get_delay("GET", 0, 503, "2"))
+        # The server asks to wait too much
+        self.assertEqual(None, self.policy.get_delay("GET", 0, 503, "60"))
+
+    def test_parse_retry_after(self):
+        self.assertEqual(None, retry.parse_retry_after(None))
+        self.assertEqual(None, retry.parse_retry_after("soon"))
+        self.assertEqual(0.0, retry.parse_retry_after("-1"))
+        self.assertEqual(0.0, retry.parse_retry_after(
+            "Wed, 21 Oct 2015 07:28:00 GMT"))
+        future = time.strftime("%a, %d %b %Y %H:%M:%S GMT",
+                               time.gmtime(time.time() + 100))
+        self.assertTrue(90 < retry.parse_retry_after(future) <= 100)
+
+
+class TestCircuitBreaker(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock(self, retry)
+        self.breaker = retry.CircuitBreaker(failure_threshold=2,
+                                            reset_timeout=30)
+
+    def _open(self):
+        self.breaker.record_failure()
+        self.breaker.record_failure()
+
+    def test_opens_after_threshold(self):
+        self.breaker.record_failure()
+        self.breaker.before_call("http://x")
+        self.breaker.record_failure()
+        self.assertRaises(exceptions.CircuitOpen,
+                          self.breaker.before_call, "http://x")
+
+    def test_success_resets_failures(self):
+        self.breaker.record_failure()
+        self.breaker.record_success()
+        self.breaker.record_failure()
+        self.breaker.before_call("http://x")
+
+    def test_single_trial_after_timeout(self):
+        self._open()
+        self.clock.now += 30
+        self.breaker.before_call("http://x")
+        # Only one trial call at a time
+        self.assertRaises(exceptions.CircuitOpen,
+                          self.breaker.before_call, "http://x")
+
+    def test_trial_success_closes(self):
+        self._open()
+        self.clock.now += 30
+        self.breaker.before_call("http://x")
+        self.breaker.record_success()
+        self.breaker.before_call("http://x")
+        self.breaker.before_call("http://x")
+
+    def test_trial_failure_reopens(self):
+        self._open()
+        self.clock.now += 30
+        self.breaker.before_call("http://x")
+        self.breaker.record_failure()
+        self.assertRaises(exceptions.CircuitOpen,
+                          self.breaker.before_call, "http://x")
+        self.clock.now += 30
+        self.breaker.before_call("http://x")
+
+    def test_breakers_per_endpoint(self):
+        breakers = retry.CircuitBreakers()
+        self.assertTrue(breakers.get("http://a:8787/compute/") is
+                        breakers.get("http://a:8787/-/"))
+        self.assertFalse(breakers.get("http://a:8787/") is
+                         breakers.get("http://a:8788/"))
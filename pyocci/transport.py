@@ -0,0 +1,161 @@
+# Copyright 2013 Spanish National Research Council (CSIC)
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""
+Transport adapter used by the OCCI client.
+"""
+
+import os
+import socket
+import ssl
+import threading
+
+from requests import adapters
+from requests import certs
+from requests import utils
+from requests.packages.urllib3 import connection
+from requests.packages.urllib3.util import ssl_
+
+DEFAULT_POOL_SIZE = 10
+
+
+def default_ca_bundle():
+    """Return the CA bundle that requests would use to verify servers."""
+    return (os.environ.get("REQUESTS_CA_BUNDLE") or
+            os.environ.get("CURL_CA_BUNDLE") or
+            certs.where())
+
+
+def create_ssl_context(cert=None, verify=True):
+    """Create an SSL context with the client certificate and the CAs.
+
+    cert is a file with the certificate, its key and its chain, like a VOMS
+    proxy. verify is True to verify the servers with the default CA
+    bundle, the path of a CA bundle (or of a directory with the CAs) or
+    False not to verify them.
+    """
+    if verify:
+        context = ssl_.create_urllib3_context(cert_reqs=ssl.CERT_REQUIRED)
+        if verify is True:
+            verify = default_ca_bundle()
+        if os.path.isdir(verify):
+            context.load_verify_locations(capath=verify)
+        else:
+            context.load_verify_locations(cafile=verify)
+    else:
+        context = ssl_.create_urllib3_context(cert_reqs=ssl.CERT_NONE)
+
+    if cert:
+        # This parses the whole chain of the proxy, so it is
+        # only done once per context instead of once per connection.
+        context.load_cert_chain(cert)
+    return context
+
+
+def keepalive_socket_options(idle):
+    """Socket options to send TCP keep-alive probes after idle seconds."""
+    options = list(connection.HTTPConnection.default_socket_options)
+    options.append((socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1))
+    if hasattr(socket, "TCP_KEEPIDLE"):
+        options.append((socket.IPPROTO_TCP, socket.TCP_KEEPIDLE, int(idle)))
+        options.append((socket.IPPROTO_TCP, socket.TCP_KEEPINTVL,
+                        max(1, int(idle) // 4)))
+    return options
+
+
+class OCCIAdapter(adapters.HTTPAdapter):
+    """Transport adapter sharing one SSL context among its connections.
+
+    The client certificate (cert) and the CAs (verify, see
+    create_ssl_context) are loaded once, the first time an HTTPS connection
+    is needed, instead of every time a connection is opened. They are loaded
+    again (closing the pooled connections) if the certificate file changes,
+    e.g. when a proxy is renewed. Up to pool_size connections per host are
+    kept open to be reused, and if keepalive is set TCP keep-alive probes are
+    sent on connections idle for keepalive seconds, so that firewalls do not
+    drop them.
+
+    The cert and verify arguments of the requests are ignored for HTTPS, as
+    they are already in the context.
+    """
+
+    def __init__(self, cert=None, verify=True, pool_size=DEFAULT_POOL_SIZE,
+                 keepalive=None, **kwargs):
+        self.cert = cert
+        self.verify = verify
+        self.keepalive = keepalive
+        self._ssl_context = None
+        self._cert_stamp = None
+        self._lock = threading.Lock()
+        kwargs.setdefault("pool_connections", pool_size)
+        kwargs.setdefault("pool_maxsize", pool_size)
+        super(OCCIAdapter, self).__init__(**kwargs)
+
+    def _stat_cert(self):
+        if not self.cert:
+            return None
+        try:
+            st = os.stat(self.cert)
+        except OSError:
+            return None
+        return (st.st_mtime, st.st_size)
+
+    @property
+    def ssl_context(self):
+        stamp = self._stat_cert()
+        with self._lock:
+            if self._ssl_context is None or stamp != self._cert_stamp:
+                self._ssl_context = create_ssl_context(self.cert, self.verify)
+                self._cert_stamp = stamp
+        return self._ssl_context
+
+    def init_poolmanager(self, connections, maxsize, block=False,
+                         **pool_kwargs):
+        if self.keepalive:
+            pool_kwargs["socket_options"] = keepalive_socket_options(
+                self.keepalive)
+        super(OCCIAdapter, self).init_poolmanager(connections, maxsize,
+                                                  block=block, **pool_kwargs)
+
+    def proxy_manager_for(self, proxy, **proxy_kwargs):
+        if self.keepalive:
+            proxy_kwargs.setdefault("socket_options",
+                                    keepalive_socket_options(self.keepalive))
+        return super(OCCIAdapter, self).proxy_manager_for(proxy,
+                                                          **proxy_kwargs)
+
+    def get_connection(self, url, proxies=None):
+        if url.lower().startswith("https"):
+            # The pools are created with the context, so it
+            # has to be there before the first HTTPS pool, and the pools
+            # with an old context (e.g. an expired proxy) are closed.
+            context = self.ssl_context
+            managers = [self.poolmanager]
+            proxy = utils.select_proxy(url, proxies)
+            if proxy:
+                managers.append(self.proxy_manager_for(proxy))
+            for manager in managers:
+                pool_kw = manager.connection_pool_kw
+                if pool_kw.get("ssl_context") is not context:
+                    if "ssl_context" in pool_kw:
+                        manager.clear()
+                    pool_kw["ssl_context"] = context
+        return super(OCCIAdapter, self).get_connection(url, proxies)
+
+    def cert_verify(self, conn, url, verify, cert):
+        if not url.lower().startswith("https"):
+            return
+        conn.cert_reqs = self.verify and "CERT_REQUIRED" or "CERT_NONE"
+        conn.ca_certs = conn.ca_cert_dir = None
+        conn.cert_file = conn.key_file = None
@@ -12,11 +12,10 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 
+import collections
 import os
 import sys
 
-import prettytable
-
 
 def arg(*args, **kwargs):
     """Decorator for CLI args."""
@@ -40,6 +39,16 @@ def add_arg(f, *args, **kwargs):
         f.arguments.insert(0, (args, kwargs))
 
 
+def multi_endpoint(func):
+    """Mark a shell.py `do_foo` function as able to use several endpoints.
+
+    It will get a client.MultiClient instead of a client if several
+    endpoints are given.
+    """
+    func.multi_endpoint = True
+    return func
+
+
 def env(*vars, **kwargs):
     """
     returns the first environment variable set
@@ -59,21 +68,94 @@ def import_class(import_str):
     return getattr(sys.modules[mod_str], class_str)
 
 
-def print_list(objs, fields, sortby=None):
-    pt = prettytable.PrettyTable([f for f in fields], caching=False)
-    pt.align = 'l'
+def map_concurrently(func, items, max_workers=1):
+    """Apply func to every item using a bounded pool of threads.
+
+    The results are returned in the same order as the items. If any call
+    raises an exception, the first one is re-raised.
+    """
+    items = list(items)
+    if max_workers <= 1 or len(items) <= 1:
+        return [func(item) for item in items]
 
-    for o in objs:
-        row = []
-        for field in fields:
-            row.append(o.get(field, None))
-        pt.add_row(row)
+    from multiprocessing import pool
 
-    result = pt.get_string(sortby=sortby)
-    print(result)
+    workers = pool.ThreadPool(min(max_workers, len(items)))
+    try:
+        return workers.map(func, items)
+    finally:
+        workers.close()
+        workers.join()
+
+
+def imap_concurrently(func, items, max_workers=1):
+    """Lazily apply func to items, using up to max_workers threads.
+
+    Like map_concurrently, but the results are yielded in the same order as
+    the items as soon as they are ready, and items can be any iterable
+    (e.g. a stream). Only a few items are read ahead of the results being
+    consumed, so the memory used does not depend on the amount of items.
+    """
+    if max_workers <= 1:
+        for item in items:
+            yield func(item)
+        return
+
+    from multiprocessing import pool
+
+    workers = pool.ThreadPool(max_workers)
+    pending = collections.deque()
+    try:
+        for item in items:
+            pending.append(workers.apply_async(func, (item,)))
+            if len(pending) >= 2 * max_workers:
+                yield pending.popleft().get()
+        while pending:
+            yield pending.popleft().get()
+    finally:
+        workers.close()
+        workers.join()
+
+
+BulkResult = collections.namedtuple("BulkResult", ["item", "result", "error"])
+
+
+def run_bulk(func, items, max_workers=1):
+    """Apply func to every item, collecting the results and failures.
+
+    Unlike map_concurrently, an exception does not abort the remaining
+    calls: a BulkResult(item, result, error) is returned for every item,
+    in the same order as the items, with error set to the exception raised
+    (or None if the call succeeded).
+    """
+    def _call(item):
+        try:
+            return BulkResult(item, func(item), None)
+        except Exception as e:
+            return BulkResult(item, None, e)
+
+    return map_concurrently(_call, items, max_workers=max_workers)
+
+
+def print_list(objs, fields, sortby=None, output_format="table"):
+    from pyocci import formatters
+
+    rows = ([o.get(field, None) for field in fields] for o in objs)
+    if sortby is not None:
+        rows = sorted(rows, key=lambda row: row[fields.index(sortby)])
+    formatters.write_rows(output_format, fields, rows)
+
+
+def print_dict(d, dict_property="Property", dict_value="Value", wrap=0,
+               output_format="table"):
+    if output_format != "table":
+        from pyocci import formatters
+
+        formatters.write_dict(output_format, d, (dict_property, dict_value))
+        return
 
+    import prettytable
 
-def print_dict(d, dict_property="Property", dict_value="Value", wrap=0):
     pt = prettytable.PrettyTable([dict_property, dict_value], caching=False)
     pt.align = 'l'
     for k, v in sorted(d.items()):
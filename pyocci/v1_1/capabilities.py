@@ -12,7 +12,81 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 
+import collections
+import urlparse
+
 from pyocci import client
+from pyocci import occi
+from pyocci.v1_1 import resources
+
+
+def _location_path(location):
+    return urlparse.urlparse(location).path or location
+
+
+class CapabilityRegistry(object):
+    """Index of the categories (kinds, mixins and actions) of an endpoint.
+
+    The categories can be looked up by their type identifier (scheme and
+    term), by their location and by the categories they are related to
+    (e.g. all the os_tpl mixins) in constant time.
+    """
+
+    def __init__(self, categories):
+        self.categories = []
+        self._by_id = {}
+        self._by_location = {}
+        self._by_related = {}
+        self._by_scheme = collections.OrderedDict()
+
+        for raw in categories:
+            category = resources.Category(raw)
+            self.categories.append(category)
+            self._by_id.setdefault(category.type_id, category)
+            self._by_scheme.setdefault(category.scheme, []).append(category)
+            if category.location:
+                self._by_location.setdefault(
+                    _location_path(category.location), category)
+            for related in category.related:
+                self._by_related.setdefault(related, []).append(category)
+
+    def __iter__(self):
+        return iter(self.categories)
+
+    def __len__(self):
+        return len(self.categories)
+
+    def __contains__(self, type_id):
+        return type_id in self._by_id
+
+    def get(self, scheme, term=None):
+        """Get a category by its type identifier, or its scheme and term."""
+        if term is not None:
+            scheme = scheme + term
+        return self._by_id.get(scheme, None)
+
+    def by_location(self, location):
+        """Get the category with the given location (a path or URL)."""
+        return self._by_location.get(_location_path(location), None)
+
+    def by_scheme(self, scheme):
+        return self._by_scheme.get(scheme, [])
+
+    @property
+    def schemes(self):
+        return list(self._by_scheme)
+
+    def related_to(self, type_id):
+        """Get the categories related to the given one."""
+        return self._by_related.get(type_id, [])
+
+    @property
+    def images(self):
+        return self.related_to(occi.CATEGORIES["image"])
+
+    @property
+    def flavors(self):
+        return self.related_to(occi.CATEGORIES["flavor"])
 
 
 class CapabilitiesManager(client.Manager):
@@ -21,3 +95,11 @@ class CapabilitiesManager(client.Manager):
         Get a list of capabilities
         """
         return self._list("/-/")
+
+    def registry(self, categories=None):
+        """
+        Get a CapabilityRegistry with the capabilities (or categories)
+        """
+        if categories is None:
+            categories = self.list()
+        return CapabilityRegistry(categories)
@@ -19,8 +19,20 @@ from pyocci.v1_1 import instances
 
 class Client(object):
     def __init__(self, *args, **kwargs):
+        async_ = kwargs.pop("async_", False)
+        async_pool = kwargs.pop("async_pool", None)
+
         self.capabilities = capabilities.CapabilitiesManager(self)
         self.instances = instances.InstancesManager(self)
 
+        if async_:
+            # A connection for each thread that may use the client
+            if async_pool is None:
+                kwargs.setdefault("concurrency", client.ASYNC_POOL_SIZE)
+            self.capabilities = client.AsyncManager(self.capabilities,
+                                                    async_pool=async_pool)
+            self.instances = client.AsyncManager(self.instances,
+                                                 async_pool=async_pool)
+
         # NOTE(aloga):  we need to pop used arguments
         self.client = client.HTTPClient(*args, **kwargs)
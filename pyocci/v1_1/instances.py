@@ -13,13 +13,399 @@
 # under the License.
 
 from pyocci import client
+from pyocci import exceptions
+from pyocci import occi
+from pyocci import parsers
+from pyocci import utils
+from pyocci.v1_1 import poller
+from pyocci.v1_1 import resources
+
+# Ask for the locations only, but accept the other renderings from servers
+# that do not support text/uri-list.
+IDS_ONLY_ACCEPT = "%s,%s;q=0.5,%s;q=0.4,%s;q=0.3" % (
+    parsers.URI_LIST, parsers.OCCI_JSON, parsers.TEXT_OCCI, parsers.TEXT_PLAIN)
+
+
+def _get_id(resource):
+    """Get the OCCI ID from a resource or from its location."""
+    if isinstance(resource, basestring):
+        return resource.rstrip("/").rsplit("/", 1)[-1]
+    return resource.get("attributes", {}).get("occi.core.id", None)
+
+
+def _render_mixin(mixin):
+    """Render a mixin given as a category or as its type identifier."""
+    if isinstance(mixin, basestring):
+        scheme, sep, term = mixin.rpartition("#")
+        return occi.render_category(scheme + sep, term, "mixin")
+    return occi.render_category(mixin["scheme"], mixin["term"], "mixin")
+
+
+# Short names of the attributes that can be used in the filters
+FILTER_ALIASES = {
+    "id": "occi.core.id",
+    "name": "occi.core.title",
+    "title": "occi.core.title",
+    "hostname": "occi.compute.hostname",
+    "state": "occi.compute.state",
+}
+
+
+# Filters matching the mixin of an instance with the given role
+MIXIN_FILTERS = ("image", "flavor")
+
+
+def _has_category(instance, value, role=None):
+    categories = [instance.kind] + instance.mixins
+    if role is not None and getattr(instance, role) is not None:
+        # Any mixin may be it if it cannot be told apart from the rest
+        categories = [getattr(instance, role)]
+    for category in categories:
+        if value in (category.type_id, category.term):
+            return True
+    return False
+
+
+def compile_filters(filters):
+    """Compile filters into a predicate for instances.
+
+    filters is a dict (or a list of pairs) of attribute names (or their
+    FILTER_ALIASES) and the values they must have. "category" (or "mixin")
+    matches the type identifier or term of the kind or of any mixin, and
+    "image" and "flavor" the ones of the os_tpl and resource_tpl mixins, so
+    e.g. {"image": "image-3", "state": "active"} matches the active
+    instances of the image-3 os_tpl.
+
+    The predicate returns True or False, or None if the instance does not
+    have the attributes nor categories to check it (e.g. it comes from a
+    listing with only locations), in which case its details are needed.
+    """
+    if hasattr(filters, "items"):
+        filters = filters.items()
+
+    attributes = []
+    categories = []
+    for name, value in filters:
+        if name in ("category", "mixin"):
+            categories.append((None, unicode(value)))
+        elif name in MIXIN_FILTERS:
+            categories.append((name, unicode(value)))
+        else:
+            attributes.append((FILTER_ALIASES.get(name, name),
+                               unicode(value)))
+
+    def predicate(instance):
+        attrs = instance.attributes
+        # Resources without a kind come from partial
+        # renderings, so a missing attribute does not mean a mismatch.
+        partial = not instance.kind.term
+        for name, value in attributes:
+            if name not in attrs:
+                if partial:
+                    return None
+                return False
+            if unicode(attrs[name]) != value:
+                return False
+        for role, value in categories:
+            if partial:
+                return None
+            if not _has_category(instance, value, role):
+                return False
+        return True
+
+    return predicate
+
+
+def _filter_headers(filters):
+    """Render filters as OCCI collection filtering headers."""
+    if hasattr(filters, "items"):
+        filters = filters.items()
+
+    headers = {}
+    categories = []
+    attributes = {}
+    for name, value in filters:
+        if name in ("category", "mixin") + MIXIN_FILTERS:
+            # Bare terms can only be checked by us
+            if "#" in value:
+                categories.append(_render_mixin(value))
+        else:
+            attributes[FILTER_ALIASES.get(name, name)] = value
+    if categories:
+        headers["Category"] = ", ".join(categories)
+    if attributes:
+        headers["X-OCCI-Attribute"] = occi.render_attributes(attributes)
+    return headers
+
+
+def _as_resource(resource):
+    """Wrap a resource, or a location from a text rendering, in a Compute."""
+    if isinstance(resource, basestring):
+        resource = {
+            "location": resource,
+            "attributes": {"occi.core.id": _get_id(resource)},
+        }
+    return resources.Compute(resource)
 
 
 class InstancesManager(client.Manager):
-    def list(self):
-        """Get a list of running instances."""
-        return self._list("/compute/")
+    def __init__(self, api):
+        super(InstancesManager, self).__init__(api)
+        # Shared by all the waiters, see watch()
+        self.poller = poller.StatePoller(self)
+
+    def list(self, stream=False, ids_only=False, filters=None,
+             max_workers=10):
+        """Get a list of running instances.
+
+        If stream is True, return an iterator that decodes the instances
+        one at a time while the collection is being read. If ids_only is
+        True, only the OCCI IDs of the instances are returned, requesting
+        the (much smaller) text/uri-list rendering.
+
+        filters (see compile_filters) are sent to the server as OCCI
+        collection filters, and also checked on the listing as it is read,
+        as servers may not support them. The details of the instances are
+        only requested (max_workers at a time) if the listing does not
+        include what is needed to check them.
+        """
+        if filters:
+            return self._filtered_list(stream, ids_only, filters,
+                                       max_workers)
+
+        if not ids_only:
+            # The text renderings only contain the locations
+            instances = (_as_resource(i)
+                         for i in self._list("/compute/", stream=stream) or [])
+            if stream:
+                return instances
+            return list(instances)
+
+        instances = self._list("/compute/", stream=stream,
+                               accept=IDS_ONLY_ACCEPT)
+        ids = (_get_id(i) for i in instances)
+        if stream:
+            return ids
+        return list(ids)
+
+    def _filtered_list(self, stream, ids_only, filters, max_workers):
+        predicate = compile_filters(filters)
+
+        def _check(instance):
+            matches = predicate(instance)
+            if matches is None and instance.id:
+                instance = self.detail(instance.id)
+                matches = predicate(instance)
+            return instance if matches else None
+
+        # The uri-list rendering cannot be checked, so the
+        # full one is always requested.
+        listing = self._list("/compute/", stream=True,
+                             headers=_filter_headers(filters))
+        checked = utils.imap_concurrently(
+            _check, (_as_resource(i) for i in listing or []),
+            max_workers=max_workers)
+        instances = (i for i in checked if i is not None)
+        if ids_only:
+            instances = (i.id for i in instances)
+        if stream:
+            return instances
+        return list(instances)
 
     def detail(self, instance):
         """Get details of an instance."""
-        return self._get("/compute/%s" % instance)
+        return resources.Compute(self._get("/compute/%s" % instance) or {})
+
+    def detail_if_modified(self, instance, etag=None):
+        """Get details of an instance, unless it did not change.
+
+        Returns the instance and its ETag. If etag is given and the server
+        answers that the instance was not modified, the instance is None.
+        """
+        headers = {}
+        if etag:
+            headers["If-None-Match"] = etag
+        resp, body = self.api.client.get("/compute/%s" % instance,
+                                         headers=headers)
+        if resp.status_code == 304:
+            return None, etag
+        return resources.Compute(body or {}), resp.headers.get("etag", None)
+
+    def create(self, name=None, image=None, flavor=None, attributes=None):
+        """Create an instance.
+
+        image and flavor are the os_tpl and resource_tpl mixins to use,
+        either as categories (e.g. from the capabilities) or as their type
+        identifiers ("<scheme>#<term>"). Returns the new, partial, instance.
+        """
+        categories = [occi.render_category(occi.COMPUTE_KIND[0],
+                                           occi.COMPUTE_KIND[1],
+                                           "kind")]
+        categories.extend(_render_mixin(m) for m in (image, flavor) if m)
+
+        attributes = dict(attributes or {})
+        if name is not None:
+            attributes["occi.core.title"] = name
+
+        headers = {
+            "Content-Type": parsers.TEXT_OCCI,
+            "Category": ", ".join(categories),
+        }
+        if attributes:
+            headers["X-OCCI-Attribute"] = occi.render_attributes(attributes)
+
+        return _as_resource(self._create("/compute/", headers))
+
+    def delete(self, instance):
+        """Delete an instance."""
+        self._delete("/compute/%s" % instance)
+
+    def action(self, instance, action):
+        """Trigger an action (start, stop, restart...) on an instance."""
+        headers = {
+            "Content-Type": parsers.TEXT_OCCI,
+            "Category": occi.render_category(occi.COMPUTE_ACTION_SCHEME,
+                                             action, "action"),
+        }
+        return self._action("/compute/%s?action=%s" % (instance, action),
+                            headers)
+
+    def create_many(self, instances, max_workers=10):
+        """Create several instances in parallel.
+
+        instances is a list of dicts with the arguments of create(). Every
+        creation is attempted, and a list of utils.BulkResult is returned.
+        """
+        return utils.run_bulk(lambda kwargs: self.create(**kwargs),
+                              instances, max_workers=max_workers)
+
+    def delete_many(self, instances, max_workers=10):
+        """Delete several instances in parallel.
+
+        Every deletion is attempted, and a list of utils.BulkResult is
+        returned.
+        """
+        return utils.run_bulk(self.delete, instances,
+                              max_workers=max_workers)
+
+    def action_many(self, instances, action, max_workers=10):
+        """Trigger an action on several instances in parallel.
+
+        Every action is attempted, and a list of utils.BulkResult is
+        returned.
+        """
+        return utils.run_bulk(lambda i: self.action(i, action), instances,
+                              max_workers=max_workers)
+
+    def details(self, instances, max_workers=10):
+        """Get details of several instances in parallel.
+
+        At most max_workers requests are performed at the same time, all of
+        them through the same HTTP session. The details are returned in the
+        same order as the given instances.
+        """
+        return utils.map_concurrently(self.detail, instances,
+                                      max_workers=max_workers)
+
+    def refresh_inventory(self, inventory, max_workers=10):
+        """Refresh the instances of the endpoint in an inventory.
+
+        inventory is an inventory.Inventory. Instances whose listing does
+        not include their details are only requested if they are new, if
+        they have an ETag (with a conditional request, so that only the
+        changed ones are sent) or if the listing shows a state different
+        from the stored one. Other known instances are kept as stored, as
+        there is no way to tell if they changed without getting all of
+        them. Instances that no longer exist are removed. Returns the amount
+        of new, updated, unchanged and deleted instances.
+        """
+        endpoint = self.api.client.endpoint_url
+        etags = inventory.etags(endpoint)
+        states = inventory.states(endpoint)
+
+        ids = set()
+        updated = []
+        pending = []
+        for instance in self.list(stream=True):
+            if instance.id is None:
+                continue
+            ids.add(instance.id)
+            if instance.state is not None and instance.hostname is not None:
+                updated.append((instance, None))
+            elif instance.id not in etags or etags[instance.id]:
+                pending.append(instance.id)
+            elif (instance.state is not None and
+                    instance.state != states.get(instance.id)):
+                pending.append(instance.id)
+
+        results = utils.run_bulk(
+            lambda i: self.detail_if_modified(i, etags.get(i, None)),
+            pending, max_workers=max_workers)
+        for result in results:
+            if isinstance(result.error, exceptions.NotFound):
+                # Deleted while refreshing
+                ids.discard(result.item)
+            elif result.error is not None:
+                raise result.error
+            elif result.result[0] is not None:
+                updated.append(result.result)
+
+        # The listed resources are stored only if they differ from the
+        # stored ones
+        changed = inventory.update(endpoint, updated, ids)
+        new = len(ids.difference(etags))
+        return {
+            "new": new,
+            "updated": len(changed) - new,
+            "unchanged": len(ids) - len(changed),
+            "deleted": len(set(etags).difference(ids)),
+        }
+
+    def watch(self, instances, timeout=None):
+        """Yield the state transitions of several instances.
+
+        Transitions are (id, previous state, state) tuples, starting with
+        the current state of every instance (with None as previous state).
+        Instances that do not exist have the poller.DELETED state. All the
+        watches and waits on this manager share the same polling (see
+        poller.StatePoller, available as self.poller). Stops after timeout
+        seconds, if given.
+        """
+        return self.poller.watch(instances, timeout=timeout)
+
+    def wait_for(self, instances, state, timeout=None):
+        """Wait until all the instances reach a state.
+
+        state is a state or a list of states (poller.DELETED to wait for the
+        deletion). Returns a dict with the state of every instance, raising
+        exceptions.WaitTimeout if they do not reach it in timeout seconds,
+        or exceptions.NotFound if any instance is deleted meanwhile.
+        """
+        if isinstance(state, basestring):
+            state = [state]
+        state = set(state)
+
+        pending = set(instances)
+        states = {}
+        if not pending:
+            return states
+        transitions = self.watch(pending, timeout=timeout)
+        try:
+            for instance, _previous, current in transitions:
+                states[instance] = current
+                if current == poller.DELETED and current not in state:
+                    raise exceptions.NotFound(
+                        404, "Instance %s was deleted" % instance)
+                elif current in state:
+                    pending.discard(instance)
+                else:
+                    pending.add(instance)
+                if not pending:
+                    return states
+        finally:
+            # Stop watching now, even if an exception is being raised
+            transitions.close()
+
+        raise exceptions.WaitTimeout(
+            "Timed out waiting for %d instance(s) to reach %s" %
+            (len(pending), ", ".join(sorted(state))))
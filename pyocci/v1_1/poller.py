@@ -0,0 +1,198 @@
+# Copyright 2013 Spanish National Research Council (CSIC)
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+
+"""
+Polling of the state of the instances, shared by all the waiters.
+"""
+
+import Queue
+import threading
+import time
+
+from pyocci import exceptions
+from pyocci import utils
+
+# Pseudo state of the instances that do not exist (anymore)
+DELETED = "deleted"
+
+
+class StatePoller(object):
+    """Poll the state of instances on behalf of several waiters.
+
+    A single background thread polls all the instances that are being
+    watched, so that the requests are shared by all the waiters. Every tick
+    either gets the collection (if its rendering includes the state of the
+    instances and at least collection_threshold instances are watched) or
+    the details of the watched instances, max_workers at a time. Conditional
+    requests are used if the client has a response cache.
+
+    The interval between ticks starts at min_interval, is multiplied by
+    backoff after every tick without changes (or with errors) up to
+    max_interval, and starts over when any instance changes its state.
+    """
+
+    def __init__(self, manager, min_interval=2, max_interval=30, backoff=1.5,
+                 max_workers=10, collection_threshold=5):
+        self.manager = manager
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.max_workers = max_workers
+        self.collection_threshold = collection_threshold
+
+        # Whether the collection includes the state of the instances, None
+        # if we do not know yet.
+        self.listing_has_state = None
+        self.states = {}
+        self._subscriptions = []
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+
+    def _poll_collection(self, ids):
+        states = {}
+        for instance in self.manager.list():
+            if instance.id is None:
+                continue
+            if instance.state is None:
+                self.listing_has_state = False
+                return None
+            states[instance.id] = instance.state
+        self.listing_has_state = True
+        return dict((i, states.get(i, DELETED)) for i in ids)
+
+    def _poll_details(self, ids):
+        states = {}
+        failed = False
+        for result in utils.run_bulk(self.manager.detail, ids,
+                                     max_workers=self.max_workers):
+            if result.error is None:
+                states[result.item] = result.result.state
+            elif isinstance(result.error, exceptions.NotFound):
+                states[result.item] = DELETED
+            else:
+                failed = True
+        return states, failed
+
+    def poll(self, ids):
+        """Get the state of the instances, returning {id: state}.
+
+        Instances whose state could not be retrieved are not included.
+        """
+        states = None
+        if (self.listing_has_state is not False and
+                len(ids) >= self.collection_threshold):
+            try:
+                states = self._poll_collection(ids)
+            except exceptions.ClientException:
+                return {}
+        if states is None:
+            states, _failed = self._poll_details(ids)
+        return states
+
+    def _tick(self):
+        with self._lock:
+            ids = set(i for sub in self._subscriptions for i in sub.ids)
+        if not ids:
+            return None
+
+        states = self.poll(sorted(ids))
+        changed = False
+        with self._lock:
+            for instance_id, state in states.items():
+                previous = self.states.get(instance_id)
+                if previous == state:
+                    continue
+                changed = True
+                self.states[instance_id] = state
+                for sub in self._subscriptions:
+                    if instance_id in sub.ids:
+                        sub.put((instance_id, previous, state))
+        return changed
+
+    def _run(self):
+        interval = self.min_interval
+        while True:
+            self._wakeup.clear()
+            try:
+                changed = self._tick()
+            except Exception:
+                changed = False
+            with self._lock:
+                if not self._subscriptions:
+                    self._thread = None
+                    return
+
+            if changed:
+                interval = self.min_interval
+            else:
+                interval = min(interval * self.backoff, self.max_interval)
+            # New waiters wake us up, so that they do not wait for the
+            # next tick to get the current state.
+            self._wakeup.wait(interval)
+
+    def subscribe(self, ids):
+        """Start watching ids, returning a Queue of state transitions.
+
+        Transitions are (id, previous state, state) tuples; the first one of
+        every instance has None as its previous state.
+        """
+        sub = Queue.Queue()
+        sub.ids = frozenset(ids)
+        with self._lock:
+            self._subscriptions.append(sub)
+            for instance_id in sub.ids:
+                if instance_id in self.states:
+                    sub.put((instance_id, None, self.states[instance_id]))
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run)
+                self._thread.daemon = True
+                self._thread.start()
+        self._wakeup.set()
+        return sub
+
+    def unsubscribe(self, sub):
+        with self._lock:
+            self._subscriptions.remove(sub)
+            watched = set(i for s in self._subscriptions for i in s.ids)
+            for instance_id in sub.ids - watched:
+                self.states.pop(instance_id, None)
+
+    def watch(self, ids, timeout=None):
+        """Yield the state transitions of the instances.
+
+        Stops after timeout seconds, if given, or at once if there are no
+        instances.
+        """
+        if not ids:
+            return
+        deadline = timeout is not None and time.time() + timeout
+        sub = self.subscribe(ids)
+        try:
+            while True:
+                if deadline:
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        return
+                else:
+                    # A timeout is needed so that the wait can
+                    # be interrupted with Ctrl-C.
+                    remaining = 3600
+                try:
+                    yield sub.get(timeout=remaining)
+                except Queue.Empty:
+                    pass
+        finally:
+            self.unsubscribe(sub)
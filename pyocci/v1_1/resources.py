@@ -0,0 +1,223 @@
+# Copyright 2013 Spanish National Research Council (CSIC)
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""
+Resources returned by the managers.
+
+They wrap the decoded rendering of an OCCI entity (that is still available
+through the dict interface, e.g. resource["attributes"]) and expose the most
+used values as properties, computed only when first accessed.
+"""
+
+from pyocci import occi
+
+
+class lazy_property(object):
+    """A property computed once and stored in the "_<name>" slot."""
+
+    def __init__(self, func):
+        self.func = func
+        self.slot = "_" + func.__name__
+        self.__doc__ = func.__doc__
+
+    def __get__(self, obj, cls):
+        if obj is None:
+            return self
+        try:
+            return getattr(obj, self.slot)
+        except AttributeError:
+            value = self.func(obj)
+            setattr(obj, self.slot, value)
+            return value
+
+
+class Category(object):
+    """An OCCI category (kind, mixin or action)."""
+
+    __slots__ = ("raw",)
+
+    def __init__(self, raw):
+        self.raw = raw
+
+    def __getitem__(self, key):
+        return self.raw[key]
+
+    def __contains__(self, key):
+        return key in self.raw
+
+    def get(self, key, default=None):
+        return self.raw.get(key, default)
+
+    def __repr__(self):
+        return "<%s %s>" % (self.__class__.__name__, self.type_id)
+
+    @property
+    def scheme(self):
+        return self.raw.get("scheme", None)
+
+    @property
+    def term(self):
+        return self.raw.get("term", None)
+
+    @property
+    def title(self):
+        return self.raw.get("title", None)
+
+    @property
+    def location(self):
+        return self.raw.get("location", None)
+
+    @property
+    def related(self):
+        return self.raw.get("related", [])
+
+    @property
+    def type_id(self):
+        return "%s%s" % (self.scheme or "", self.term or "")
+
+
+class Mixin(Category):
+    __slots__ = ()
+
+
+class Resource(object):
+    """An OCCI entity."""
+
+    __slots__ = ("raw", "site", "_kind", "_mixins", "_links")
+
+    def __init__(self, raw, site=None):
+        self.raw = raw
+        # The endpoint the resource comes from, when using several of them
+        self.site = site
+
+    def __getitem__(self, key):
+        return self.raw[key]
+
+    def __contains__(self, key):
+        return key in self.raw
+
+    def get(self, key, default=None):
+        return self.raw.get(key, default)
+
+    def __repr__(self):
+        return "<%s %s>" % (self.__class__.__name__, self.id)
+
+    @property
+    def attributes(self):
+        return self.raw.get("attributes", {})
+
+    @property
+    def id(self):
+        return self.attributes.get("occi.core.id", None)
+
+    @property
+    def title(self):
+        return self.attributes.get("occi.core.title", None)
+
+    @property
+    def location(self):
+        return self.raw.get("location", None)
+
+    @lazy_property
+    def kind(self):
+        return Category(self.raw.get("kind", None) or {})
+
+    @lazy_property
+    def mixins(self):
+        return [Mixin(m) for m in self.raw.get("mixins", [])]
+
+    @lazy_property
+    def links(self):
+        return [Link(link) for link in self.raw.get("links", [])]
+
+    def find_mixin(self, related, registry=None):
+        """Return the first mixin related to the given category.
+
+        Renderings do not always include the categories a mixin is related
+        to. If a registry (see capabilities.CapabilityRegistry) is given, the
+        mixins are also looked up in it, returning the category found there.
+        """
+        for mixin in self.mixins:
+            if related in mixin.related:
+                return mixin
+
+        if registry is not None:
+            for mixin in self.mixins:
+                category = registry.get(mixin.type_id)
+                if category is not None and related in category.related:
+                    return category
+        return None
+
+
+class Link(Resource):
+    """An OCCI link, e.g. a network interface."""
+
+    __slots__ = ()
+
+    @property
+    def target(self):
+        return self.raw.get("target", None)
+
+    @property
+    def is_network(self):
+        return occi.CATEGORIES["network"] in self.kind.related
+
+    @property
+    def address(self):
+        """The IPv4 address of a network interface (or else the IPv6)."""
+        attrs = self.attributes
+        return (attrs.get("occi.networkinterface.address", None) or
+                attrs.get("occi.networkinterface.ip6", None))
+
+    @property
+    def mac(self):
+        return self.attributes.get("occi.networkinterface.mac", None)
+
+
+class Compute(Resource):
+    """An OCCI compute resource, i.e. an instance."""
+
+    __slots__ = ("_network_links", "_image", "_flavor")
+
+    @property
+    def state(self):
+        return self.attributes.get("occi.compute.state", None)
+
+    @property
+    def hostname(self):
+        return self.attributes.get("occi.compute.hostname", None)
+
+    @property
+    def name(self):
+        """The title of the instance, or its hostname if it has none."""
+        name = self.title
+        if name is None:
+            name = self.hostname
+        return name
+
+    @lazy_property
+    def network_links(self):
+        return [link for link in self.links if link.is_network]
+
+    @property
+    def addresses(self):
+        return [link.address for link in self.network_links]
+
+    @lazy_property
+    def image(self):
+        return self.find_mixin(occi.CATEGORIES["image"])
+
+    @lazy_property
+    def flavor(self):
+        return self.find_mixin(occi.CATEGORIES["flavor"])
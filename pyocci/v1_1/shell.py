@@ -12,80 +12,224 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 
-import prettytable
+from __future__ import print_function
+import sys
+import time
 
 from pyocci import exceptions
+from pyocci import formatters
 from pyocci import occi
 from pyocci import utils
 
 
+def _is_multi(cs):
+    # Imported here so that loading the shell commands (e.g.
+    # for --help) does not import the client.
+    from pyocci import client
+
+    return isinstance(cs, client.MultiClient)
+
+
+def _warn_failed_sites(cs):
+    """Report the endpoints of a MultiClient that failed."""
+    for site, error in sorted(cs.errors.items()):
+        print("WARNING: %s: %s" % (site, error), file=sys.stderr)
+    if cs.errors and len(cs.errors) == len(cs.clients):
+        raise exceptions.CommandError("All the endpoints failed")
+
+
+@utils.multi_endpoint
 def do_capabilities(cs, args):
     """Print a list of the service capabilities."""
-    caps = cs.capabilities.list()
     fields = ["scheme", "location", "term", "title"]
+    if not _is_multi(cs) and args.output_format == "table":
+        # The registry of the manager is reused, as the agent
+        # keeps it cached with the capabilities.
+        registry = cs.capabilities.registry()
+    else:
+        caps = cs.capabilities.list()
+        if _is_multi(cs):
+            fields.insert(0, "site")
+            _warn_failed_sites(cs)
+
+        if args.output_format != "table":
+            utils.print_list(caps, fields, output_format=args.output_format)
+            return
+
+        from pyocci.v1_1 import capabilities
+
+        # The categories of all the sites, tagged with their site
+        registry = capabilities.CapabilityRegistry(caps)
+
+    for scheme in registry.schemes:
+        utils.print_list(registry.by_scheme(scheme), fields)
+
+
+def _parse_filters(filters):
+    """Parse the attr=value filters given in the command line."""
+    parsed = []
+    for f in filters or []:
+        name, sep, value = f.partition("=")
+        if not (sep and name):
+            raise exceptions.CommandError("Invalid filter '%s', must be "
+                                          "attr=value" % f)
+        parsed.append((name.strip(), value.strip()))
+    return parsed
 
-    schemes = {i["scheme"] for i in caps}
 
-    print schemes
-    for scheme in schemes:
-        aux = [i for i in caps if scheme == i["scheme"]]
-        utils.print_list(aux, fields)
+def _instance_rows(cs, args, filters):
+    """Get the rows of instance-list from a single endpoint."""
+    if not args.detailed:
+        # Only the IDs are shown, so there is no need to get the resources
+        for i in cs.instances.list(stream=True, ids_only=True,
+                                   filters=filters,
+                                   max_workers=args.concurrency):
+            yield [i]
+        return
+
+    occi_attrs = ("occi.compute.hostname",
+                  "occi.compute.state")
+
+    def _complete(instance):
+        # Fetch the details of the instances whose listing does not
+        # include them
+        attrs = instance.attributes
+        if instance.id and not all([i in attrs for i in occi_attrs]):
+            return cs.instances.detail(instance.id)
+        return instance
+
+    # The rows are yielded in the original order as soon as
+    # they are ready, while the listing is still being read.
+    listing = cs.instances.list(stream=True, filters=filters,
+                                max_workers=args.concurrency)
+    instances = utils.imap_concurrently(_complete, listing,
+                                        max_workers=args.concurrency)
+    for instance in instances:
+        if instance.id:
+            yield [instance.id, instance.name, instance.state,
+                   instance.addresses]
+        else:
+            yield [instance.id, None, None, None]
+
+
+def _cached_instance_rows(cs, args, inv, filters):
+    """Get the rows of instance-list from the inventory of an endpoint."""
+    from pyocci import inventory
+    from pyocci.v1_1 import instances
+    from pyocci.v1_1 import resources
+
+    # The indexed columns are filtered by the inventory, and
+    # the rest of the filters are checked on the stored resources.
+    columns = {}
+    others = []
+    for name, value in filters:
+        attr = instances.FILTER_ALIASES.get(name, name)
+        column = attr.rsplit(".", 1)[-1]
+        if name in instances.MIXIN_FILTERS:
+            # Only the term is stored, so type identifiers are checked too
+            scheme, _sep, columns[name] = value.rpartition("#")
+            if scheme:
+                others.append((name, value))
+        elif (attr in instances.FILTER_ALIASES.values() and
+                column in inventory.QUERY_COLUMNS):
+            columns[column] = value
+        else:
+            others.append((name, value))
+    predicate = instances.compile_filters(others)
+
+    endpoint = cs.client.endpoint_url
+    refreshed = inv.refreshed(endpoint)
+    if refreshed is None or (args.max_age is not None and
+                             time.time() - refreshed > args.max_age):
+        cs.instances.refresh_inventory(inv, max_workers=args.concurrency)
+
+    for instance in inv.query([endpoint], state_for=args.state_for,
+                              **columns):
+        if others and not predicate(resources.Compute(instance["resource"])):
+            continue
+        if args.detailed:
+            yield [instance["id"], instance["name"], instance["state"],
+                   instance["addresses"]]
+        else:
+            yield [instance["id"]]
 
 
 @utils.arg('--detailed',
            dest='detailed',
            action='store_true',
            help='Get a detailed listing of the running instances')
+@utils.arg('--filter',
+           metavar='<attr=value>',
+           dest='filters',
+           action='append',
+           default=[],
+           help='Only list the instances with this attribute value (can be '
+                'repeated). Attributes can be given by their OCCI name or as '
+                'id, name, hostname or state. category matches a kind or '
+                'mixin by type identifier or term, and image and flavor the '
+                'os_tpl and resource_tpl mixins')
+@utils.arg('--cached',
+           action='store_true',
+           help='List the instances from the local inventory (see '
+                '--inventory-file), refreshing it first if it is older than '
+                '--max-age')
+@utils.arg('--max-age',
+           metavar='<seconds>',
+           type=float,
+           default=None,
+           help='Maximum age of the inventory when using --cached (default: '
+                'only refresh endpoints that were never refreshed)')
+@utils.arg('--state-for',
+           metavar='<seconds>',
+           type=float,
+           default=None,
+           help='Only list the instances that have been in their current '
+                'state for at least this time, according to the inventory '
+                '(requires --cached)')
+@utils.arg('--concurrency',
+           metavar='<N>',
+           type=int,
+           default=10,
+           help='Number of instance details to fetch in parallel when '
+                'using --detailed or refreshing the inventory (default: 10)')
+@utils.multi_endpoint
 def do_instance_list(cs, args):
     """Print a list of the running instances."""
-    instances = cs.instances.list()
-
     fields = ["OCCI ID"]
     if args.detailed:
         fields.extend(["Name", "State", "Network"])
-        occi_attrs = ("occi.compute.hostname",
-                      "occi.compute.state")
+    filters = _parse_filters(args.filters)
+    if args.state_for is not None and not args.cached:
+        raise exceptions.CommandError("--state-for requires --cached")
 
-    pt = prettytable.PrettyTable([f for f in fields], caching=False)
-    pt.align = 'l'
+    inv = None
+    if args.cached:
+        from pyocci import inventory
 
-    for instance in instances:
-        row = []
-        attrs = instance.get('attributes', {})
-        instance_id = attrs.get('occi.core.id', None)
-        row.append(instance_id)
-
-        if args.detailed and instance_id:
-            if not all([i in attrs for i in occi_attrs]):
-                instance = cs.instances.detail(instance_id)
-                attrs = instance.get('attributes', {})
-
-            name = attrs.get("occi.core.title", None)
-            if name is None:
-                name = attrs.get("occi.compute.hostname", None)
-            row.append(name)
-            row.append(attrs.get("occi.compute.state", None))
-
-            links = instance.get("links", [])
-            network = []
-            for link in links:
-                if occi.CATEGORIES["network"] in link["kind"]["related"]:
-                    # get IPv4
-                    ip = link["attributes"].get(
-                        "occi.networkinterface.address",
-                        None
-                    )
-                    if not ip:
-                        ip = link["attributes"].get(
-                            "occi.networkinterface.ip6",
-                            None
-                        )
-                    network.append(ip)
-            row.append(network)
-
-        pt.add_row(row)
-
-    print(pt.get_string())
+        inv = inventory.Inventory(args.inventory_file)
+
+        def get_rows(site_cs):
+            return _cached_instance_rows(site_cs, args, inv, filters)
+    else:
+        def get_rows(site_cs):
+            return _instance_rows(site_cs, args, filters)
+
+    try:
+        if _is_multi(cs):
+            fields.insert(0, "Site")
+            rows = []
+            results = cs.map(lambda site_cs: list(get_rows(site_cs)))
+            for result in results:
+                rows.extend([result.item] + row
+                            for row in result.result or [])
+            _warn_failed_sites(cs)
+        else:
+            rows = get_rows(cs)
+
+        formatters.write_rows(args.output_format, fields, rows)
+    finally:
+        if inv is not None:
+            inv.close()
 
 
 @utils.arg('instance',
@@ -99,35 +243,164 @@ def do_instance_show(cs, args):
         e.message = msg
         raise
 
-    _print_server_details(instance)
+    registry = None
+    if instance.mixins and (instance.image is None or
+                            instance.flavor is None):
+        # The rendering does not tell which mixins are the
+        # image and flavor, so look them up in the capabilities.
+        registry = cs.capabilities.registry()
+
+    _print_server_details(instance, args.output_format, registry)
+
+
+def _read_ids(ids):
+    """Return the given IDs, or read them from stdin if there are none."""
+    if ids and ids != ["-"]:
+        return ids
+    return [line.strip() for line in sys.stdin
+            if line.strip() and not line.startswith("#")]
+
+
+def _print_bulk_results(results, output_format):
+    failed = 0
+    with formatters.get_formatter(output_format,
+                                  ["OCCI ID", "Result"]) as formatter:
+        for result in results:
+            if result.error is None:
+                formatter.write([result.item, "OK"])
+            else:
+                failed += 1
+                formatter.write([result.item, "ERROR: %s" % result.error])
+
+    if failed:
+        raise exceptions.CommandError("%d of %d operations failed" %
+                                      (failed, len(results)))
+
+
+@utils.arg('instances',
+           metavar='<instance>',
+           nargs='*',
+           help='Instance OCCI IDs. If none (or "-") is given, they are '
+                'read from stdin, one per line')
+@utils.arg('--concurrency',
+           metavar='<N>',
+           type=int,
+           default=10,
+           help='Number of instances to delete in parallel (default: 10)')
+def do_instance_delete(cs, args):
+    """Delete one or more instances."""
+    ids = _read_ids(args.instances)
+    _print_bulk_results(cs.instances.delete_many(
+        ids, max_workers=args.concurrency), args.output_format)
+
+
+@utils.arg('action',
+           metavar='<action>',
+           choices=occi.COMPUTE_ACTIONS,
+           help='Action to perform, one of: %s' %
+                ', '.join(occi.COMPUTE_ACTIONS))
+@utils.arg('instances',
+           metavar='<instance>',
+           nargs='*',
+           help='Instance OCCI IDs. If none (or "-") is given, they are '
+                'read from stdin, one per line')
+@utils.arg('--concurrency',
+           metavar='<N>',
+           type=int,
+           default=10,
+           help='Number of actions to perform in parallel (default: 10)')
+def do_instance_action(cs, args):
+    """Start, stop, restart or suspend one or more instances."""
+    ids = _read_ids(args.instances)
+    _print_bulk_results(cs.instances.action_many(
+        ids, args.action, max_workers=args.concurrency), args.output_format)
+
+
+@utils.arg('instances',
+           metavar='<instance>',
+           nargs='*',
+           help='Instance OCCI IDs. If none (or "-") is given, they are '
+                'read from stdin, one per line')
+@utils.arg('--state',
+           metavar='<state>',
+           action='append',
+           default=None,
+           help='Exit once all the instances are in this state (it can be '
+                'given several times to accept any of them, use "deleted" '
+                'to wait for their deletion). If not given, watch until '
+                'the --watch-timeout or Ctrl-C')
+@utils.arg('--watch-timeout',
+           metavar='<seconds>',
+           dest='watch_timeout',
+           type=float,
+           default=None,
+           help='Stop watching after this amount of seconds')
+@utils.arg('--interval',
+           metavar='<seconds>',
+           type=float,
+           default=2,
+           help='Minimum interval between polls. It grows while nothing '
+                'changes (default: 2)')
+@utils.arg('--max-interval',
+           metavar='<seconds>',
+           type=float,
+           default=30,
+           help='Maximum interval between polls (default: 30)')
+def do_instance_watch(cs, args):
+    """Watch the state of one or more instances, printing its changes."""
+    from pyocci import cache
+
+    ids = _read_ids(args.instances)
+    if not ids:
+        raise exceptions.CommandError("No instances to watch")
+    if cs.client.response_cache is None:
+        # Use conditional requests, if the server supports them
+        cs.client.response_cache = cache.ResponseCache()
+    cs.instances.poller.min_interval = args.interval
+    cs.instances.poller.max_interval = args.max_interval
+
+    states = set(args.state or [])
+    pending = set(ids)
+    fields = ["Time", "OCCI ID", "Previous", "State"]
+    with formatters.get_formatter(args.output_format, fields,
+                                  widths=[19, 36, 10, 10]) as formatter:
+        try:
+            for instance, previous, current in cs.instances.watch(
+                    ids, timeout=args.watch_timeout):
+                formatter.write([time.strftime("%Y-%m-%d %H:%M:%S"),
+                                 instance, previous, current])
+                sys.stdout.flush()
+                if current in states:
+                    pending.discard(instance)
+                else:
+                    pending.add(instance)
+                if states and not pending:
+                    return
+        except KeyboardInterrupt:
+            if not states:
+                return
+            raise exceptions.CommandError(
+                "Interrupted while waiting for %d instance(s) to reach %s" %
+                (len(pending), ", ".join(sorted(states))))
 
+    if states:
+        raise exceptions.CommandError(
+            "Timed out waiting for %d instance(s) to reach %s" %
+            (len(pending), ", ".join(sorted(states))))
 
-def _print_server_details(instance):
 
-    d = instance["attributes"].copy()
+def _print_server_details(instance, output_format="table", registry=None):
 
-    for mixin in instance.get("mixins", []):
-        mmap = {
-            "image": occi.CATEGORIES["image"],
-            "flavor": occi.CATEGORIES["flavor"],
-        }
-        for k, url in mmap.iteritems():
-            if url in mixin.get("related", []):
-                d["%s name" % k] = mixin.get("title", None)
-                d["%s id" % k] = mixin.get("term", None)
-                d["%s scheme" % k] = mixin.get("scheme", None)
-                continue
+    d = instance.attributes.copy()
 
-    d["network"] = []
-    for link in instance.get("links", []):
-        if occi.CATEGORIES["network"] in link["kind"].get("related", []):
-            mac = link["attributes"]["occi.networkinterface.mac"]
-            address = link["attributes"].get("occi.networkinterface.address",
-                                             None)
-            if not address:
-                address = link["attributes"].get("occi.networkinterface.ip6",
-                                                 None)
+    for k in ("image", "flavor"):
+        mixin = instance.find_mixin(occi.CATEGORIES[k], registry)
+        if mixin is not None:
+            d["%s name" % k] = mixin.title
+            d["%s id" % k] = mixin.term
+            d["%s scheme" % k] = mixin.scheme
 
-            d["network"].append("%s (%s)" % (address, mac))
+    d["network"] = ["%s (%s)" % (link.address, link.mac)
+                    for link in instance.network_links]
 
-    utils.print_dict(d)
+    utils.print_dict(d, output_format=output_format)